@@ -3,56 +3,87 @@
 import os
 import io
 import re
+import logging
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, Response, send_file
+from flask import Flask, Blueprint, request, jsonify, Response, send_file, stream_with_context, current_app, g
 from flask_cors import CORS
 from sqlalchemy import or_
 import bcrypt
 import jwt
 from dotenv import load_dotenv
-from groq import Groq
-from elevenlabs import ElevenLabs
 from functools import wraps
 from flask import send_from_directory
-from validation import validate_email, validate_username, validate_password
-from models import db, User, TherapySession, TherapyMessage, ContactUs
 
-print("🔥 RUNNING UPDATED app.py FILE (Pro System) 🔥")
-
-# Load environment variables
+# Load environment variables before the local modules below read their settings
 load_dotenv()
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app)
-
-# Database Configuration
-db_uri = os.getenv('SQLALCHEMY_DATABASE_URI')
-if db_uri and db_uri.startswith("postgres://"):
-    db_uri = db_uri.replace("postgres://", "postgresql://", 1)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-
-# Initialize Extensions
-db.init_app(app)
-
-# Initialize API clients
-groq_client = Groq(api_key=os.getenv('GROQ_API_KEY'))
-ELEVENLABS_API_KEY = os.getenv("ELEVEN_API_KEY")
-
-if not ELEVENLABS_API_KEY:
-    raise RuntimeError("ELEVENLABS_API_KEY is not set")
-
-elevenlabs_client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
-
-# JWT Secret
-JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
+from validation import validate_email, validate_username, validate_password
+from models import db, User, TherapySession, TherapyMessage, ContactUs
+from clients import get_elevenlabs_client
+from emotions import (
+    seed_emotions, canonical_label, known_emotion_code, record_emotion, emotion_label,
+    emotion_totals, wellness_score as compute_wellness_score, mood_trend,
+)
+from export import iter_history, ndjson_lines, csv_lines, encode_chunks
+from search import enqueue_index, search_messages
+from memory import retrieve_memories, format_memories
+from ratelimit import rate_limit
+from idempotency import idempotent
+from routing import choose_model, complete
+from conversations import recall, remember, trim
+from metrics import init_metrics, timed_upstream, query_budget, inc
+from fastjson import json_response
+from cache import user_cached, invalidate_user
+from scheduler import init_scheduler
+from deletion import init_deletion, delete_sessions, delete_history
+from profiling import init_profiling
+from applog import init_logging
+from auth_tokens import JWT_SECRET, access_token, issue_refresh_token, rotate, revoke, RefreshRejected
+from telemetry import TELEMETRY_BUCKET_SECONDS, parse_batch, downsample, store_buckets, mood_timeline
+import jobs  # noqa: F401  (registers scheduled jobs)
+from transcripts import session_dict, transcript_messages, serve_transcript, store_transcript, invalidate_transcript
+
+log = logging.getLogger('puresoul.app')
+api = Blueprint('api', __name__)
+
+
+def create_app(config=None):
+    """Build the Flask app. Cheap and side-effect free: no network, no DDL.
+
+    Upstream clients are created on first use (see clients.py) and tables
+    are only created through `flask --app app init-db`.
+    """
+    app = Flask(__name__)
+    CORS(app)
+
+    # Database Configuration
+    db_uri = os.getenv('SQLALCHEMY_DATABASE_URI')
+    if db_uri and db_uri.startswith("postgres://"):
+        db_uri = db_uri.replace("postgres://", "postgresql://", 1)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config:
+        app.config.update(config)
+
+    # Initialize Extensions
+    db.init_app(app)
+    app.register_blueprint(api)
+    init_logging(app)
+    init_metrics(app)
+    init_profiling(app)
+    init_scheduler(app)
+    init_deletion(app)
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Create any missing tables."""
+        db.create_all()
+        seed_emotions()
+        print("✅ Database tables created.")
+
+    return app
 
-# Create tables within app context
-with app.app_context():
-    db.create_all()
 
 # ============== AUTH DECORATORS ==============
 
@@ -73,6 +104,7 @@ def token_required(f):
             current_user = User.query.filter_by(id=data['id']).first()
             if not current_user:
                 return jsonify({'message': 'User not found!'}), 401
+            g.user_id = current_user.id  # for profiles and logs
         except Exception as e:
             return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
 
@@ -99,6 +131,7 @@ def pro_required(f):
             current_user = User.query.filter_by(id=data['id']).first()
             if not current_user:
                 return jsonify({'message': 'User not found!'}), 401
+            g.user_id = current_user.id  # for profiles and logs
         except Exception as e:
             return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
 
@@ -113,10 +146,70 @@ def pro_required(f):
     return decorated
 
 
+# ============== QUERY HELPERS ==============
+
+def _message_counts(user_id, session_ids=None):
+    """Helper: {session_id: message_count} for a user's sessions in one grouped query."""
+    query = db.session.query(
+        TherapyMessage.session_id, db.func.count(TherapyMessage.id)
+    ).join(TherapySession, TherapySession.id == TherapyMessage.session_id).filter(
+        TherapySession.user_id == user_id
+    )
+    if session_ids is not None:
+        if not session_ids:
+            return {}
+        query = query.filter(TherapyMessage.session_id.in_(session_ids))
+    return dict(query.group_by(TherapyMessage.session_id).all())
+
+
+def _message_previews(session_ids, per_session=5):
+    """Helper: first `per_session` messages of each session, in one windowed query."""
+    if not session_ids:
+        return {}
+    rn = db.func.row_number().over(
+        partition_by=TherapyMessage.session_id,
+        order_by=(TherapyMessage.created_at.asc(), TherapyMessage.id.asc())
+    ).label('rn')
+    ranked = db.session.query(
+        TherapyMessage.id, TherapyMessage.session_id, TherapyMessage.sender,
+        TherapyMessage.message_text, TherapyMessage.emotion_code, TherapyMessage.created_at, rn
+    ).filter(TherapyMessage.session_id.in_(session_ids)).subquery()
+
+    previews = {}
+    for m in db.session.query(ranked).filter(ranked.c.rn <= per_session).order_by(ranked.c.session_id, ranked.c.rn):
+        previews.setdefault(m.session_id, []).append({
+            'id': m.id,
+            'sender': m.sender,
+            'message_text': m.message_text,
+            'emotion_detected': emotion_label(m.emotion_code),
+            'created_at': m.created_at,
+        })
+    return previews
+
+
+SESSION_COLUMNS = (
+    TherapySession.id, TherapySession.user_id, TherapySession.session_title,
+    TherapySession.started_at, TherapySession.ended_at, TherapySession.is_active,
+)
+
+
+def _session_rows(user_id, limit=None, session_id=None):
+    """Helper: a user's sessions as plain row tuples (newest first), no ORM objects."""
+    stmt = db.select(*SESSION_COLUMNS).where(TherapySession.user_id == user_id)
+    if session_id is not None:
+        stmt = stmt.where(TherapySession.id == session_id)
+    stmt = stmt.order_by(TherapySession.started_at.desc())
+    if limit:
+        stmt = stmt.limit(limit)
+    return db.session.execute(stmt).all()
+
+
 # ============== API ROUTES ==============
 
-@app.route('/api/dashboard', methods=['GET'])
+@api.route('/api/dashboard', methods=['GET'])
+@query_budget(4)
 @token_required
+@user_cached('dashboard', ttl=60)
 def get_dashboard(current_user):
     """Return aggregated analytics data for the Dashboard page."""
     try:
@@ -125,13 +218,12 @@ def get_dashboard(current_user):
         total_sessions = len(sessions)
 
         # Message stats
-        total_messages = 0
+        message_counts = _message_counts(current_user.id)
+        total_messages = sum(message_counts.values())
         session_durations = []
         category_counts = {}
         for s in sessions:
-            msgs = TherapyMessage.query.filter_by(session_id=s.id).all()
-            msg_count = len(msgs)
-            total_messages += msg_count
+            msg_count = message_counts.get(s.id, 0)
 
             # Duration in minutes
             if s.started_at and s.ended_at:
@@ -158,30 +250,15 @@ def get_dashboard(current_user):
             if total_sessions > 0 else 0
         )
 
-        # Emotion breakdown from emotion_detected field in messages
-        emotion_counts = {}
-        session_ids = [s.id for s in sessions]
-        if session_ids:
-            all_messages = TherapyMessage.query.filter(
-                TherapyMessage.session_id.in_(session_ids),
-                TherapyMessage.emotion_detected.isnot(None)
-            ).all()
-            for m in all_messages:
-                e = m.emotion_detected.lower()
-                emotion_counts[e] = emotion_counts.get(e, 0) + 1
+        # Emotion breakdown from the daily mood rollups
+        emotion_counts = emotion_totals(current_user.id)
 
         emotion_distribution = [
             {'name': k, 'value': v} for k, v in emotion_counts.items()
         ]
 
         # Wellness score: ratio of positive/neutral messages
-        positive = emotion_counts.get('happy', 0)
-        neutral = emotion_counts.get('neutral', 0) + emotion_counts.get('surprised', 0)
-        total_emotions = sum(emotion_counts.values())
-        wellness_score = (
-            round(((positive * 2 + neutral) / (total_emotions * 2)) * 100)
-            if total_emotions > 0 else 0
-        )
+        wellness_score = compute_wellness_score(emotion_counts)
 
         most_frequent_emotion = (
             max(emotion_counts, key=emotion_counts.get)
@@ -202,11 +279,11 @@ def get_dashboard(current_user):
             'category_counts': category_counts,
         }), 200
 
-    except Exception as e:
-        print(f"Dashboard error: {e}")
+    except Exception:
+        log.exception("Dashboard error")
         return jsonify({'message': 'Server error fetching dashboard data.'}), 500
 
-@app.route('/api/admin/migrate', methods=['GET'])
+@api.route('/api/admin/migrate', methods=['GET'])
 def run_migration():
     """Temporary endpoint to fix DB schema in production (PostgreSQL/MySQL compatible)."""
     try:
@@ -229,29 +306,42 @@ def run_migration():
         message_columns = [c['name'] for c in inspector.get_columns('therapy_messages')]
         if 'emotion_detected' not in message_columns:
             db.session.execute(text("ALTER TABLE therapy_messages ADD COLUMN emotion_detected VARCHAR(50)"))
+        if 'model' not in message_columns:
+            db.session.execute(text("ALTER TABLE therapy_messages ADD COLUMN model VARCHAR(50)"))
+        if 'latency_ms' not in message_columns:
+            db.session.execute(text("ALTER TABLE therapy_messages ADD COLUMN latency_ms INTEGER"))
+
+        # 4. Indexes used by set-based deletes (MySQL already indexes foreign keys)
+        indexes = {
+            'therapy_messages': ('ix_therapy_messages_session_id', 'session_id'),
+            'search_postings': ('ix_search_postings_message_id', 'message_id'),
+        }
+        for table, (name, column) in indexes.items():
+            if table in inspector.get_table_names() and \
+                    name not in [i['name'] for i in inspector.get_indexes(table)]:
+                db.session.execute(text(f"CREATE INDEX {name} ON {table} ({column})"))
 
         db.session.commit()
         return jsonify({'message': 'Migration successful for PostgreSQL/MySQL!'}), 200
     except Exception as e:
         db.session.rollback()
-        print(f"Migration error: {e}")
+        log.exception("Migration error")
         return jsonify({'message': f'Migration failed: {str(e)}'}), 500
 
-@app.route('/api/mood-history', methods=['GET'])
+@api.route('/api/mood-history', methods=['GET'])
+@query_budget(4)
 @token_required
 def get_mood_history(current_user):
     """Return session history with messages for the Mood History page."""
     try:
-        sessions = TherapySession.query.filter_by(
-            user_id=current_user.id
-        ).order_by(TherapySession.started_at.desc()).limit(20).all()
+        sessions = _session_rows(current_user.id, limit=20)
+
+        session_ids = [s.id for s in sessions]
+        message_counts = _message_counts(current_user.id, session_ids)
+        previews = _message_previews(session_ids, per_session=5)
 
         history = []
         for s in sessions:
-            msgs = TherapyMessage.query.filter_by(
-                session_id=s.id
-            ).order_by(TherapyMessage.created_at.asc()).all()
-
             if s.started_at and s.ended_at:
                 dur = max(0, int((s.ended_at - s.started_at).total_seconds() / 60))
             else:
@@ -264,34 +354,75 @@ def get_mood_history(current_user):
                 'id': s.id,
                 'session_title': s.session_title,
                 'category': category,
-                'started_at': s.started_at.isoformat() if s.started_at else None,
-                'ended_at': s.ended_at.isoformat() if s.ended_at else None,
+                'started_at': s.started_at,
+                'ended_at': s.ended_at,
                 'duration': dur,
                 'is_active': s.is_active,
-                'message_count': len(msgs),
-                'messages': [
-                    {
-                        'id': m.id,
-                        'sender': m.sender,
-                        'message_text': m.message_text,
-                        'emotion_detected': m.emotion_detected,
-                        'created_at': m.created_at.isoformat() if m.created_at else None,
-                    }
-                    for m in msgs[:5]  # preview first 5 messages
-                ],
+                'message_count': message_counts.get(s.id, 0),
+                'messages': previews.get(s.id, []),  # preview first 5 messages
             })
 
-        return jsonify({
+        return json_response({
             'sessions': history,
             'total': len(history),
             'is_pro': current_user.is_pro,
-        }), 200
+        })
 
-    except Exception as e:
-        print(f"Mood history error: {e}")
+    except Exception:
+        log.exception("Mood history error")
         return jsonify({'message': 'Server error fetching mood history.'}), 500
 
-@app.route('/', methods=['GET'])
+@api.route('/api/mood-trend', methods=['GET'])
+@query_budget(2)
+@token_required
+def get_mood_trend(current_user):
+    """Return emotion counts bucketed by day, week or month for trend charts."""
+    period = request.args.get('period', 'day')
+    if period not in ('day', 'week', 'month'):
+        return jsonify({'message': "period must be 'day', 'week' or 'month'."}), 400
+
+    try:
+        days = int(request.args.get('days', 90))
+    except ValueError:
+        return jsonify({'message': 'days must be an integer.'}), 400
+
+    try:
+        since = (datetime.utcnow() - timedelta(days=days)).date() if days > 0 else None
+        return jsonify({
+            'period': period,
+            'buckets': mood_trend(current_user.id, period=period, since=since),
+        }), 200
+
+    except Exception:
+        log.exception("Mood trend error")
+        return jsonify({'message': 'Server error fetching mood trend.'}), 500
+
+@api.route('/api/export', methods=['GET'])
+@token_required
+def export_history(current_user):
+    """Stream the user's full session/message history as NDJSON or CSV."""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'message': "format must be 'ndjson' or 'csv'."}), 400
+
+    use_gzip = request.accept_encodings['gzip'] > 0  # quality; q=0 refuses gzip
+    lines = ndjson_lines if fmt == 'ndjson' else csv_lines
+    body = encode_chunks(lines(iter_history(current_user.id)), use_gzip=use_gzip)
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="puresoul-{current_user.username}.{fmt}"',
+        'Vary': 'Accept-Encoding',
+    }
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(
+        stream_with_context(body),
+        mimetype='application/x-ndjson' if fmt == 'ndjson' else 'text/csv',
+        headers=headers,
+    )
+
+@api.route('/', methods=['GET'])
 def index():
     return jsonify({
         'status': 'online',
@@ -299,17 +430,24 @@ def index():
         'endpoints': [
             '/api/register',
             '/api/login',
+            '/api/token/refresh',
+            '/api/logout',
             '/api/get-response',
             '/api/text-to-speech',
             '/api/session/create',
             '/api/pro/sessions',
             '/api/pro/session/<session_id>',
             '/api/pro/upgrade',
+            '/api/mood-trend',
+            '/api/export',
+            '/api/pro/search',
+            '/api/telemetry/emotions',
         ]
     }), 200
 
 
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
+@rate_limit('register')
 def register():
     """User registration endpoint."""
     try:
@@ -355,13 +493,14 @@ def register():
             'credits': 12
         }), 201
 
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Registration error: {e}")
+        log.exception("Registration error")
         return jsonify({'message': 'Server error during registration.'}), 500
 
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
+@rate_limit('login')
 def login():
     """User login endpoint."""
     try:
@@ -379,29 +518,60 @@ def login():
         if not bcrypt.checkpw(password.encode('utf-8'), user.password.encode('utf-8')):
             return jsonify({'message': 'Invalid credentials.'}), 400
 
-        token = jwt.encode(
-            {
-                'id': user.id,
-                'username': user.username,
-                'exp': datetime.utcnow() + timedelta(hours=24)
-            },
-            JWT_SECRET,
-            algorithm='HS256'
-        )
-
         return jsonify({
-            'token': token,
+            'token': access_token(user),
+            'refresh_token': issue_refresh_token(user.id),
             'username': user.username,
             'credits': user.credits,
             'user': user.to_dict()
         }), 200
 
-    except Exception as e:
-        print(f"Login error: {e}")
+    except Exception:
+        db.session.rollback()
+        log.exception("Login error")
         return jsonify({'message': 'Server error during login.'}), 500
 
 
-@app.route('/api/credits', methods=['GET'])
+@api.route('/api/token/refresh', methods=['POST'])
+@rate_limit('refresh')
+def refresh_token():
+    """Swap a refresh token for a new access token and the next refresh token (no password check)."""
+    data = request.get_json(silent=True) or {}
+    try:
+        user_id, new_refresh_token = rotate(data.get('refresh_token'))
+        user = db.session.get(User, user_id)
+        if not user:
+            return jsonify({'message': 'User not found!'}), 401
+
+        return jsonify({
+            'token': access_token(user),
+            'refresh_token': new_refresh_token,
+        }), 200
+
+    except RefreshRejected as e:
+        return jsonify({'message': 'Refresh token is invalid. Please login again.', 'reason': e.reason}), 401
+    except Exception:
+        db.session.rollback()
+        log.exception("Token refresh error")
+        return jsonify({'message': 'Server error refreshing token.'}), 500
+
+
+@api.route('/api/logout', methods=['POST'])
+def logout():
+    """Revoke the refresh token (and every token rotated from the same login)."""
+    data = request.get_json(silent=True) or {}
+    try:
+        revoke(data.get('refresh_token'))
+        return jsonify({'message': 'Logged out.'}), 200
+
+    except Exception:
+        db.session.rollback()
+        log.exception("Logout error")
+        return jsonify({'message': 'Server error during logout.'}), 500
+
+
+@api.route('/api/credits', methods=['GET'])
+@query_budget(1)
 @token_required
 def get_credits(current_user):
     """Fetch user's current credits."""
@@ -413,7 +583,71 @@ def get_credits(current_user):
     }), 200
 
 
-@app.route('/api/credits/use', methods=['POST'])
+BOOTSTRAP_SECTIONS = ('credits', 'active_session', 'sessions', 'dashboard')
+
+
+@api.route('/api/bootstrap', methods=['GET'])
+@query_budget(4)
+@token_required
+@user_cached('bootstrap', ttl=60, params=('include',))
+def bootstrap(current_user):
+    """Everything the app shell needs after login in one round trip.
+
+    ?include=credits,active_session,sessions,dashboard (default: all). At most
+    four queries whatever the user's history: user, sessions, message counts,
+    mood rollups.
+    """
+    include = [x.strip() for x in request.args.get('include', ','.join(BOOTSTRAP_SECTIONS)).split(',') if x.strip()]
+    unknown = [x for x in include if x not in BOOTSTRAP_SECTIONS]
+    if unknown:
+        return jsonify({'message': f"Unknown section(s): {', '.join(unknown)}"}), 400
+
+    try:
+        payload = {}
+        if 'credits' in include:
+            payload['credits'] = {
+                'username': current_user.username,
+                'credits': current_user.credits,
+                'total_credits_purchased': current_user.total_credits_purchased,
+                'is_pro': current_user.is_pro,
+            }
+
+        sessions = _session_rows(current_user.id) if set(include) - {'credits'} else []
+        message_counts = _message_counts(current_user.id) if {'sessions', 'dashboard'} & set(include) else {}
+
+        if 'active_session' in include:
+            active = next((s for s in sessions if s.is_active), None)
+            payload['active_session'] = session_dict(active) if active else None
+
+        if 'sessions' in include:
+            payload['sessions'] = [
+                dict(session_dict(s), message_count=message_counts.get(s.id, 0)) for s in sessions[:20]
+            ]
+
+        if 'dashboard' in include:
+            durations = [
+                max(0, int((s.ended_at - s.started_at).total_seconds() / 60)) if s.started_at and s.ended_at else 0
+                for s in sessions
+            ]
+            emotion_counts = emotion_totals(current_user.id)
+            payload['dashboard'] = {
+                'total_sessions': len(sessions),
+                'total_messages': sum(message_counts.values()),
+                'avg_session_duration': round(sum(durations) / len(durations)) if durations else 0,
+                'wellness_score': compute_wellness_score(emotion_counts),
+                'most_frequent_emotion': (
+                    max(emotion_counts, key=emotion_counts.get) if emotion_counts else 'N/A'
+                ),
+            }
+
+        return json_response(payload)
+
+    except Exception:
+        log.exception("Bootstrap error")
+        return jsonify({'message': 'Server error loading app data.'}), 500
+
+
+@api.route('/api/credits/use', methods=['POST'])
 @token_required
 def use_credit(current_user):
     """Deduct exactly 1 credit."""
@@ -426,6 +660,7 @@ def use_credit(current_user):
 
     current_user.credits -= 1
     db.session.commit()
+    invalidate_user(current_user.id)
 
     return jsonify({
         'success': True,
@@ -435,7 +670,7 @@ def use_credit(current_user):
     }), 200
 
 
-@app.route('/api/contact', methods=['POST'])
+@api.route('/api/contact', methods=['POST'])
 def receive_contact():
     """Store incoming contact messages in the database."""
     try:
@@ -455,13 +690,13 @@ def receive_contact():
 
         return jsonify({'message': 'Contact saved. Thank you!'}), 201
 
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Contact endpoint error: {e}")
+        log.exception("Contact endpoint error")
         return jsonify({'message': 'Server error saving contact.'}), 500
 
 
-@app.route('/api/credits/buy', methods=['POST'])
+@api.route('/api/credits/buy', methods=['POST'])
 @token_required
 def buy_credits_v2(current_user):
     """Add purchased credits."""
@@ -474,6 +709,7 @@ def buy_credits_v2(current_user):
     current_user.credits += amount
     current_user.total_credits_purchased += amount
     db.session.commit()
+    invalidate_user(current_user.id)
 
     return jsonify({
         'message': f'Successfully purchased {amount} credits!',
@@ -484,7 +720,7 @@ def buy_credits_v2(current_user):
 
 # ============== PRO UPGRADE ==============
 
-@app.route('/api/pro/upgrade', methods=['POST'])
+@api.route('/api/pro/upgrade', methods=['POST'])
 @token_required
 def upgrade_to_pro(current_user):
     """Upgrade a user to Pro status (in production, validate payment here)."""
@@ -500,19 +736,20 @@ def upgrade_to_pro(current_user):
         current_user.total_credits_purchased += amount
         
         db.session.commit()
+        invalidate_user(current_user.id)
         return jsonify({
             'message': f'Successfully upgraded to {plan.upper()}!',
             'user': current_user.to_dict()
         }), 200
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Upgrade error: {e}")
+        log.exception("Upgrade error")
         return jsonify({'message': 'Server error during upgrade.'}), 500
 
 
 # ============== SESSION MANAGEMENT (PRO ONLY) ==============
 
-@app.route('/api/session/create', methods=['POST'])
+@api.route('/api/session/create', methods=['POST'])
 @token_required
 def create_session(current_user):
     """
@@ -537,6 +774,7 @@ def create_session(current_user):
         )
         db.session.add(new_session)
         db.session.commit()
+        invalidate_user(current_user.id)
 
         return jsonify({
             'session_id': new_session.id,
@@ -544,13 +782,13 @@ def create_session(current_user):
             'session': new_session.to_dict()
         }), 201
 
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Session create error: {e}")
+        log.exception("Session create error")
         return jsonify({'message': 'Server error creating session.'}), 500
 
 
-@app.route('/api/session/<int:session_id>/end', methods=['POST'])
+@api.route('/api/session/<int:session_id>/end', methods=['POST'])
 @token_required
 def end_session(current_user, session_id):
     """Mark a session as ended."""
@@ -565,75 +803,180 @@ def end_session(current_user, session_id):
         session.is_active = False
         session.ended_at = datetime.utcnow()
         db.session.commit()
+        invalidate_user(current_user.id)
+
+        try:
+            store_transcript(session)
+        except Exception:  # rendered on first view instead
+            db.session.rollback()
+            log.exception("Transcript render error")
 
         return jsonify({'message': 'Session ended.'}), 200
 
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Session end error: {e}")
+        log.exception("Session end error")
         return jsonify({'message': 'Server error ending session.'}), 500
 
 
-@app.route('/api/pro/sessions', methods=['GET'])
+@api.route('/api/session/<int:session_id>', methods=['DELETE'])
+@token_required
+def delete_session(current_user, session_id):
+    """Delete one of the user's sessions with its messages and derived data."""
+    session = TherapySession.query.filter_by(
+        id=session_id, user_id=current_user.id
+    ).first()
+    if not session:
+        return jsonify({'message': 'Session not found.'}), 404
+
+    try:
+        stats = delete_sessions([(session.id, current_user.id)])
+        return jsonify({'message': 'Session deleted.', 'deleted': dict(stats)}), 200
+
+    except Exception:
+        db.session.rollback()
+        log.exception("Session delete error")
+        return jsonify({'message': 'Server error deleting session.'}), 500
+
+
+@api.route('/api/history', methods=['DELETE'])
+@token_required
+def delete_user_history(current_user):
+    """Delete all of the user's sessions and messages. The account stays."""
+    try:
+        stats = delete_history(current_user.id)
+        return jsonify({'message': 'History deleted.', 'deleted': dict(stats)}), 200
+
+    except Exception:
+        db.session.rollback()
+        log.exception("History delete error")
+        return jsonify({'message': 'Server error deleting history.'}), 500
+
+@api.route('/api/telemetry/emotions', methods=['POST'])
+@token_required
+@rate_limit('telemetry')
+def ingest_emotions(current_user):
+    """Accept a batch of camera emotion readings and merge them into time buckets."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Expected a JSON object.'}), 400
+    session_id = data.get('session_id')
+    if not isinstance(session_id, int) or isinstance(session_id, bool):
+        return jsonify({'message': 'session_id must be an integer.'}), 400
+    session = TherapySession.query.filter_by(id=session_id, user_id=current_user.id).first()
+    if not session:
+        return jsonify({'message': 'Session not found.'}), 404
+
+    try:
+        readings = parse_batch(data)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    try:
+        buckets = downsample(readings)
+        store_buckets(session.id, buckets)
+        db.session.commit()
+        inc('puresoul_telemetry_readings_total', {}, len(readings))
+        return jsonify({'accepted': len(readings), 'buckets': len(buckets)}), 200
+
+    except Exception:
+        db.session.rollback()
+        log.exception("Telemetry ingest error")
+        return jsonify({'message': 'Server error storing telemetry.'}), 500
+
+
+@api.route('/api/session/<int:session_id>/mood-timeline', methods=['GET'])
+@query_budget(3)
+@token_required
+def get_mood_timeline(current_user, session_id):
+    """Downsampled camera emotions for one of the user's sessions."""
+    session = TherapySession.query.filter_by(
+        id=session_id, user_id=current_user.id
+    ).first()
+    if not session:
+        return jsonify({'message': 'Session not found.'}), 404
+
+    try:
+        return json_response({
+            'session_id': session_id,
+            'bucket_seconds': TELEMETRY_BUCKET_SECONDS,
+            'timeline': mood_timeline(session_id),
+        })
+
+    except Exception:
+        log.exception("Mood timeline error")
+        return jsonify({'message': 'Server error fetching mood timeline.'}), 500
+
+
+@api.route('/api/pro/sessions', methods=['GET'])
+@query_budget(3)
 @pro_required
+@user_cached('pro-sessions', ttl=60)
 def get_pro_sessions(current_user):
     """Fetch all therapy sessions for the authenticated Pro user."""
     try:
-        sessions = TherapySession.query.filter_by(
-            user_id=current_user.id
-        ).order_by(TherapySession.started_at.desc()).all()
+        sessions = _session_rows(current_user.id)
+        message_counts = _message_counts(current_user.id)
 
         sessions_data = []
         for s in sessions:
-            d = s.to_dict()
-            # Convert datetimes to ISO strings for JSON serialization
-            d['started_at'] = s.started_at.isoformat() if s.started_at else None
-            d['ended_at'] = s.ended_at.isoformat() if s.ended_at else None
+            d = session_dict(s)
             # Include message count for sidebar display
-            d['message_count'] = TherapyMessage.query.filter_by(session_id=s.id).count()
+            d['message_count'] = message_counts.get(s.id, 0)
             sessions_data.append(d)
 
-        return jsonify({'sessions': sessions_data}), 200
+        return json_response({'sessions': sessions_data})
 
-    except Exception as e:
-        print(f"Fetch sessions error: {e}")
+    except Exception:
+        log.exception("Fetch sessions error")
         return jsonify({'message': 'Server error fetching sessions.'}), 500
 
 
-@app.route('/api/pro/session/<int:session_id>', methods=['GET'])
+@api.route('/api/pro/session/<int:session_id>', methods=['GET'])
+@query_budget(8)  # 3 when served from session_transcripts; 8 when rendering it on first view
 @pro_required
 def get_session_messages(current_user, session_id):
     """Fetch all messages for a specific session (Pro only, owner only)."""
     try:
-        session = TherapySession.query.filter_by(
-            id=session_id, user_id=current_user.id
-        ).first()
+        rows = _session_rows(current_user.id, session_id=session_id)
 
-        if not session:
+        if not rows:
             return jsonify({'message': 'Session not found or access denied.'}), 404
 
-        messages = TherapyMessage.query.filter_by(
-            session_id=session_id
-        ).order_by(TherapyMessage.created_at.asc()).all()
+        if not rows[0].is_active:
+            return serve_transcript(rows[0])
 
-        messages_data = []
-        for m in messages:
-            d = m.to_dict()
-            d['created_at'] = m.created_at.isoformat() if m.created_at else None
-            messages_data.append(d)
+        return json_response({
+            'session': session_dict(rows[0]),
+            'messages': transcript_messages(session_id),
+        })
 
-        session_data = session.to_dict()
-        session_data['started_at'] = session.started_at.isoformat() if session.started_at else None
-        session_data['ended_at'] = session.ended_at.isoformat() if session.ended_at else None
+    except Exception:
+        log.exception("Fetch session messages error")
+        return jsonify({'message': 'Server error fetching messages.'}), 500
 
-        return jsonify({
-            'session': session_data,
-            'messages': messages_data
-        }), 200
 
-    except Exception as e:
-        print(f"Fetch session messages error: {e}")
-        return jsonify({'message': 'Server error fetching messages.'}), 500
+@api.route('/api/pro/search', methods=['GET'])
+@query_budget(12)  # user, df, one read per term (<= 8), stats, messages
+@pro_required
+def search_sessions(current_user):
+    """Full-text search over the user's own past messages, ranked, with snippets."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'message': 'Search query is required.'}), 400
+
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 50)
+        results, next_cursor = search_messages(
+            current_user.id, query, limit=limit, cursor=request.args.get('cursor')
+        )
+        return jsonify({'results': results, 'next_cursor': next_cursor}), 200
+
+    except ValueError:
+        return jsonify({'message': 'Invalid limit or cursor.'}), 400
+    except Exception:
+        log.exception("Search error")
+        return jsonify({'message': 'Server error searching messages.'}), 500
 
 
 # ============== MAIN CHAT ENDPOINT ==============
@@ -705,22 +1048,45 @@ NO asterisks (*).
 }
 
 
-def _save_message(session_id, sender, text, emotion=None):
-    """Helper: persist a single message to the database."""
+def _save_message(session_id, sender, text, emotion=None, user_id=None, model=None, latency_ms=None,
+                  reopen=False):
+    """Helper: persist a single message to the database (plus mood rollup and search index).
+
+    With reopen, a session that was ended (by the client or the idle reaper)
+    is made active again and its stored transcript dropped. Only the first
+    message of a turn needs it; active sessions pay one no-op UPDATE.
+    """
     if not session_id:
         return
     try:
+        now = datetime.utcnow()
+        if reopen:
+            ended = TherapySession.query.filter_by(id=session_id, is_active=False)
+            if user_id is not None:
+                ended = ended.filter_by(user_id=user_id)
+            if ended.update({'is_active': True, 'ended_at': None}, synchronize_session=False):
+                invalidate_transcript(session_id)
+        # Client-sent: only known labels (and aliases) are stored, never registered.
+        emotion_code = known_emotion_code(canonical_label(emotion)) if isinstance(emotion, str) else None
         msg = TherapyMessage(
             session_id=session_id,
             sender=sender,
             message_text=text,
-            emotion_detected=emotion
+            emotion_code=emotion_code,
+            model=model,
+            latency_ms=latency_ms,
+            created_at=now
         )
         db.session.add(msg)
+        if emotion_code is not None and user_id is not None:
+            record_emotion(user_id, emotion_code, now.date())
         db.session.commit()
-    except Exception as e:
+        if user_id is not None:
+            invalidate_user(user_id)
+            enqueue_index(current_app._get_current_object(), user_id, msg.id, text)
+    except Exception:
         db.session.rollback()
-        print(f"Message save error: {e}")
+        log.exception("Message save error")
 
 
 def _load_session_history(session_id, limit=30):
@@ -733,8 +1099,10 @@ def _load_session_history(session_id, limit=30):
     return messages
 
 
-@app.route('/api/get-response', methods=['POST'])
+@api.route('/api/get-response', methods=['POST'])
 @token_required
+@idempotent('get-response')
+@rate_limit('get-response')
 def get_response(current_user):
     """Chatbot response endpoint using Groq API with persistence for all users."""
     try:
@@ -747,7 +1115,8 @@ def get_response(current_user):
 
         data = request.get_json()
         user_message = data.get('userMessage', '')
-        message_history = data.get('messageHistory', [])  # Fallback for free users
+        conversation_id = data.get('conversation_id')  # free users: from the previous response
+        message_history = data.get('messageHistory', [])  # older clients re-send the history instead
         category = data.get('category', 'Mental Health')
         session_id = data.get('session_id', None)
         emotion = data.get('emotion', None)  # User's current emotion
@@ -761,43 +1130,61 @@ def get_response(current_user):
 
         if current_user.is_pro and session_id:
             # ── PRO PATH: Load persistent history from DB (Long-term memory) ──
+            try:
+                memories = retrieve_memories(current_user.id, user_message, exclude_session_id=session_id)
+                if memories:
+                    conversation_history.append({"role": "system", "content": format_memories(memories)})
+            except Exception:
+                log.exception("Memory retrieval error")
+
             db_messages = _load_session_history(session_id, limit=30)
+            turn = len(db_messages)
             for m in db_messages:
                 role = 'user' if m.sender == 'user' else 'assistant'
                 conversation_history.append({"role": role, "content": m.message_text})
         else:
-            # ── FREE PATH: Use in-memory history from client (Limited memory) ──
-            for msg in message_history:
-                role = 'user' if msg.get('sender') == 'user' else 'assistant'
-                conversation_history.append({"role": role, "content": msg.get('text', '')})
+            # ── FREE PATH: Short-term memory kept server-side (Limited memory, conversations.py) ──
+            history = recall(conversation_id, current_user.id)
+            if history is None:
+                conversation_id = None
+                history = [('user' if msg.get('sender') == 'user' else 'ai', str(msg.get('text', '')))
+                           for msg in (message_history if isinstance(message_history, list) else [])
+                           if isinstance(msg, dict)]
+            history = trim(history)
+            turn = len(history)
+            for sender, text in history:
+                role = 'user' if sender == 'user' else 'assistant'
+                conversation_history.append({"role": role, "content": text})
+
+        previous = conversation_history[-1]
+        previous_reply = previous['content'] if previous['role'] == 'assistant' else None
 
         # Append the new user message
         conversation_history.append({"role": "user", "content": user_message})
 
-        # Call Groq API
-        chat_completion = groq_client.chat.completions.create(
-            messages=conversation_history,
-            model="llama-3.3-70b-versatile"
-        )
-
-        response_text = (
-            chat_completion.choices[0].message.content
-            if chat_completion.choices
-            else "I'm here to listen. Could you tell me more?"
-        )
+        # Call Groq API on the model picked for this turn
+        route = choose_model(user_message, category, turn, emotion=emotion, previous_reply=previous_reply)
+        response_text, model, latency_ms = complete(conversation_history, route)
+        response_text = response_text or "I'm here to listen. Could you tell me more?"
 
         # ── Persist both messages for Analytics ──
         if session_id:
-            _save_message(session_id, 'user', user_message, emotion=emotion)
-            _save_message(session_id, 'ai', response_text)
+            _save_message(session_id, 'user', user_message, emotion=emotion, user_id=current_user.id, reopen=True)
+            _save_message(session_id, 'ai', response_text, user_id=current_user.id,
+                          model=model, latency_ms=latency_ms)
 
-        return jsonify({'therapistResponse': response_text})
+        if current_user.is_pro and session_id:
+            return jsonify({'therapistResponse': response_text})
+        conversation_id = remember(conversation_id, current_user.id,
+                                   history + [('user', user_message), ('ai', response_text)])
+        return jsonify({'therapistResponse': response_text, 'conversation_id': conversation_id})
 
-    except Exception as e:
-        print(f"Error calling Groq API: {e}")
+    except Exception:
+        log.exception("Error calling Groq API")
         return jsonify({'error': 'Failed to get a response from the AI.'}), 500
 
-@app.route('/api/text-to-speech', methods=['POST'])
+@api.route('/api/text-to-speech', methods=['POST'])
+@rate_limit('text-to-speech')
 def text_to_speech():
     try:
         data = request.get_json()
@@ -809,13 +1196,13 @@ def text_to_speech():
         cleaned_text = re.sub(r'\*.*?\*', '', text)
         cleaned_text = re.sub(r'[\U0001F600-\U0001F64F]', '', cleaned_text)
 
-        audio_stream = elevenlabs_client.text_to_speech.convert(
-            voice_id="21m00Tcm4TlvDq8ikWAM",
-            model_id="eleven_multilingual_v2",
-            text=cleaned_text
-        )
-
-        audio_bytes = b"".join(audio_stream)
+        with timed_upstream('elevenlabs', 'text_to_speech'):
+            audio_stream = get_elevenlabs_client().text_to_speech.convert(
+                voice_id="21m00Tcm4TlvDq8ikWAM",
+                model_id="eleven_multilingual_v2",
+                text=cleaned_text
+            )
+            audio_bytes = b"".join(audio_stream)
 
         return send_file(
             io.BytesIO(audio_bytes),
@@ -823,14 +1210,16 @@ def text_to_speech():
             as_attachment=False
         )
 
-    except Exception as e:
-        print("Error generating speech:", e)
+    except Exception:
+        log.exception("Error generating speech")
         return jsonify({'error': 'Failed to generate speech'}), 500
 
 
 # ============== START SERVER ==============
 
+app = create_app()
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
-    print(f"Server is running on port {port}")
+    log.info("PureSoul API (Pro System) starting on port %s", port)
     app.run(host='0.0.0.0', port=port, debug=True)
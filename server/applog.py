@@ -0,0 +1,200 @@
+# server/applog.py
+# Non-blocking structured logging.
+#
+# Request threads only render the message (and any traceback) to text and
+# put the LogRecord on a bounded in-memory queue; a background thread per
+# process formats it (JSON lines) and writes it to stdout. If stdout is slow - e.g. during an
+# error storm when Groq is down - the queue fills and further records are
+# dropped and counted (puresoul_log_records_dropped_total) instead of
+# blocking workers.
+#
+# Modules log through logging.getLogger('puresoul.<module>'). Every record
+# made during a request carries its request id (X-Request-ID, echoed on the
+# response), route and user id.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+from flask import g, request, has_request_context
+from metrics import inc
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # json | text
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+_lock = threading.Lock()
+_state = {'pid': None, 'writer': None}
+
+
+TRACEBACK_EVERY = 60.0  # seconds between full tracebacks for the same error site
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line (tracebacks as rendered by _freeze)."""
+
+    def format(self, record):
+        if record.exc_info:
+            _freeze(record)
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key in ('request_id', 'route', 'user_id'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+_plain = logging.Formatter()
+_last_traceback = {}  # (type, file, line) of the raise -> when its full traceback was last rendered
+
+
+def _freeze(record):
+    """Render a record's message and traceback to text and drop the live objects.
+
+    Args and tracebacks (which pin every frame's locals) must not cross to the
+    writer thread, where they may have changed or kept large objects alive.
+    During an error storm the same raise site only gets a full traceback once
+    per TRACEBACK_EVERY; repeats carry just the exception line and are not
+    formatted at all.
+    """
+    record.msg, record.args = record.getMessage(), None
+    if record.exc_info:
+        exc_type, exc, tb = record.exc_info
+        while tb is not None and tb.tb_next is not None:
+            tb = tb.tb_next
+        site = (exc_type, tb.tb_frame.f_code.co_filename if tb else None, tb.tb_lineno if tb else None)
+        if record.created - _last_traceback.get(site, 0) < TRACEBACK_EVERY:
+            record.exc_text = f"{exc_type.__name__}: {exc} (traceback repeated)"
+        else:
+            _last_traceback[site] = record.created
+            record.exc_text = _plain.formatException(record.exc_info)
+        record.exc_info = None
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Request thread: attach context and freeze message/traceback text; the
+        # line itself is formatted and written on the writer thread.
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.user_id = g.get('user_id')
+            record.route = request.url_rule.rule if request.url_rule else request.path
+        _freeze(record)
+        return record
+
+    def enqueue(self, record):
+        _ensure_writer()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            inc('puresoul_log_records_dropped_total', {'level': record.levelname})
+
+
+class _Writer:
+    """Background thread: drain the queue in batches, one write + flush per batch."""
+    BATCH = 512
+
+    def __init__(self, q, formatter):
+        self.queue, self.formatter = q, formatter
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            lines = [self._format(r) for r in batch if r is not None]
+            if lines:
+                try:
+                    sys.stdout.write('\n'.join(lines) + '\n')
+                    sys.stdout.flush()
+                except (OSError, ValueError):
+                    pass
+            if stop:
+                return
+
+    def _format(self, record):
+        try:
+            return self.formatter.format(record)
+        except Exception as e:
+            return json.dumps({'level': 'ERROR', 'logger': 'puresoul.applog', 'msg': f"Unformattable log record: {e}"})
+
+    def stop(self, timeout=5.0):
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout=timeout)
+
+
+def _make_formatter():
+    if LOG_FORMAT == 'text':
+        return logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s',
+                                 defaults={'request_id': '-'})
+    return JsonFormatter()
+
+
+_handler = _DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+_root = logging.getLogger('puresoul')
+_root.setLevel(LOG_LEVEL)
+_root.addHandler(_handler)
+_root.propagate = False
+
+
+def _ensure_writer():
+    if _state['pid'] != os.getpid():
+        with _lock:
+            if _state['pid'] != os.getpid():
+                if _state['pid'] is not None:  # forked: the parent's writer thread is gone
+                    _handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+                writer = _Writer(_handler.queue, _make_formatter())
+                writer.start()
+                _state['pid'], _state['writer'] = os.getpid(), writer
+
+
+def flush(timeout=5.0):
+    """Write out everything queued so far (used at exit and by scripts)."""
+    writer = _state['writer']
+    if writer is not None and _state['pid'] == os.getpid():
+        writer.stop(timeout)
+        _state['pid'] = None
+
+
+def init_logging(app):
+    """Assign each request an id (from X-Request-ID when sane) and echo it back."""
+
+    @app.before_request
+    def _request_id():
+        incoming = request.headers.get('X-Request-ID', '')
+        g.request_id = incoming if REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+
+    @app.after_request
+    def _echo_request_id(response):
+        if g.get('request_id'):
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
+
+atexit.register(flush)
@@ -0,0 +1,141 @@
+# server/auth_tokens.py
+# Access tokens (JWT) and rotating refresh tokens.
+#
+# /api/login pays for bcrypt once and returns both. Afterwards the client
+# renews its access token with POST /api/token/refresh, which costs one
+# conditional UPDATE and a primary-key user lookup - no password hash.
+#
+# A refresh token is "rt1.<family>.<generation>.<sig>": the family is one
+# login, the generation counts refreshes within it and sig is an HMAC over
+# both. The database keeps a single row per family holding the current
+# generation (refresh_families), not one row per token issued. Presenting
+# the current generation rotates it; presenting an older one means the
+# token was copied, so the whole family is revoked and the legitimate
+# client has to log in again too.
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+from datetime import datetime, timedelta
+import jwt
+from sqlalchemy import update, delete
+from models import db, RefreshFamily
+
+log = logging.getLogger('puresoul.auth_tokens')
+
+JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
+ACCESS_TOKEN_MINUTES = int(os.getenv('ACCESS_TOKEN_MINUTES', str(24 * 60)))
+REFRESH_TOKEN_DAYS = int(os.getenv('REFRESH_TOKEN_DAYS', '30'))
+PREFIX = 'rt1'
+
+
+class RefreshRejected(Exception):
+    """The refresh token is malformed, expired, revoked or was reused."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def access_token(user):
+    return jwt.encode(
+        {
+            'id': user.id,
+            'username': user.username,
+            'exp': datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_MINUTES)
+        },
+        JWT_SECRET,
+        algorithm='HS256'
+    )
+
+
+def _sign(family, generation):
+    mac = hmac.new(JWT_SECRET.encode(), f"{PREFIX}.{family}.{generation}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(mac[:24]).decode()
+
+
+def _encode(family, generation):
+    return f"{PREFIX}.{family}.{generation}.{_sign(family, generation)}"
+
+
+def _decode(token):
+    try:
+        prefix, family, generation, sig = token.split('.')
+        generation = int(generation)
+    except (AttributeError, ValueError):
+        raise RefreshRejected('malformed')
+    if prefix != PREFIX or not hmac.compare_digest(sig, _sign(family, generation)):
+        raise RefreshRejected('malformed')
+    return family, generation
+
+
+def issue_refresh_token(user_id):
+    """Start a new family (one per login) and return its first token."""
+    family = secrets.token_urlsafe(16)
+    db.session.add(RefreshFamily(
+        id=family, user_id=user_id, generation=0,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_DAYS),
+    ))
+    db.session.commit()
+    return _encode(family, 0)
+
+
+def rotate(token):
+    """Exchange a refresh token for the next one. Returns (user_id, new_token); raises RefreshRejected."""
+    family, generation = _decode(token)
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(RefreshFamily)
+        .where(RefreshFamily.id == family, RefreshFamily.generation == generation,
+               RefreshFamily.revoked_at.is_(None), RefreshFamily.expires_at > now)
+        .values(generation=generation + 1, last_used_at=now,
+                expires_at=now + timedelta(days=REFRESH_TOKEN_DAYS))
+    )
+    if result.rowcount == 1:
+        user_id = db.session.execute(
+            db.select(RefreshFamily.user_id).where(RefreshFamily.id == family)
+        ).scalar_one()
+        db.session.commit()
+        return user_id, _encode(family, generation + 1)
+
+    row = db.session.get(RefreshFamily, family)
+    if row is None:
+        db.session.rollback()
+        raise RefreshRejected('unknown')
+    if row.revoked_at is not None:
+        db.session.rollback()
+        raise RefreshRejected('revoked')
+    if row.generation > generation:
+        row.revoked_at = now
+        db.session.commit()
+        log.warning("Refresh token reuse for user %s (family %s, generation %s < %s); family revoked",
+                    row.user_id, family, generation, row.generation)
+        raise RefreshRejected('reused')
+    db.session.rollback()
+    raise RefreshRejected('expired')
+
+
+def revoke(token):
+    """Log out: revoke the token's family. Unknown or invalid tokens are ignored."""
+    try:
+        family, _ = _decode(token)
+    except RefreshRejected:
+        return
+    db.session.execute(
+        update(RefreshFamily)
+        .where(RefreshFamily.id == family, RefreshFamily.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+    db.session.commit()
+
+
+def expire_families(now=None):
+    """Delete families past their expiry. Returns the number removed."""
+    result = db.session.execute(
+        delete(RefreshFamily).where(RefreshFamily.expires_at < (now or datetime.utcnow()))
+    )
+    db.session.commit()
+    return result.rowcount
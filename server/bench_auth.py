@@ -0,0 +1,79 @@
+# server/bench_auth.py
+# Server CPU of a password login vs a refresh-token renewal.
+# Usage: python bench_auth.py [--repeat 50] [--renewals-per-day 3] [--dau 1000,10000,100000]
+#
+# Times POST /api/login (or_ email/username lookup + bcrypt.checkpw at the
+# cost register() uses) and POST /api/token/refresh (one conditional
+# UPDATE + primary-key lookup) through the test client, then projects the
+# daily login CPU for each DAU figure if every renewal - each app open or
+# expired token - is a refresh instead of a password login.
+# Uses a throwaway SQLite database.
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_auth.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+os.environ['RATELIMIT_ENABLED'] = 'false'
+
+import bcrypt  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db, User  # noqa: E402
+
+PASSWORD = 'Correct-Horse-9'
+
+
+def cpu_ms(client, path, payload_fn, repeat):
+    timings = []
+    response = None
+    for _ in range(repeat):
+        payload = payload_fn(response)
+        start = time.process_time()
+        response = client.post(path, json=payload)
+        timings.append((time.process_time() - start) * 1000)
+        assert response.status_code == 200, response.get_json()
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark login vs token refresh CPU.")
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--renewals-per-day', type=float, default=3.0)
+    parser.add_argument('--dau', default='1000,10000,100000')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        for i in range(5000):  # a users table big enough for the lookup to be realistic
+            db.session.add(User(name=f'User {i}', email=f'user{i}@example.com', username=f'user{i}', password='x'))
+        hashed = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=10)).decode('utf-8')
+        db.session.add(User(name='Bench', email='bench@example.com', username='bench', password=hashed))
+        db.session.commit()
+
+        client = app.test_client()
+        login = cpu_ms(client, '/api/login', lambda _: {'identifier': 'bench', 'password': PASSWORD}, args.repeat)
+        first = client.post('/api/login', json={'identifier': 'bench', 'password': PASSWORD}).get_json()
+        refresh = cpu_ms(
+            client, '/api/token/refresh',
+            lambda prev: {'refresh_token': (prev.get_json() if prev else first)['refresh_token']},
+            args.repeat,
+        )
+
+    print(f"POST /api/login          median CPU {login:7.2f} ms")
+    print(f"POST /api/token/refresh  median CPU {refresh:7.2f} ms  ({login / refresh:.0f}x cheaper)")
+    print(f"\nAt {args.renewals_per_day:g} renewals per user per day:")
+    for dau in (int(x) for x in args.dau.split(',')):
+        renewals = dau * args.renewals_per_day
+        before, after = renewals * login / 1000, renewals * refresh / 1000
+        print(f"  {dau:>7} DAU: {before:8.0f} CPU-s/day with logins -> {after:6.0f} with refreshes "
+              f"(saves {before - after:8.0f} CPU-s, {(before - after) / 3600:5.2f} core-hours)")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
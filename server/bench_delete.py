@@ -0,0 +1,164 @@
+# server/bench_delete.py
+# Deleting a long history: set-based chunks vs the ORM cascade.
+# Usage: python bench_delete.py [--messages 1000000] [--sessions 50] [--orm-messages 100000]
+#
+# Seeds users whose sessions carry messages, search postings, mood rollups
+# and emotion buckets, then deletes each history with deletion.delete_history
+# and reports rows/s, the longest single transaction and the peak RSS growth
+# during the delete (sampled from /proc). The same delete at a tenth of the
+# size shows memory does not grow with history length; the ORM path
+# (db.session.delete(session), which loads every message through the
+# cascade) is shown for comparison.
+# Uses a throwaway SQLite database.
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_delete.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+os.environ['CACHE_ENABLED'] = 'false'
+
+from app import create_app  # noqa: E402
+from models import (  # noqa: E402
+    db, User, TherapySession, TherapyMessage, SearchPosting, SearchStats, MoodRollup, EmotionBucket,
+)
+from emotions import seed_emotions  # noqa: E402
+from deletion import delete_history  # noqa: E402
+
+WORDS = "exam stress sleep family job money focus tired happy worried friend yaar bahut kya".split()
+PAGE = os.sysconf('SC_PAGE_SIZE')
+
+
+def rss():
+    with open('/proc/self/statm') as fh:
+        return int(fh.read().split()[1]) * PAGE
+
+
+class RssPeak:
+    """Sample RSS every 20 ms on a thread; `growth` is the peak minus the starting RSS."""
+
+    def __enter__(self):
+        self.start = self.peak = rss()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.done.wait(0.02):
+            self.peak = max(self.peak, rss())
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak, rss())
+        self.growth = self.peak - self.start
+
+
+def seed(user_id, n_messages, n_sessions, rng):
+    db.session.add(User(id=user_id, name='Bench', email=f'bench{user_id}@example.com',
+                        username=f'bench{user_id}', password='x'))
+    first_session = user_id * 100000
+    start = datetime(2025, 1, 1)
+    for s in range(n_sessions):
+        db.session.add(TherapySession(id=first_session + s, user_id=user_id, is_active=False,
+                                      started_at=start, ended_at=start))
+    db.session.commit()
+
+    per_session = n_messages // n_sessions
+    rollups, next_id = {}, user_id * 10_000_000
+    for s in range(n_sessions):
+        for offset in range(0, per_session, 10000):
+            messages, postings = [], []
+            for i in range(offset, min(per_session, offset + 10000)):
+                next_id += 1
+                created = start + timedelta(minutes=s * per_session + i)
+                code = rng.choice((None, 1, 2, 3, 4))
+                messages.append({'id': next_id, 'session_id': first_session + s, 'sender': 'user',
+                                 'message_text': ' '.join(rng.choices(WORDS, k=12)),
+                                 'emotion_code': code, 'created_at': created})
+                postings.extend({'user_id': user_id, 'term': t, 'message_id': next_id, 'tf': 1}
+                                for t in set(rng.choices(WORDS, k=3)))
+                if code is not None:
+                    rollups[(created.date(), code)] = rollups.get((created.date(), code), 0) + 1
+            db.session.execute(TherapyMessage.__table__.insert(), messages)
+            db.session.execute(SearchPosting.__table__.insert(), postings)
+            db.session.commit()
+        db.session.execute(EmotionBucket.__table__.insert(), [
+            {'session_id': first_session + s, 'bucket_start': start + timedelta(seconds=10 * b),
+             'emotion_code': 1, 'readings': 20, 'confidence_sum': 1500}
+            for b in range(360)
+        ])
+    db.session.execute(MoodRollup.__table__.insert(), [
+        {'user_id': user_id, 'day': day, 'emotion_code': code, 'count': n} for (day, code), n in rollups.items()
+    ])
+    db.session.add(SearchStats(user_id=user_id, doc_count=n_messages))
+    db.session.commit()
+    db.session.expunge_all()
+
+
+def set_based(user_id, label):
+    chunk_times, last = [], [time.perf_counter()]
+
+    def on_chunk():
+        now = time.perf_counter()
+        chunk_times.append(now - last[0])
+        last[0] = now
+
+    with RssPeak() as mem:
+        start = time.perf_counter()
+        stats = delete_history(user_id, on_chunk=on_chunk)
+        elapsed = time.perf_counter() - start
+    total = sum(stats.values())
+    print(f"{label:<28} {total:>9} rows in {elapsed:6.1f} s = {total / elapsed:7.0f} rows/s "
+          f"({stats['therapy_messages']} messages), longest chunk {max(chunk_times) * 1000:5.0f} ms, "
+          f"peak RSS +{mem.growth / 1e6:6.1f} MB")
+
+
+def orm(user_id, label):
+    with RssPeak() as mem:
+        start = time.perf_counter()
+        n = 0
+        for session in TherapySession.query.filter_by(user_id=user_id).all():
+            n += len(session.messages)
+            db.session.delete(session)
+        db.session.commit()
+        elapsed = time.perf_counter() - start
+    print(f"{label:<28} {n:>9} messages in {elapsed:6.1f} s = {n / elapsed:7.0f} rows/s, "
+          f"one transaction, peak RSS +{mem.growth / 1e6:6.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk history deletion.")
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--orm-messages', type=int, default=100000)
+    args = parser.parse_args()
+
+    app = create_app()
+    rng = random.Random(42)
+    with app.app_context():
+        db.create_all()
+        seed_emotions()
+        t = time.perf_counter()
+        seed(1, args.messages, args.sessions, rng)
+        seed(2, args.messages // 10, args.sessions, rng)
+        seed(3, args.orm_messages, args.sessions, rng)
+        seed(4, args.orm_messages, args.sessions, rng)
+        print(f"Seeded in {time.perf_counter() - t:.0f} s\n")
+
+        set_based(1, f"set-based, {args.messages} msgs")
+        set_based(2, f"set-based, {args.messages // 10} msgs")
+        set_based(4, f"set-based, {args.orm_messages} msgs")
+        orm(3, f"ORM cascade, {args.orm_messages} msgs")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
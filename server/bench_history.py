@@ -0,0 +1,129 @@
+# server/bench_history.py
+# Free-tier chat turns: client-uploaded messageHistory vs server-side conversation ids.
+# Usage: python bench_history.py [--turns 5,20,50] [--repeat 200]
+#
+# For each turn number, builds the /api/get-response body an older client
+# sends (every earlier message in messageHistory) and the body sent with a
+# conversation id (the new message only), then reports:
+#   - request bytes
+#   - parse time: decoding the body and building the LLM context, which for
+#     the conversation id includes reading the buffer (conversations.recall)
+#   - server CPU per request through the test client, Groq call stubbed out
+# The conversation id path keeps the last FREE_HISTORY_LIMIT messages
+# whatever the turn; the upload path grows without bound.
+# Uses a throwaway SQLite database and conversation store.
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+TMP = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(TMP, 'bench_history.db')}"
+os.environ['CONVERSATIONS_DB'] = os.path.join(TMP, 'conversations.db')
+os.environ['RATELIMIT_ENABLED'] = 'false'
+
+import app as app_module  # noqa: E402
+from auth_tokens import access_token  # noqa: E402
+from conversations import recall, remember, trim  # noqa: E402
+from models import db, User  # noqa: E402
+from routing import BIG_MODEL  # noqa: E402
+
+USER_TEXT = "Kal exam hai aur mujhe lag raha hai kuch yaad nahi hoga, bahut stress ho raha hai yaar 😟"
+AI_TEXT = ("Arre dost, tension mat lo! Exam se pehle aisa lagna bilkul normal hai, it means you care. "
+           "Chalo ek kaam karte hain: aaj sirf top 3 topics revise karo aur raat ko 7 ghante ki neend lo. "
+           "Tumne already bahut mehnat ki hai, trust that preparation. Kaunsa subject sabse zyada dara raha hai? 📚✨")
+
+
+def history_for(turn):
+    messages = []
+    for _ in range(turn - 1):
+        messages += [{'sender': 'user', 'text': USER_TEXT}, {'sender': 'therapist', 'text': AI_TEXT}]
+    return messages
+
+
+def median_us(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(timings)
+
+
+def parse_upload(body):
+    data = json.loads(body)
+    context = [{"role": "system", "content": "..."}]
+    for msg in data['messageHistory']:
+        role = 'user' if msg.get('sender') == 'user' else 'assistant'
+        context.append({"role": role, "content": msg.get('text', '')})
+    context.append({"role": "user", "content": data['userMessage']})
+    return context
+
+
+def parse_conversation(body, user_id):
+    data = json.loads(body)
+    context = [{"role": "system", "content": "..."}]
+    for sender, text in recall(data['conversation_id'], user_id):
+        context.append({"role": 'user' if sender == 'user' else 'assistant', "content": text})
+    context.append({"role": "user", "content": data['userMessage']})
+    return context
+
+
+def request_cpu_ms(client, headers, payload, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        response = client.post('/api/get-response', headers=headers, json=payload)
+        timings.append((time.process_time() - start) * 1000)
+        assert response.status_code == 200, response.get_json()
+        if 'conversation_id' in payload:  # the buffer was found, not replaced by a new conversation
+            assert response.get_json()['conversation_id'] == payload['conversation_id']
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark free-tier history upload vs conversation ids.")
+    parser.add_argument('--turns', default='5,20,50')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app_module.complete = lambda messages, route: (AI_TEXT, BIG_MODEL, 0)
+    app = app_module.create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(name='Bench', email='bench@example.com', username='bench', password='x', credits=10 ** 9)
+        db.session.add(user)
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {access_token(user)}'}
+        user_id = user.id
+    client = app.test_client()
+
+    print(f"{'turn':>4}  {'upload bytes':>12} {'id bytes':>9}  {'upload parse':>12} {'id parse':>9}  "
+          f"{'upload CPU':>10} {'id CPU':>7}")
+    for turn in (int(t) for t in args.turns.split(',')):
+        history = history_for(turn)
+        upload = {'userMessage': USER_TEXT, 'messageHistory': history, 'category': 'Academic / Exam'}
+        upload_body = json.dumps(upload)
+        upload_parse = median_us(lambda: parse_upload(upload_body), args.repeat)
+        upload_cpu = request_cpu_ms(client, headers, upload, args.repeat)
+
+        # created after the upload requests: each of those starts a conversation and only 5 are kept
+        conversation_id = remember(None, user_id, [('user' if m['sender'] == 'user' else 'ai', m['text'])
+                                                   for m in history])
+        by_id = {'userMessage': USER_TEXT, 'conversation_id': conversation_id, 'category': 'Academic / Exam'}
+        id_body = json.dumps(by_id)
+        assert len(parse_conversation(id_body, user_id)) == len(trim(history)) + 2
+        id_parse = median_us(lambda: parse_conversation(id_body, user_id), args.repeat)
+        id_cpu = request_cpu_ms(client, headers, by_id, args.repeat)  # each call also re-stores the buffer
+        print(f"{turn:>4}  {len(upload_body.encode()):>12} {len(id_body.encode()):>9}  "
+              f"{upload_parse:>9.1f} µs {id_parse:>6.1f} µs  {upload_cpu:>7.2f} ms {id_cpu:>4.2f} ms")
+
+    shutil.rmtree(TMP)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# server/bench_logging.py
+# Request latency during an error storm while stdout is slow.
+# Usage: python bench_logging.py [--threads 8] [--requests 2000] [--drain-kbps 256]
+#
+# Runs the app in a child process whose stdout is a pipe drained at a fixed
+# rate (a slow log shipper). Every request hits /api/text-to-speech with no
+# ELEVEN_API_KEY, so each one fails and logs an error - like an upstream
+# outage. Two modes:
+#   print  - records written synchronously to stdout, as print() did
+#   queue  - the applog pipeline (bounded queue + writer thread)
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+class PrintHandler(logging.Handler):
+    """The old behaviour: print(f"... error: {e}") on the request thread."""
+    def emit(self, record):
+        exc = record.exc_info[1] if record.exc_info else ''
+        print(f"{record.getMessage()}: {exc}")
+
+
+def child(mode, threads, n_requests, out_path):
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    os.environ.pop('ELEVEN_API_KEY', None)
+    from app import create_app
+    import applog
+    from metrics import _counters
+
+    if mode == 'print':
+        root = logging.getLogger('puresoul')
+        root.handlers = [PrintHandler()]
+
+    app = create_app()
+    timings = []
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        local = []
+        for _ in range(n_requests // threads):
+            t = time.perf_counter()
+            client.post('/api/text-to-speech', json={'text': 'hello'})
+            local.append((time.perf_counter() - t) * 1000)
+        with lock:
+            timings.extend(local)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    dropped = sum(v for (name, _), v in _counters.items() if name == 'puresoul_log_records_dropped_total')
+    with open(out_path, 'w') as fh:
+        json.dump({'timings': timings, 'elapsed': elapsed, 'dropped': dropped}, fh)
+    if mode == 'queue':
+        applog.flush(timeout=None)
+    sys.stdout.flush()
+
+
+def run(mode, args):
+    out_path = os.path.join(tempfile.mkdtemp(), f'{mode}.json')
+    proc = subprocess.Popen(
+        [sys.executable, __file__, '--child', mode, '--threads', str(args.threads),
+         '--requests', str(args.requests), '--out', out_path],
+        stdout=subprocess.PIPE,
+    )
+    chunk = 4096
+    delay = chunk / (args.drain_kbps * 1024)
+    total = 0
+    while True:
+        data = proc.stdout.read1(chunk)
+        if not data:
+            break
+        total += len(data)
+        time.sleep(delay)
+    proc.wait()
+
+    with open(out_path) as fh:
+        result = json.load(fh)
+    timings = sorted(result['timings'])
+    print(f"{mode:<6} {len(timings)} failing requests: "
+          f"p50 {statistics.median(timings):6.2f} ms, "
+          f"p99 {timings[int(len(timings) * 0.99) - 1]:7.2f} ms, "
+          f"max {timings[-1]:7.1f} ms, "
+          f"{len(timings) / result['elapsed']:6.0f} req/s, "
+          f"{total / 1024:.0f} KB logged, {result['dropped']:.0f} records dropped")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark logging under an error storm.")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--drain-kbps', type=int, default=256)
+    parser.add_argument('--child')
+    parser.add_argument('--out')
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.threads, args.requests, args.out)
+    else:
+        run('print', args)
+        run('queue', args)
@@ -0,0 +1,101 @@
+# server/bench_memory.py
+# Benchmark cross-session memory retrieval on a synthetic history.
+# Usage: python bench_memory.py [--messages 100000]
+#
+# Builds a throwaway SQLite database (never the configured one), indexes
+# it, then times retrieve_memories() for a set of realistic queries.
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_memory.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+
+from app import create_app  # noqa: E402
+from models import db, User, TherapySession, TherapyMessage  # noqa: E402
+from search import index_messages  # noqa: E402
+from memory import retrieve_memories, format_memories, estimate_tokens  # noqa: E402
+
+TOPICS = (
+    "exam study focus marks result teacher college semester revision syllabus "
+    "job interview boss salary promotion resignation office deadline manager career "
+    "breakup girlfriend boyfriend family mother father sister argument trust lonely "
+    "sleep insomnia tired gym diet headache doctor anxiety panic therapy medicine "
+    "loan emi rent savings debt money budget expenses bills salary"
+).split()
+FILLER = (
+    "feel feeling really very just today yesterday always never think know want need "
+    "yaar dost bahut kya hai nahi kuch bhi thoda time day week again still maybe"
+).split()
+QUERIES = [
+    "I failed my exam again and my parents are angry",
+    "my boss rejected my promotion",
+    "can't sleep, panic attacks at night",
+    "emi and rent are killing me this month",
+    "had another argument with my sister",
+]
+
+
+def make_message(rng):
+    words = rng.choices(TOPICS, k=rng.randint(2, 6)) + rng.choices(FILLER, k=rng.randint(6, 20))
+    rng.shuffle(words)
+    return ' '.join(words)
+
+
+def seed(n_messages, rng):
+    db.create_all()
+    db.session.add(User(id=1, name='Bench', email='bench@example.com', username='bench', password='x', is_pro=True))
+    n_sessions = max(1, n_messages // 50)
+    db.session.execute(TherapySession.__table__.insert(), [
+        {'id': i, 'user_id': 1, 'session_title': 'Mental Health Session'} for i in range(1, n_sessions + 1)
+    ])
+    for start in range(0, n_messages, 10000):
+        rows = [
+            {'id': start + i + 1, 'session_id': rng.randint(1, n_sessions),
+             'sender': rng.choice(('user', 'ai')), 'message_text': make_message(rng)}
+            for i in range(min(10000, n_messages - start))
+        ]
+        db.session.execute(TherapyMessage.__table__.insert(), rows)
+        index_messages([(1, r['id'], r['message_text']) for r in rows])
+        db.session.commit()
+    return n_sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memory retrieval.")
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    app = create_app()
+    with app.app_context():
+        start = time.perf_counter()
+        n_sessions = seed(args.messages, rng)
+        print(f"Seeded + indexed {args.messages} messages / {n_sessions} sessions "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        timings, tokens = [], []
+        for _ in range(args.repeat):
+            for q in QUERIES:
+                t = time.perf_counter()
+                memories = retrieve_memories(1, q, exclude_session_id=1)
+                timings.append((time.perf_counter() - t) * 1000)
+                tokens.append(estimate_tokens(format_memories(memories)))
+
+        timings.sort()
+        print(f"retrieve_memories over {len(timings)} calls: "
+              f"p50 {statistics.median(timings):.1f} ms, "
+              f"p95 {timings[int(len(timings) * 0.95) - 1]:.1f} ms, "
+              f"max {timings[-1]:.1f} ms")
+        print(f"prompt memory block: max {max(tokens)} tokens (budget {os.getenv('MEMORY_TOKEN_BUDGET', 400)})")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# server/bench_ratelimit.py
+# Benchmark the rate limiter's own overhead per check.
+# Usage: python bench_ratelimit.py [--workers 4] [--checks 20000]
+#
+# Uses a throwaway bucket database; N processes hammer it at once to mimic
+# gunicorn workers sharing the store.
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+os.environ['RATELIMIT_DB'] = os.path.join(tempfile.mkdtemp(), 'bench_ratelimit.db')
+
+import ratelimit  # noqa: E402
+
+
+def worker(n_checks, n_keys, out):
+    timings = []
+    for i in range(n_checks):
+        t = time.perf_counter()
+        ratelimit.take(f"bench:user:{i % n_keys}", rate=1000.0, capacity=1000)
+        timings.append((time.perf_counter() - t) * 1e6)
+    out.put(timings)
+
+
+def run(workers, n_checks, n_keys):
+    out = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(n_checks, n_keys, out)) for _ in range(workers)]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    timings = []
+    for _ in procs:
+        timings.extend(out.get())
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    timings.sort()
+    print(f"{workers} worker(s), {len(timings)} checks, {n_keys} keys: "
+          f"p50 {statistics.median(timings):.0f} µs, "
+          f"p99 {timings[int(len(timings) * 0.99) - 1]:.0f} µs, "
+          f"max {timings[-1] / 1000:.1f} ms, "
+          f"{len(timings) / elapsed:,.0f} checks/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark rate limiter overhead.")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--checks', type=int, default=20000)
+    parser.add_argument('--keys', type=int, default=1000)
+    args = parser.parse_args()
+
+    run(1, args.checks, args.keys)
+    run(args.workers, args.checks, args.keys)
+    os.remove(os.environ['RATELIMIT_DB'])
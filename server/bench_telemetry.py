@@ -0,0 +1,108 @@
+# server/bench_telemetry.py
+# Ingest throughput of /api/telemetry/emotions for one worker.
+# Usage: python bench_telemetry.py [--seconds 600] [--hz 5] [--batches 1,10,50,250]
+#
+# Simulates a camera detector producing --hz readings per second for
+# --seconds of a session, posted in batches of each given size through the
+# test client (single thread = one worker). Batch size 1 is one request and
+# one write per reading. Reports batches/s, readings/s and how many
+# emotion_buckets rows the readings collapsed into.
+# Uses a throwaway SQLite database.
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_telemetry.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+os.environ['RATELIMIT_ENABLED'] = 'false'
+
+import jwt  # noqa: E402
+from app import create_app, JWT_SECRET  # noqa: E402
+from models import db, User, TherapySession, EmotionBucket  # noqa: E402
+from emotions import seed_emotions  # noqa: E402
+
+LABELS = ['neutral', 'happy', 'sad', 'angry', 'surprise', 'fearful', 'disgusted']
+
+
+def readings(n, hz, rng):
+    """Detector output: jittered intervals, sticky emotions, noisy confidences."""
+    step = 1000 // hz
+    deltas, emotions, confidences = [], [], []
+    current = 0
+    for i in range(n):
+        deltas.append(0 if i == 0 else step + rng.randint(-step // 5, step // 5))
+        if rng.random() < 0.05:
+            current = rng.randrange(len(LABELS))
+        emotions.append(current)
+        confidences.append(rng.randint(40, 99))
+    return deltas, emotions, confidences
+
+
+def batches(t0, deltas, emotions, confidences, size):
+    ms = t0
+    for i in range(0, len(deltas), size):
+        chunk = deltas[i:i + size]
+        first = ms + chunk[0]
+        yield {
+            'session_id': 0,  # filled in per run
+            't0': first,
+            't': [0] + chunk[1:],
+            'e': emotions[i:i + size],
+            'c': confidences[i:i + size],
+            'labels': LABELS,
+        }
+        ms += sum(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark emotion telemetry ingestion.")
+    parser.add_argument('--seconds', type=int, default=600)
+    parser.add_argument('--hz', type=int, default=5)
+    parser.add_argument('--batches', default='1,10,50,250')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed_emotions()
+        db.session.add(User(id=1, name='Bench', email='bench@example.com', username='bench', password='x'))
+        db.session.commit()
+
+        client = app.test_client()
+        auth = {'Authorization': f"Bearer {jwt.encode({'id': 1}, JWT_SECRET, algorithm='HS256')}"}
+        n = args.seconds * args.hz
+        data = readings(n, args.hz, random.Random(42))
+        t0 = int(time.time() * 1000) - args.seconds * 1000 - 60000
+        print(f"{n} readings ({args.seconds}s at {args.hz} Hz) per run, {len(LABELS)} labels")
+
+        for session_id, size in enumerate(int(x) for x in args.batches.split(',')):
+            session_id += 1
+            db.session.add(TherapySession(id=session_id, user_id=1, session_title='Bench'))
+            db.session.commit()
+            payloads = list(batches(t0, *data, size))
+            for payload in payloads:
+                payload['session_id'] = session_id
+
+            start = time.perf_counter()
+            for payload in payloads:
+                response = client.post('/api/telemetry/emotions', json=payload, headers=auth)
+                assert response.status_code == 200, response.get_json()
+            elapsed = time.perf_counter() - start
+
+            rows, stored = db.session.execute(
+                db.select(db.func.count(), db.func.sum(EmotionBucket.readings))
+                .where(EmotionBucket.session_id == session_id)
+            ).one()
+            assert stored == n, (stored, n)
+            print(f"batch {size:>4}: {len(payloads):5d} requests in {elapsed:6.2f} s -> "
+                  f"{len(payloads) / elapsed:7.0f} batches/s, {n / elapsed:8.0f} readings/s, "
+                  f"{rows} bucket rows")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
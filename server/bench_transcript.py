@@ -0,0 +1,137 @@
+# server/bench_transcript.py
+# Benchmark the transcript read path on one very long session.
+# Usage: python bench_transcript.py [--messages 50000] [--repeat 5]
+#
+# Compares the old ORM path (hydrate TherapyMessage objects, to_dict(),
+# per-field isoformat(), jsonify) with the column-projected live path, then
+# reports bytes on the wire and server CPU per view of /api/pro/session/<id>
+# for the live path vs the pre-compressed transcript store.
+# Uses a throwaway SQLite database.
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_transcript.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+os.environ['RATELIMIT_ENABLED'] = 'false'
+
+import jwt  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+from flask import jsonify  # noqa: E402
+from app import create_app, JWT_SECRET, _session_rows  # noqa: E402
+from transcripts import session_dict, transcript_messages, store_transcript  # noqa: E402
+from fastjson import json_response  # noqa: E402
+from models import db, User, TherapySession, TherapyMessage  # noqa: E402
+from emotions import seed_emotions  # noqa: E402
+
+WORDS = "exam stress sleep family job money focus tired happy worried friend yaar bahut kya".split()
+
+
+def seed(n_messages, rng):
+    db.create_all()
+    seed_emotions()
+    db.session.add(User(id=1, name='Bench', email='bench@example.com', username='bench', password='x', is_pro=True))
+    db.session.add(TherapySession(id=1, user_id=1, session_title='Mental Health Session', is_active=False))
+    start = datetime(2025, 1, 1)
+    for offset in range(0, n_messages, 10000):
+        db.session.execute(TherapyMessage.__table__.insert(), [
+            {'session_id': 1, 'sender': 'user' if i % 2 == 0 else 'ai',
+             'message_text': ' '.join(rng.choices(WORDS, k=rng.randint(8, 40))),
+             'emotion_code': rng.choice((None, 1, 2, 3, 4)),
+             'created_at': start + timedelta(seconds=i)}
+            for i in range(offset, min(n_messages, offset + 10000))
+        ])
+    db.session.commit()
+
+
+def orm_path():
+    session = TherapySession.query.filter_by(id=1, user_id=1).first()
+    messages = TherapyMessage.query.filter_by(session_id=1).order_by(TherapyMessage.created_at.asc()).all()
+    messages_data = []
+    for m in messages:
+        d = m.to_dict()
+        d['created_at'] = m.created_at.isoformat() if m.created_at else None
+        messages_data.append(d)
+    session_data = session.to_dict()
+    session_data['started_at'] = session.started_at.isoformat() if session.started_at else None
+    session_data['ended_at'] = session.ended_at.isoformat() if session.ended_at else None
+    return jsonify({'session': session_data, 'messages': messages_data}).get_data()
+
+
+def lean_path():
+    rows = _session_rows(1, session_id=1)
+    return json_response({'session': session_dict(rows[0]), 'messages': transcript_messages(1)}).get_data()
+
+
+def timeit(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        t = time.perf_counter()
+        body = fn()
+        timings.append((time.perf_counter() - t) * 1000)
+    return timings, len(body)
+
+
+def report(name, timings, size):
+    print(f"{name:<28} median {statistics.median(timings):7.1f} ms, "
+          f"min {min(timings):7.1f} ms, body {size / 1e6:.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcript serialization.")
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        seed(args.messages, random.Random(42))
+        print(f"Seeded one session with {args.messages} messages")
+
+        with app.test_request_context():
+            report('before: ORM + jsonify', *timeit(orm_path, args.repeat))
+            report('after: rows + fastjson', *timeit(lean_path, args.repeat))
+
+        client = app.test_client()
+        auth = {'Authorization': f"Bearer {jwt.encode({'id': 1}, JWT_SECRET, algorithm='HS256')}"}
+
+        t = time.perf_counter()
+        entry = store_transcript(db.session.get(TherapySession, 1))
+        print(f"store_transcript: {(time.perf_counter() - t) * 1000:.0f} ms, {entry.size / 1024:.1f} KB -> "
+              f"gzip {len(entry.body_gzip) / 1024:.1f} KB"
+              + (f", br {len(entry.body_br) / 1024:.1f} KB" if entry.body_br else " (brotli not installed)"))
+
+        views = [
+            ('live (is_active)', {}, True),
+            ('stored, identity', {'Accept-Encoding': 'identity'}, False),
+            ('stored, gzip', {'Accept-Encoding': 'gzip'}, False),
+            ('stored, br', {'Accept-Encoding': 'br, gzip'}, False),
+            ('stored, revalidate (304)', {'Accept-Encoding': 'br, gzip', 'If-None-Match': None}, False),
+        ]
+        for name, headers, active in views:
+            TherapySession.query.filter_by(id=1).update({'is_active': active})
+            db.session.commit()
+            if 'If-None-Match' in headers:
+                headers['If-None-Match'] = client.get('/api/pro/session/1', headers={**auth, **headers}).headers['ETag']
+            cpu, wall = [], []
+            for _ in range(args.repeat):
+                c, t = time.process_time(), time.perf_counter()
+                response = client.get('/api/pro/session/1', headers={**auth, **headers})
+                body = response.get_data()
+                cpu.append((time.process_time() - c) * 1000)
+                wall.append((time.perf_counter() - t) * 1000)
+            encoding = response.headers.get('Content-Encoding', 'identity')
+            print(f"GET {name:<26} {response.status_code} {encoding:<8} "
+                  f"{len(body) / 1024:9.1f} KB on the wire, CPU {statistics.median(cpu):6.1f} ms, "
+                  f"wall {statistics.median(wall):6.1f} ms")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
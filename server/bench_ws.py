@@ -0,0 +1,202 @@
+# server/bench_ws.py
+# Chat turns over the WebSocket channel vs HTTP, and server memory per connection.
+# Usage: python bench_ws.py [--connections 5000] [--turns 3] [--upstream-ms 200] [--http-turns 300]
+#
+# Starts ws_chat.py in a child process with the Groq call replaced by a stub
+# that streams a fixed reply in 8 chunks over --upstream-ms, opens
+# --connections authenticated connections (one user and session each), then
+# has every connection send --turns messages concurrently. Reports the
+# server's RSS before and with the connections open, turns/s and server CPU
+# per turn. --sessionless connects without a session, so turns are not
+# persisted and only the credit UPDATE touches the database. For comparison, the same turns through /api/get-response plus the
+# client's /api/credits/use call (test client, same stub) are timed for CPU.
+# Uses a throwaway SQLite database.
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+DB_PATH = os.environ.setdefault('BENCH_WS_DB', os.path.join(tempfile.mkdtemp(), 'bench_ws.db'))  # shared with the child
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+os.environ['RATELIMIT_ENABLED'] = 'false'
+os.environ.setdefault('WS_PORT', '18765')
+
+REPLY = "Arre dost, tension mat lo! Exams ka pressure real hai, but ek ek step lete hain. Aaj kya padha? 📚"
+PAGE = os.sysconf('SC_PAGE_SIZE')
+TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def stub_chunks():
+    words = REPLY.split(' ')
+    step = -(-len(words) // 8)
+    return [' '.join(words[i:i + step]) + ' ' for i in range(0, len(words), step)]
+
+
+def serve(upstream_ms):
+    import ws_chat
+    chunks = stub_chunks()
+
+    async def fake_stream(messages, route, on_delta):
+        for chunk in chunks:
+            await asyncio.sleep(upstream_ms / 1000 / len(chunks))
+            await on_delta(chunk)
+        return REPLY, route.model, upstream_ms
+
+    ws_chat.stream_complete = fake_stream
+    asyncio.run(ws_chat.main())
+
+
+def proc_rss(pid):
+    with open(f'/proc/{pid}/statm') as fh:
+        return int(fh.read().split()[1]) * PAGE
+
+
+def proc_cpu(pid):
+    with open(f'/proc/{pid}/stat') as fh:
+        fields = fh.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / TICKS
+
+
+def seed(n):
+    from app import create_app
+    from auth_tokens import access_token
+    from models import db, User, TherapySession
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [
+            {'id': i, 'name': f'User {i}', 'email': f'user{i}@example.com', 'username': f'user{i}',
+             'password': 'x', 'credits': 1000, 'total_credits_purchased': 0, 'is_pro': i % 2 == 0}
+            for i in range(1, n + 1)
+        ])
+        db.session.execute(TherapySession.__table__.insert(), [
+            {'id': i, 'user_id': i, 'is_active': True} for i in range(1, n + 1)
+        ])
+        db.session.commit()
+        users = {u.id: u for u in User.query.all()}
+        return app, [access_token(users[i]) for i in range(1, n + 1)]
+
+
+async def client(url, token, session_id, turns, gate, ready, go, latencies, errors):
+    from websockets.asyncio.client import connect
+    async with gate:  # connect in waves, not 5000 handshakes at once
+        ws = await connect(url, max_size=None, compression=None, open_timeout=60)
+        await ws.send(json.dumps({'type': 'auth', 'token': token, 'session_id': session_id,
+                                  'category': 'Academic / Exam'}))
+        assert json.loads(await ws.recv())['type'] == 'ready'
+    ready()
+    try:
+        await go.wait()
+        for t in range(turns):
+            start = time.perf_counter()
+            await ws.send(json.dumps({'type': 'message', 'id': str(t), 'text': 'exam kal hai, bahut stress'}))
+            while True:
+                frame = json.loads(await ws.recv())
+                if frame['type'] == 'done':
+                    break
+                if frame['type'] == 'error':
+                    errors[frame['code']] = errors.get(frame['code'], 0) + 1
+                    break
+                assert frame['type'] in ('credits', 'delta'), frame
+            latencies.append(time.perf_counter() - start)
+        await go.closing.wait()
+    finally:
+        await ws.close()
+
+
+async def run_ws(server, tokens, turns, sessionless):
+    url = f"ws://127.0.0.1:{os.environ['WS_PORT']}"
+    go = asyncio.Event()
+    go.closing = asyncio.Event()
+    connected = [0]
+    all_ready = asyncio.Event()
+
+    def ready():
+        connected[0] += 1
+        if connected[0] == len(tokens):
+            all_ready.set()
+
+    latencies, errors = [], {}
+    gate = asyncio.Semaphore(200)
+    rss_idle = proc_rss(server.pid)
+    tasks = [asyncio.create_task(client(url, token, None if sessionless else i + 1, turns,
+                                        gate, ready, go, latencies, errors))
+             for i, token in enumerate(tokens)]
+    await asyncio.wait_for(all_ready.wait(), 300)
+    await asyncio.sleep(1)
+    rss_open = proc_rss(server.pid)
+
+    cpu = proc_cpu(server.pid)
+    start = time.perf_counter()
+    go.set()
+    while len(latencies) < len(tokens) * turns:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    cpu = proc_cpu(server.pid) - cpu
+    rss_busy = proc_rss(server.pid)
+    go.closing.set()
+    await asyncio.gather(*tasks)
+
+    n = len(tokens)
+    latencies.sort()
+    print(f"WebSocket, {n} connections{' (sessionless)' if sessionless else ''}: server RSS {rss_idle / 1e6:.0f} MB idle -> {rss_open / 1e6:.0f} MB "
+          f"connected ({(rss_open - rss_idle) / n / 1024:.1f} KB/connection) -> {rss_busy / 1e6:.0f} MB after turns")
+    print(f"  {n * turns} turns in {elapsed:.1f} s = {n * turns / elapsed:.0f} turns/s, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f} ms, "
+          f"server CPU {cpu / (n * turns) * 1000:.2f} ms/turn, errors {errors or 'none'}")
+
+
+def run_http(app, tokens, turns, upstream_ms):
+    import app as app_module
+    from routing import BIG_MODEL
+    app_module.complete = lambda messages, route: (REPLY, BIG_MODEL, upstream_ms)  # no sleep: CPU only
+    client = app.test_client()
+    history = []
+    cpu = time.process_time()
+    for t in range(turns):
+        i = t * 2 % len(tokens)  # odd user ids: free tier, messageHistory re-sent
+        headers = {'Authorization': f'Bearer {tokens[i]}'}
+        assert client.post('/api/credits/use', headers=headers).status_code == 200
+        response = client.post('/api/get-response', headers=headers, json={
+            'userMessage': 'exam kal hai, bahut stress', 'messageHistory': history[-6:],
+            'category': 'Academic / Exam', 'session_id': i + 1,
+        })
+        assert response.status_code == 200, response.get_json()
+        history += [{'sender': 'user', 'text': 'exam kal hai, bahut stress'}, {'sender': 'ai', 'text': REPLY}]
+    cpu = time.process_time() - cpu
+    print(f"HTTP /api/credits/use + /api/get-response: server CPU {cpu / turns * 1000:.2f} ms/turn")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the WebSocket chat channel.")
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--turns', type=int, default=3)
+    parser.add_argument('--upstream-ms', type=int, default=200)
+    parser.add_argument('--http-turns', type=int, default=300)
+    parser.add_argument('--sessionless', action='store_true', help='do not persist turns')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.upstream_ms)
+
+    app, tokens = seed(args.connections)
+    server = subprocess.Popen([sys.executable, __file__, '--serve', '--upstream-ms', str(args.upstream_ms)],
+                              env=dict(os.environ, LOG_LEVEL='WARNING'))
+    try:
+        time.sleep(3)
+        asyncio.run(run_ws(server, tokens, args.turns, args.sessionless))
+    finally:
+        server.terminate()
+        server.wait()
+    with app.app_context():
+        run_http(app, tokens, args.http_turns, args.upstream_ms)
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
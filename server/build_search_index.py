@@ -0,0 +1,60 @@
+# server/build_search_index.py
+# Build (or rebuild) the message search index for messages saved before it existed.
+# New messages are indexed incrementally by _save_message, so without --rebuild
+# only messages older than the first indexed one are backfilled.
+# Usage: python build_search_index.py [--rebuild] [--batch-size 2000]
+
+import argparse
+import time
+from collections import Counter
+from sqlalchemy import select
+from app import app
+from models import db, SearchPosting, SearchStats, TherapyMessage, TherapySession
+from search import index_messages
+
+
+def build(batch_size, rebuild):
+    SearchPosting.__table__.create(db.engine, checkfirst=True)
+    SearchStats.__table__.create(db.engine, checkfirst=True)
+
+    if rebuild:
+        db.session.query(SearchPosting).delete()
+        db.session.query(SearchStats).delete()
+        db.session.commit()
+        print("🧹 Cleared existing index.")
+
+    first_indexed = db.session.query(db.func.min(SearchPosting.message_id)).scalar()
+    doc_counts = Counter()
+    last_id = total = 0
+    start = time.perf_counter()
+
+    while True:
+        rows = db.session.execute(
+            select(TherapyMessage.id, TherapySession.user_id, TherapyMessage.message_text)
+            .join(TherapySession, TherapySession.id == TherapyMessage.session_id)
+            .where(TherapyMessage.id > last_id, TherapyMessage.id < (first_indexed or 2 ** 31))
+            .order_by(TherapyMessage.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        for _, user_id, _ in rows:
+            doc_counts[user_id] += 1
+        index_messages([(user_id, message_id, text) for message_id, user_id, text in rows])
+        db.session.commit()
+        total += len(rows)
+        print(f"   ... {total} messages indexed")
+
+    print(f"✅ Indexed {sum(doc_counts.values())} messages for {len(doc_counts)} users "
+          f"in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the message search index.")
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--rebuild', action='store_true', help='drop and rebuild the whole index')
+    args = parser.parse_args()
+
+    with app.app_context():
+        build(args.batch_size, args.rebuild)
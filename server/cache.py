@@ -0,0 +1,185 @@
+# server/cache.py
+# Two-tier cache for read endpoints: a per-process LRU in front of a local
+# SQLite file shared by every worker on the host (same approach as
+# ratelimit.py), so a value computed by one gunicorn worker is a hit for the
+# others.
+#
+# Values are bytes (usually an already-serialized JSON body). Keys are
+# namespaced like "user:42:dashboard"; invalidate("user:42:*") drops every
+# key with that prefix in both tiers. Other workers learn about
+# invalidations from a small log table checked on every lookup, so a write
+# on one worker is never hidden by another worker's LRU.
+
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, request, g
+from metrics import inc
+
+log = logging.getLogger('puresoul.cache')
+
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CACHE_DB = os.getenv('CACHE_DB', os.path.join('/tmp', 'puresoul-cache.db'))
+CACHE_L1_SIZE = int(os.getenv('CACHE_L1_SIZE', '1024'))
+
+LOG_RETENTION = 3600  # longer than any TTL we use
+_local = threading.local()
+_lock = threading.Lock()
+_l1 = OrderedDict()            # key -> (expires, value)
+_state = {'pid': None, 'seq': 0}
+
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        conn = sqlite3.connect(CACHE_DB, timeout=1.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")  # cache contents are disposable
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL) WITHOUT ROWID"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS invalidations "
+            "(seq INTEGER PRIMARY KEY AUTOINCREMENT, prefix TEXT NOT NULL, at REAL NOT NULL)"
+        )
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def _prefix_range(pattern):
+    prefix = pattern.rstrip('*')
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _sync(conn):
+    """Apply invalidations logged by other workers to this process's LRU."""
+    if _state['pid'] != os.getpid():  # forked: never trust the parent's LRU
+        with _lock:
+            _l1.clear()
+            _state['pid'] = os.getpid()
+            _state['seq'] = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM invalidations").fetchone()[0]
+        return
+    rows = conn.execute("SELECT seq, prefix FROM invalidations WHERE seq > ?", (_state['seq'],)).fetchall()
+    if rows:
+        with _lock:
+            for seq, prefix in rows:
+                for key in [k for k in _l1 if k.startswith(prefix)]:
+                    del _l1[key]
+                _state['seq'] = max(_state['seq'], seq)
+
+
+def get(key):
+    """Return the cached bytes for key, or None."""
+    if not CACHE_ENABLED:
+        return None
+    now = time.time()
+    conn = _connection()
+    _sync(conn)
+
+    with _lock:
+        entry = _l1.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                _l1.move_to_end(key)
+                inc('puresoul_cache_requests_total', {'tier': 'l1', 'result': 'hit'})
+                return entry[1]
+            del _l1[key]
+    inc('puresoul_cache_requests_total', {'tier': 'l1', 'result': 'miss'})
+
+    row = conn.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+    if row is None or row[1] <= now:
+        inc('puresoul_cache_requests_total', {'tier': 'l2', 'result': 'miss'})
+        return None
+    inc('puresoul_cache_requests_total', {'tier': 'l2', 'result': 'hit'})
+    _remember(key, row[0], row[1])
+    return row[0]
+
+
+def _remember(key, value, expires):
+    with _lock:
+        _l1[key] = (expires, value)
+        _l1.move_to_end(key)
+        while len(_l1) > CACHE_L1_SIZE:
+            _l1.popitem(last=False)
+
+
+def put(key, value, ttl):
+    """Store bytes under key for ttl seconds, in both tiers."""
+    if not CACHE_ENABLED:
+        return
+    now = time.time()
+    conn = _connection()
+    conn.execute(
+        "INSERT INTO entries (key, value, expires) VALUES (?, ?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+        (key, value, now + ttl),
+    )
+    if random.random() < 0.001:
+        conn.execute("DELETE FROM entries WHERE expires < ?", (now,))
+        conn.execute("DELETE FROM invalidations WHERE at < ?", (now - LOG_RETENTION,))
+    _remember(key, value, now + ttl)
+
+
+def invalidate(pattern):
+    """Drop every key starting with pattern (a trailing '*' is optional), on all workers."""
+    if not CACHE_ENABLED:
+        return
+    start, end = _prefix_range(pattern)
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM entries WHERE key >= ? AND key < ?", (start, end))
+        conn.execute("INSERT INTO invalidations (prefix, at) VALUES (?, ?)", (start, time.time()))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    with _lock:
+        for key in [k for k in _l1 if k.startswith(start)]:
+            del _l1[key]
+
+
+def invalidate_user(user_id):
+    """Drop all of a user's cached reads. Call after committing a write; never raises."""
+    _safe(invalidate, f"user:{user_id}:*")
+
+
+def _safe(op, *args):
+    try:
+        return op(*args)
+    except sqlite3.Error as e:  # cache trouble never fails a request
+        log.warning("Cache error: %s", e)
+        return None
+
+
+def user_cached(name, ttl, params=()):
+    """Route decorator: cache a user's successful JSON response as user:{id}:{name}[:args].
+
+    Only the query parameters listed in `params` (the ones the route reads)
+    are part of the key, so junk parameters cannot mint new entries. Place
+    below @token_required / @pro_required. Writes that change what the
+    route returns must call invalidate_user(user_id) after committing.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(current_user, *args, **kwargs):
+            parts = [str(v) for v in kwargs.values()] + [
+                f"{k}={request.args[k]}" for k in params if k in request.args
+            ]
+            key = ':'.join(['user', str(current_user.id), name] + parts)
+            body = None if g.get('cache_bypass') else _safe(get, key)
+            if body is not None:
+                return Response(body, mimetype='application/json')
+
+            response = current_app.make_response(f(current_user, *args, **kwargs))
+            if response.status_code == 200 and response.mimetype == 'application/json':
+                _safe(put, key, response.get_data(), ttl)
+            return response
+        return decorated
+    return decorator
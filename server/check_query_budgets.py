@@ -0,0 +1,118 @@
+# server/check_query_budgets.py
+# Catch N+1 regressions: every read endpoint declares @query_budget(n) and this
+# check fails if a request issues more SQL statements than that, or if the
+# count changes with the amount of data a user has.
+# Usage: python check_query_budgets.py   (exit code 1 on any violation)
+#
+# Runs against a throwaway SQLite database seeded with users of very
+# different history sizes; never touches the configured database.
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'query_budgets.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+os.environ['RATELIMIT_ENABLED'] = 'false'
+os.environ['CACHE_ENABLED'] = 'false'  # budgets are for the uncached path
+
+import jwt  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from app import create_app, JWT_SECRET  # noqa: E402
+from models import db, User, TherapySession, TherapyMessage  # noqa: E402
+from emotions import seed_emotions, record_emotion  # noqa: E402
+from search import index_messages  # noqa: E402
+
+# (sessions, messages per session) for each seeded user
+HISTORY_SIZES = {'tiny': (1, 2), 'medium': (12, 20), 'large': (80, 60)}
+
+# Routes that are not request/response reads: streaming, admin, infra.
+SKIP = {'/', '/metrics', '/api/export', '/api/admin/migrate'}
+QUERY_STRINGS = {'/api/pro/search': {'q': 'exam stress'}}
+
+WORDS = "exam stress sleep family job money focus tired happy worried friend".split()
+
+
+def seed():
+    db.create_all()
+    seed_emotions()
+    users = {}
+    start = datetime.utcnow() - timedelta(days=120)
+    for label, (n_sessions, per_session) in HISTORY_SIZES.items():
+        user = User(name=label, email=f'{label}@example.com', username=label, password='x', is_pro=True)
+        db.session.add(user)
+        db.session.flush()
+        items = []
+        for s in range(n_sessions):
+            started = start + timedelta(days=s)
+            session = TherapySession(user_id=user.id, session_title='Career & Jobs Session',
+                                     started_at=started, ended_at=started + timedelta(minutes=15),
+                                     is_active=False)
+            db.session.add(session)
+            db.session.flush()
+            for i in range(per_session):
+                code = [None, 2, 3, 1, 4][i % 5]
+                msg = TherapyMessage(session_id=session.id, sender='user' if i % 2 == 0 else 'ai',
+                                     message_text=' '.join(WORDS[(i + k) % len(WORDS)] for k in range(8)),
+                                     emotion_code=code, created_at=started + timedelta(seconds=i))
+                db.session.add(msg)
+                db.session.flush()
+                if code:
+                    record_emotion(user.id, code, started.date())
+                items.append((user.id, msg.id, msg.message_text))
+        index_messages(items)
+        db.session.commit()
+        first = TherapySession.query.filter_by(user_id=user.id).first()
+        users[label] = (user.id, first.id if first else 0)
+    return users
+
+
+def main():
+    app = create_app()
+    statements = []
+    failures = []
+
+    with app.app_context():
+        users = seed()
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+        client = app.test_client()
+        for rule in app.url_map.iter_rules():
+            if 'GET' not in rule.methods or rule.rule in SKIP or rule.rule.startswith('/static'):
+                continue
+            budget = getattr(app.view_functions[rule.endpoint], 'query_budget', None)
+            if budget is None:
+                failures.append(f"{rule.rule}: no @query_budget declared")
+                continue
+
+            counts = {}
+            for label, (user_id, session_id) in users.items():
+                token = jwt.encode({'id': user_id}, JWT_SECRET, algorithm='HS256')
+                url = rule.rule.replace('<int:session_id>', str(session_id))
+                statements.clear()
+                response = client.get(url, query_string=QUERY_STRINGS.get(rule.rule),
+                                      headers={'Authorization': f'Bearer {token}'})
+                counts[label] = len(statements)
+                if response.status_code >= 500:
+                    failures.append(f"{rule.rule} [{label}]: HTTP {response.status_code}")
+                if len(statements) > budget:
+                    failures.append(f"{rule.rule} [{label}]: {len(statements)} queries > budget {budget}")
+
+            scaling = len(set(counts.values())) > 1 and counts['large'] > counts['medium']
+            if scaling:
+                failures.append(f"{rule.rule}: query count grows with history size {counts}")
+            print(f"{'FAIL' if scaling or max(counts.values()) > budget else 'ok  '} "
+                  f"{rule.rule:<32} budget {budget:>3}  {counts}")
+
+    os.remove(DB_PATH)
+    if failures:
+        print("\n❌ Query budget violations:")
+        for f in failures:
+            print(f"   {f}")
+        sys.exit(1)
+    print("\n✅ All read endpoints within their query budgets.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# server/clients.py
+# Lazily-constructed upstream API clients (Groq, ElevenLabs).
+# The SDKs are imported and the clients built on first use, so importing the
+# app (gunicorn workers, maintenance scripts) never pays for them.
+
+import os
+import threading
+
+_lock = threading.Lock()
+_groq_client = None
+_async_groq_client = None
+_elevenlabs_client = None
+
+
+def get_groq_client():
+    """Return the shared Groq client, creating it on first call."""
+    global _groq_client
+    if _groq_client is None:
+        with _lock:
+            if _groq_client is None:
+                from groq import Groq
+                _groq_client = Groq(api_key=os.getenv('GROQ_API_KEY'))
+    return _groq_client
+
+
+def get_async_groq_client():
+    """Return the shared asyncio Groq client (ws_chat.py), creating it on first call."""
+    global _async_groq_client
+    if _async_groq_client is None:
+        with _lock:
+            if _async_groq_client is None:
+                from groq import AsyncGroq
+                _async_groq_client = AsyncGroq(api_key=os.getenv('GROQ_API_KEY'))
+    return _async_groq_client
+
+
+def get_elevenlabs_client():
+    """Return the shared ElevenLabs client, creating it on first call."""
+    global _elevenlabs_client
+    if _elevenlabs_client is None:
+        with _lock:
+            if _elevenlabs_client is None:
+                api_key = os.getenv('ELEVEN_API_KEY')
+                if not api_key:
+                    raise RuntimeError("ELEVEN_API_KEY is not set")
+                from elevenlabs import ElevenLabs
+                _elevenlabs_client = ElevenLabs(api_key=api_key)
+    return _elevenlabs_client
@@ -0,0 +1,169 @@
+# server/compression.py
+# Transparent at-rest compression for therapy message text.
+#
+# Stored values carry a small version tag so plain rows written before
+# compression was enabled keep loading unchanged:
+#
+#   <plain text>                      legacy / uncompressed row
+#   \x01 0 : <text>                   plain text that happens to start with \x01
+#   \x01 1 <dict id> : <base85 data>  raw deflate using a shared zlib dictionary
+#
+# The value is only stored compressed when that is actually smaller, so
+# short acknowledgements ("ok thanks") never grow.
+
+import os
+import re
+import base64
+import zlib
+from collections import Counter
+from sqlalchemy.types import TypeDecorator, Text
+
+TAG = '\x01'
+PLAIN_VERSION = '0'
+ZLIB_VERSION = '1'
+
+DICT_DIR = os.getenv('MESSAGE_DICT_DIR', os.path.join(os.path.dirname(__file__), 'dicts'))
+
+# Seed dictionary for short conversational messages. zlib favours matches
+# near the end of the dictionary, so the most common phrases go last.
+_BUILTIN_DICT = (
+    "Could you tell me more? I understand how you feel. That makes sense. "
+    "Take a deep breath. One step at a time. You are not alone in this. "
+    "It's okay to feel this way. What do you think is causing this? "
+    "How long have you been feeling like this? Have you talked to anyone about it? "
+    "exam anxiety study pressure focus career job interview workplace manager "
+    "relationship family friends breakup sleep tired exhausted health money loan "
+    "stress worried anxious overwhelmed sad lonely angry confused scared happy "
+    "Health sabse pehle hai dost. Paisa aur stress ka gehra rishta hai. "
+    "Relationship issues dil se connected hoti hain. Apne aap ko grow karna ek safar hai. "
+    "kya hua yaar, mujhe samajh nahi aa raha, bahut pressure hai, kuch samajh nahi aata "
+    "📚 ✍️ ✨ 💼 🚀 🤞 ❤️ 🤗 🤝 🏥 🧘 🌿 🌱 ⭐ 📈 🧠 🫂 🕊️ 💰 🏦 ⚓ 💛 "
+    "I don't know what to do. I feel like nothing is working. I just feel so tired all the time. "
+    "I have been feeling really anxious lately and I can't focus on anything. "
+    "It sounds like you're carrying a lot right now. What feels heaviest at the moment? "
+    "That sounds really hard, and it's completely valid to feel that way. "
+    "Main hoon na dost, sab discuss karte hain. Arre dost, tension mat lo! "
+    "I'm here to listen. Thank you for sharing this with me. "
+).encode('utf-8')
+
+_dict_cache = {}
+
+
+def dict_id(zdict: bytes) -> str:
+    """Stable 8-hex-digit identifier for a dictionary."""
+    return format(zlib.crc32(zdict) & 0xffffffff, '08x')
+
+
+BUILTIN_DICT_ID = dict_id(_BUILTIN_DICT)
+
+
+def load_dictionary(zid: str) -> bytes:
+    """Return dictionary bytes for an id (builtin or a file in DICT_DIR)."""
+    if zid == BUILTIN_DICT_ID:
+        return _BUILTIN_DICT
+    if zid not in _dict_cache:
+        path = os.path.join(DICT_DIR, f"{zid}.zdict")
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        if dict_id(data) != zid:
+            raise ValueError(f"Dictionary {path} does not match its id")
+        _dict_cache[zid] = data
+    return _dict_cache[zid]
+
+
+def save_dictionary(zdict: bytes) -> str:
+    """Write a trained dictionary to DICT_DIR and return its id."""
+    zid = dict_id(zdict)
+    os.makedirs(DICT_DIR, exist_ok=True)
+    with open(os.path.join(DICT_DIR, f"{zid}.zdict"), 'wb') as fh:
+        fh.write(zdict)
+    return zid
+
+
+def compression_enabled() -> bool:
+    return os.getenv('MESSAGE_COMPRESSION', 'off').lower() in ('zlib', 'on', '1', 'true')
+
+
+def active_dict_id() -> str:
+    return os.getenv('MESSAGE_DICT_ID') or BUILTIN_DICT_ID
+
+
+def _deflate(data: bytes, zdict: bytes) -> bytes:
+    c = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, zdict)
+    return c.compress(data) + c.flush()
+
+
+def _inflate(data: bytes, zdict: bytes) -> bytes:
+    d = zlib.decompressobj(-15, zdict)
+    return d.decompress(data) + d.flush()
+
+
+def encode_text(text, compress=None, zid=None):
+    """Encode message text for storage (compressing when enabled and smaller)."""
+    if text is None:
+        return None
+    if compress is None:
+        compress = compression_enabled()
+    if compress:
+        zid = zid or active_dict_id()
+        payload = base64.b85encode(_deflate(text.encode('utf-8'), load_dictionary(zid))).decode('ascii')
+        encoded = f"{TAG}{ZLIB_VERSION}{zid}:{payload}"
+        if len(encoded.encode('utf-8')) < len(text.encode('utf-8')):
+            return encoded
+    if text.startswith(TAG):
+        return f"{TAG}{PLAIN_VERSION}:{text}"
+    return text
+
+
+def decode_text(value):
+    """Decode a stored value back to message text. Untagged rows pass through."""
+    if value is None or not value.startswith(TAG):
+        return value
+    version = value[1:2]
+    if version == PLAIN_VERSION:
+        return value[3:]
+    if version == ZLIB_VERSION:
+        zid, payload = value[2:10], value[11:]
+        return _inflate(base64.b85decode(payload), load_dictionary(zid)).decode('utf-8')
+    raise ValueError(f"Unknown message encoding version {version!r}")
+
+
+def train_dictionary(samples, size=16 * 1024):
+    """Build a zlib preset dictionary from sample messages.
+
+    Picks the word n-grams that would save the most bytes (frequency x length)
+    and lays them out least-useful first, since deflate prefers short distances.
+    """
+    counts = Counter()
+    for text in samples:
+        words = re.findall(r'\S+', text)
+        for n in (1, 2, 3, 4, 6):
+            for i in range(len(words) - n + 1):
+                counts[' '.join(words[i:i + n])] += 1
+
+    scored = sorted(
+        ((freq * len(gram.encode('utf-8')), gram) for gram, freq in counts.items() if freq > 1),
+        reverse=True,
+    )
+    chosen, total = [], 0
+    for _, gram in scored:
+        if any(gram in c for c in chosen[-64:]):
+            continue
+        size_bytes = len(gram.encode('utf-8')) + 1
+        if total + size_bytes > size:
+            break
+        chosen.append(gram)
+        total += size_bytes
+    return ' '.join(reversed(chosen)).encode('utf-8')
+
+
+class CompressedText(TypeDecorator):
+    """Text column that compresses on write and decodes tagged values on read."""
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return encode_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decode_text(value)
@@ -0,0 +1,124 @@
+# server/conversations.py
+# Short-term memory for free-tier chats, kept on the server.
+#
+# Free users have no stored history to load (that is the Pro path), so the
+# client used to re-send messageHistory with every /api/get-response call,
+# and nothing stopped that array from growing. Instead the last
+# FREE_HISTORY_LIMIT messages of a conversation are kept here under a short
+# opaque id; the client sends only the new message plus the id it got back
+# from the previous turn. A conversation idle for CONVERSATION_TTL_SECONDS
+# is forgotten, and a user keeps at most CONVERSATIONS_PER_USER of them, so
+# the store is bounded by the number of active users.
+#
+# Storage is a local SQLite file in WAL mode shared by every worker on the
+# host (same approach as ratelimit.py and cache.py). A lost conversation -
+# expired, evicted or another host - just starts a new one; errors here
+# never fail a chat turn.
+
+import logging
+import os
+import random
+import secrets
+import sqlite3
+import threading
+import time
+from fastjson import dumps, loads
+
+log = logging.getLogger('puresoul.conversations')
+
+CONVERSATIONS_DB = os.getenv('CONVERSATIONS_DB', os.path.join('/tmp', 'puresoul-conversations.db'))
+CONVERSATION_TTL_SECONDS = int(os.getenv('CONVERSATION_TTL_SECONDS', '1800'))
+FREE_HISTORY_LIMIT = int(os.getenv('FREE_HISTORY_LIMIT', '6'))  # messages, as the client's slice(-6)
+CONVERSATIONS_PER_USER = 5
+MAX_MESSAGE_CHARS = 2000
+
+_local = threading.local()
+
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        # Chat text: owner-only file (SQLite gives -wal/-shm the same mode)
+        fd = os.open(CONVERSATIONS_DB, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            os.fchmod(fd, 0o600)
+        finally:
+            os.close(fd)
+        conn = sqlite3.connect(CONVERSATIONS_DB, timeout=1.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")  # short-term memory is disposable
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations "
+            "(id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, messages BLOB NOT NULL, expires REAL NOT NULL) "
+            "WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS conversations_user ON conversations (user_id, expires)")
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def trim(messages):
+    """The last FREE_HISTORY_LIMIT (sender, text) pairs, each text capped at MAX_MESSAGE_CHARS."""
+    return [(sender, text[:MAX_MESSAGE_CHARS]) for sender, text in messages[-FREE_HISTORY_LIMIT:]]
+
+
+def recall(conversation_id, user_id):
+    """The (sender, text) messages of a live conversation of this user, or None."""
+    if not isinstance(conversation_id, str):
+        return None
+    try:
+        row = _connection().execute(
+            "SELECT messages FROM conversations WHERE id = ? AND user_id = ? AND expires > ?",
+            (conversation_id, user_id, time.time()),
+        ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        log.warning("Conversation store error: %s", e)
+        return None
+    return [tuple(m) for m in loads(row[0])] if row else None
+
+
+def remember(conversation_id, user_id, messages):
+    """Store the tail of a conversation and restart its TTL.
+
+    Starts a new conversation when conversation_id is None. Returns the id,
+    or None if the store is unavailable.
+    """
+    now = time.time()
+    created = conversation_id is None
+    if created:
+        conversation_id = secrets.token_urlsafe(12)
+    try:
+        conn = _connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO conversations (id, user_id, messages, expires) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET messages = excluded.messages, expires = excluded.expires "
+                "WHERE conversations.user_id = excluded.user_id",
+                (conversation_id, user_id, dumps(trim(messages)), now + CONVERSATION_TTL_SECONDS),
+            )
+            if created:
+                conn.execute(
+                    "DELETE FROM conversations WHERE user_id = ? AND id NOT IN "
+                    "(SELECT id FROM conversations WHERE user_id = ? ORDER BY expires DESC LIMIT ?)",
+                    (user_id, user_id, CONVERSATIONS_PER_USER),
+                )
+            if random.random() < 0.001:
+                conn.execute("DELETE FROM conversations WHERE expires < ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    except (sqlite3.Error, OSError) as e:
+        log.warning("Conversation store error: %s", e)
+        return None
+    return conversation_id
+
+
+def forget_user(user_id):
+    """Drop every conversation of a user (history deletion). Returns the number dropped."""
+    try:
+        return _connection().execute("DELETE FROM conversations WHERE user_id = ?", (user_id,)).rowcount
+    except (sqlite3.Error, OSError) as e:
+        log.warning("Conversation store error: %s", e)
+        return 0
@@ -0,0 +1,220 @@
+# server/deletion.py
+# Set-based deletion of sessions, a user's history, whole accounts and
+# sessions past the retention age.
+#
+# Deleting through the ORM (db.session.delete(session)) loads every message
+# of the session first because of the cascade on TherapySession.messages.
+# Here everything is plain DELETE ... WHERE statements over bounded chunks of
+# primary keys, each chunk its own short transaction, so memory stays flat
+# and row locks are held for milliseconds however long the history is.
+# Derived data is kept consistent chunk by chunk: search postings and
+# search_stats.doc_count, mood_rollups counts, emotion_buckets and stored
+# transcripts. Deleting a history also drops the free-tier conversation
+# buffers (conversations.py).
+
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import select, delete, update, func, bindparam, case, or_, and_
+from models import (
+    db, User, TherapySession, TherapyMessage, SearchPosting, SearchStats, MoodRollup,
+    EmotionBucket, SessionTranscript, IdempotencyKey, RefreshFamily,
+)
+from cache import invalidate_user
+from conversations import forget_user
+
+DELETE_CHUNK = int(os.getenv('DELETE_CHUNK', '2000'))
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '0'))  # 0 keeps sessions forever
+
+
+def _noop():
+    pass
+
+
+def _delete_messages(user_id, rows, stats):
+    """Delete one chunk of a user's messages (id, created_at, emotion_code) and what derives from them."""
+    ids = [r[0] for r in rows]
+    indexed = db.session.execute(
+        select(func.count(func.distinct(SearchPosting.message_id)))
+        .where(SearchPosting.message_id.in_(ids))
+    ).scalar()
+    if indexed:
+        stats['search_postings'] += db.session.execute(
+            delete(SearchPosting).where(SearchPosting.message_id.in_(ids))
+        ).rowcount
+        db.session.execute(
+            update(SearchStats).where(SearchStats.user_id == user_id)
+            .values(doc_count=case((SearchStats.doc_count > indexed, SearchStats.doc_count - indexed), else_=0))
+        )
+
+    rollups = Counter((created_at.date(), code) for _, created_at, code in rows
+                      if code is not None and created_at is not None)
+    if rollups:
+        table = MoodRollup.__table__
+        db.session.execute(
+            update(table)
+            .where(table.c.user_id == user_id, table.c.day == bindparam('b_day'),
+                   table.c.emotion_code == bindparam('b_code'))
+            .values(count=table.c.count - bindparam('b_n')),
+            [{'b_day': day, 'b_code': code, 'b_n': n} for (day, code), n in rollups.items()],
+        )
+        stats['mood_rollups'] += db.session.execute(
+            delete(MoodRollup).where(MoodRollup.user_id == user_id, MoodRollup.count <= 0)
+        ).rowcount
+
+    stats['therapy_messages'] += db.session.execute(
+        delete(TherapyMessage).where(TherapyMessage.id.in_(ids))
+    ).rowcount
+    db.session.commit()
+
+
+def _delete_buckets(session_id, stats, on_chunk):
+    while True:
+        starts = db.session.execute(
+            select(EmotionBucket.bucket_start).where(EmotionBucket.session_id == session_id)
+            .order_by(EmotionBucket.bucket_start).limit(DELETE_CHUNK)
+        ).scalars().all()
+        if not starts:
+            return
+        stats['emotion_buckets'] += db.session.execute(
+            delete(EmotionBucket).where(EmotionBucket.session_id == session_id,
+                                        EmotionBucket.bucket_start <= starts[-1])
+        ).rowcount
+        db.session.commit()
+        on_chunk()
+
+
+def delete_sessions(sessions, stats=None, on_chunk=_noop):
+    """Delete sessions given as (session_id, user_id) pairs, with all their data.
+
+    Returns a Counter of rows deleted per table. `on_chunk` runs after every
+    committed chunk (the retention job renews its lease there).
+    """
+    stats = Counter() if stats is None else stats
+    users = set()
+    for session_id, user_id in sessions:
+        users.add(user_id)
+        while True:
+            rows = db.session.execute(
+                select(TherapyMessage.id, TherapyMessage.created_at, TherapyMessage.emotion_code)
+                .where(TherapyMessage.session_id == session_id)
+                .order_by(TherapyMessage.id).limit(DELETE_CHUNK)
+            ).all()
+            if not rows:
+                break
+            _delete_messages(user_id, rows, stats)
+            on_chunk()
+        _delete_buckets(session_id, stats, on_chunk)
+        stats['session_transcripts'] += db.session.execute(
+            delete(SessionTranscript).where(SessionTranscript.session_id == session_id)
+        ).rowcount
+        stats['therapy_sessions'] += db.session.execute(
+            delete(TherapySession).where(TherapySession.id == session_id)
+        ).rowcount
+        db.session.commit()
+    for user_id in users:
+        invalidate_user(user_id)
+    return stats
+
+
+def _user_sessions(user_id):
+    return [(session_id, user_id) for session_id in db.session.execute(
+        select(TherapySession.id).where(TherapySession.user_id == user_id).order_by(TherapySession.id)
+    ).scalars()]
+
+
+def delete_history(user_id, on_chunk=_noop):
+    """Delete every session of a user. The account itself stays."""
+    stats = delete_sessions(_user_sessions(user_id), on_chunk=on_chunk)
+    # stored Idempotency-Key responses hold AI replies
+    stats['idempotency_keys'] += db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id)
+    ).rowcount
+    db.session.commit()
+    stats['conversations'] += forget_user(user_id)  # free-tier short-term memory
+    return stats
+
+
+def delete_account(user_id, on_chunk=_noop):
+    """Delete a user's history and then the account and everything keyed by it."""
+    stats = delete_history(user_id, on_chunk=on_chunk)
+    for model in (SearchPosting, SearchStats, MoodRollup, RefreshFamily):
+        stats[model.__tablename__] += db.session.execute(
+            delete(model).where(model.user_id == user_id)
+        ).rowcount
+    stats['users'] += db.session.execute(delete(User).where(User.id == user_id)).rowcount
+    db.session.commit()
+    invalidate_user(user_id)
+    return stats
+
+
+def _expired_sessions(cutoff):
+    """Ended sessions last active before cutoff, in id-ordered pages."""
+    last_active = func.coalesce(TherapySession.ended_at, TherapySession.started_at)
+    after = 0
+    while True:
+        page = db.session.execute(
+            select(TherapySession.id, TherapySession.user_id)
+            .where(TherapySession.id > after,
+                   or_(TherapySession.is_active.is_(False), TherapySession.is_active.is_(None)),
+                   and_(last_active.is_not(None), last_active < cutoff))
+            .order_by(TherapySession.id).limit(DELETE_CHUNK)
+        ).all()
+        if not page:
+            return
+        yield from page
+        after = page[-1][0]
+
+
+def purge_expired(days=None, on_chunk=_noop):
+    """Delete ended sessions older than `days` (RETENTION_DAYS by default)."""
+    days = RETENTION_DAYS if days is None else days
+    if days <= 0:
+        return Counter()
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    return delete_sessions(_expired_sessions(cutoff), on_chunk=on_chunk)
+
+
+def init_deletion(app):
+    """Register the admin deletion commands."""
+
+    def report(stats, start):
+        elapsed = time.perf_counter() - start
+        total = sum(stats.values())
+        print(f"✅ Deleted {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/s)")
+        for table, n in sorted(stats.items()):
+            if n:
+                print(f"   {table:<20} {n}")
+
+    @app.cli.command('delete-session')
+    @click.argument('session_id', type=int)
+    def delete_session_command(session_id):
+        """Delete one session with its messages and derived data."""
+        user_id = db.session.execute(
+            select(TherapySession.user_id).where(TherapySession.id == session_id)
+        ).scalar()
+        if user_id is None:
+            print(f"❌ Session {session_id} not found.")
+            return
+        start = time.perf_counter()
+        report(delete_sessions([(session_id, user_id)]), start)
+
+    @app.cli.command('delete-history')
+    @click.argument('user_id', type=int)
+    @click.option('--account', is_flag=True, help='Also delete the account itself.')
+    def delete_history_command(user_id, account):
+        """Delete all of a user's sessions (and with --account, the user)."""
+        start = time.perf_counter()
+        report(delete_account(user_id) if account else delete_history(user_id), start)
+
+    @app.cli.command('purge-expired')
+    @click.option('--days', type=int, default=None, help='Default: RETENTION_DAYS.')
+    def purge_expired_command(days):
+        """Delete ended sessions older than the retention age."""
+        if (RETENTION_DAYS if days is None else days) <= 0:
+            print("❌ Set RETENTION_DAYS or pass --days.")
+            return
+        start = time.perf_counter()
+        report(purge_expired(days), start)
@@ -0,0 +1,166 @@
+# server/emotions.py
+# Small-integer emotion codes and the per-user daily mood rollups built from them.
+
+from datetime import date, timedelta
+from sqlalchemy.exc import IntegrityError
+from models import db, Emotion, MoodRollup
+
+# Codes for the labels the frontend detectors emit. get_emotion_code assigns
+# other labels the next free code (the legacy backfill in migrate_emotions.py);
+# request paths only look labels up with known_emotion_code, so clients
+# cannot grow the table.
+SEED_EMOTIONS = {
+    1: 'neutral',
+    2: 'happy',
+    3: 'sad',
+    4: 'angry',
+    5: 'fear',
+    6: 'surprised',
+    7: 'disgust',
+}
+
+REGISTER_ATTEMPTS = 5
+
+# Other spellings the detectors use for seeded labels (emotionDetection.js,
+# faceDetection.js vs mediapipeDetection.js).
+LABEL_ALIASES = {'surprise': 'surprised', 'fearful': 'fear', 'disgusted': 'disgust'}
+
+_labels = dict(SEED_EMOTIONS)
+_codes = {label: code for code, label in SEED_EMOTIONS.items()}
+
+
+def _refresh():
+    for code, label in db.session.query(Emotion.id, Emotion.label).all():
+        _labels[code] = label
+        _codes[label] = code
+
+
+def seed_emotions():
+    """Insert any missing seed rows into the lookup table."""
+    existing = {code for (code,) in db.session.query(Emotion.id).all()}
+    for code, label in SEED_EMOTIONS.items():
+        if code not in existing:
+            db.session.add(Emotion(id=code, label=label))
+    db.session.commit()
+
+
+def emotion_label(code):
+    """Map a stored code back to the exact label it was created from."""
+    if code is None:
+        return None
+    if code not in _labels:
+        _refresh()
+    return _labels.get(code)
+
+
+def emotion_labels():
+    """Every registered code -> label, read fresh from the lookup table."""
+    _refresh()
+    return dict(_labels)
+
+
+def canonical_label(label):
+    """Lower-cased label with detector aliases resolved ('fearful' -> 'fear')."""
+    label = label.strip().lower()
+    return LABEL_ALIASES.get(label, label)
+
+
+def known_emotion_code(label):
+    """Return the code for an already registered label, or None. Never registers."""
+    if label not in _codes:
+        _refresh()
+    return _codes.get(label)
+
+
+def get_emotion_code(label):
+    """Return the code for a label, registering new labels on first use.
+
+    Returns None if the label could not be registered (code allocation
+    kept racing with other workers).
+    """
+    if not label:
+        return None
+    label = label.strip()[:50]
+    if label in _codes:
+        return _codes[label]
+
+    for _ in range(REGISTER_ATTEMPTS):
+        _refresh()
+        if label in _codes:
+            return _codes[label]
+        try:
+            with db.session.begin_nested():
+                next_code = (db.session.query(db.func.max(Emotion.id)).scalar() or 0) + 1
+                db.session.add(Emotion(id=next_code, label=label))
+        except IntegrityError:
+            pass  # another worker registered this label, or took next_code for another one
+    _refresh()
+    return _codes.get(label)
+
+
+def record_emotion(user_id, code, day=None):
+    """Increment the (user, day, emotion) rollup in the caller's transaction."""
+    day = day or date.today()
+    match = MoodRollup.query.filter_by(user_id=user_id, day=day, emotion_code=code)
+    if match.update({'count': MoodRollup.count + 1}, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(MoodRollup(user_id=user_id, day=day, emotion_code=code, count=1))
+    except IntegrityError:
+        match.update({'count': MoodRollup.count + 1}, synchronize_session=False)
+
+
+def emotion_totals(user_id):
+    """Lower-cased label -> message count over a user's whole history."""
+    rows = db.session.query(
+        MoodRollup.emotion_code, db.func.sum(MoodRollup.count)
+    ).filter_by(user_id=user_id).group_by(MoodRollup.emotion_code).all()
+
+    counts = {}
+    for code, total in rows:
+        name = emotion_label(code).lower()
+        counts[name] = counts.get(name, 0) + int(total)
+    return counts
+
+
+def wellness_score(counts):
+    """Happy counts double, neutral/surprised single, out of total x 2."""
+    positive = counts.get('happy', 0)
+    neutral = counts.get('neutral', 0) + counts.get('surprised', 0)
+    total = sum(counts.values())
+    return round(((positive * 2 + neutral) / (total * 2)) * 100) if total > 0 else 0
+
+
+def bucket_start(day, period):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def mood_trend(user_id, period='day', since=None):
+    """Bucketed emotion counts for a user, read straight from the rollups."""
+    query = db.session.query(
+        MoodRollup.day, MoodRollup.emotion_code, MoodRollup.count
+    ).filter(MoodRollup.user_id == user_id)
+    if since:
+        query = query.filter(MoodRollup.day >= since)
+
+    buckets = {}
+    for day, code, count in query.order_by(MoodRollup.day).all():
+        key = bucket_start(day, period)
+        name = emotion_label(code).lower()
+        counts = buckets.setdefault(key, {})
+        counts[name] = counts.get(name, 0) + count
+
+    return [
+        {
+            'bucket': key.isoformat(),
+            'counts': counts,
+            'total': sum(counts.values()),
+            'wellness_score': wellness_score(counts),
+        }
+        for key, counts in sorted(buckets.items())
+    ]
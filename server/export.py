@@ -0,0 +1,116 @@
+# server/export.py
+# Constant-memory export of a user's full session/message history.
+# Rows are streamed from a server-side cursor and encoded chunk by chunk,
+# so worker memory does not depend on how much history the user has.
+
+import csv
+import io
+import json
+import zlib
+from sqlalchemy import select
+from models import db, TherapySession, TherapyMessage
+from emotions import emotion_labels
+
+FETCH_SIZE = 1000
+FLUSH_BYTES = 64 * 1024
+
+CSV_COLUMNS = [
+    'session_id', 'session_title', 'started_at', 'ended_at', 'is_active',
+    'message_id', 'sender', 'message_text', 'emotion_detected', 'created_at',
+]
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def iter_history(user_id):
+    """Yield one dict per message (or per empty session), oldest session first."""
+    # Read up front: no other query may run on the connection while the
+    # server-side cursor is open (MySQL: "commands out of sync").
+    labels = emotion_labels()
+    stmt = (
+        select(
+            TherapySession.id, TherapySession.session_title, TherapySession.started_at,
+            TherapySession.ended_at, TherapySession.is_active,
+            TherapyMessage.id, TherapyMessage.sender, TherapyMessage.message_text,
+            TherapyMessage.emotion_code, TherapyMessage.created_at,
+        )
+        .outerjoin(TherapyMessage, TherapyMessage.session_id == TherapySession.id)
+        .where(TherapySession.user_id == user_id)
+        .order_by(TherapySession.id, TherapyMessage.id)
+        .execution_options(stream_results=True, yield_per=FETCH_SIZE)
+    )
+    for row in db.session.execute(stmt):
+        yield {
+            'session_id': row[0],
+            'session_title': row[1],
+            'started_at': _iso(row[2]),
+            'ended_at': _iso(row[3]),
+            'is_active': row[4],
+            'message_id': row[5],
+            'sender': row[6],
+            'message_text': row[7],
+            'emotion_detected': labels.get(row[8]),
+            'created_at': _iso(row[9]),
+        }
+
+
+def ndjson_lines(rows):
+    """A `session` record when the session changes, then its `message` records."""
+    current = None
+    for r in rows:
+        if r['session_id'] != current:
+            current = r['session_id']
+            yield json.dumps({
+                'type': 'session',
+                'id': r['session_id'],
+                'session_title': r['session_title'],
+                'started_at': r['started_at'],
+                'ended_at': r['ended_at'],
+                'is_active': r['is_active'],
+            }, ensure_ascii=False) + '\n'
+        if r['message_id'] is not None:
+            yield json.dumps({
+                'type': 'message',
+                'id': r['message_id'],
+                'session_id': r['session_id'],
+                'sender': r['sender'],
+                'message_text': r['message_text'],
+                'emotion_detected': r['emotion_detected'],
+                'created_at': r['created_at'],
+            }, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows):
+    """One CSV row per message, with the session columns repeated."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    for r in rows:
+        writer.writerow(r)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def encode_chunks(lines, use_gzip=False):
+    """Batch text lines into ~64 KB byte chunks, optionally gzip-compressed."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+    pending, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            chunk = b''.join(pending)
+            pending, size = [], 0
+            out = compressor.compress(chunk) if compressor else chunk
+            if out:
+                yield out
+    chunk = b''.join(pending)
+    if compressor:
+        yield compressor.compress(chunk) + compressor.flush()
+    elif chunk:
+        yield chunk
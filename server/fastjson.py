@@ -0,0 +1,41 @@
+# server/fastjson.py
+# JSON responses for the large read endpoints (transcripts, session lists),
+# and the encoding of small stored blobs (conversations.py, search.py).
+#
+# Uses orjson when installed: it serializes datetimes natively (ISO 8601,
+# same output as .isoformat()) and is several times faster than the stdlib
+# encoder behind jsonify. Falls back to json with a datetime default.
+
+import json
+from datetime import date, datetime
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """Serialize to UTF-8 JSON bytes; datetimes become ISO strings."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def loads(data):
+    """Parse JSON from bytes or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_response(payload, status=200):
+    """Drop-in for `jsonify(payload), status` on hot read paths."""
+    return Response(dumps(payload), status=status, mimetype='application/json')
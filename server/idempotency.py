@@ -0,0 +1,162 @@
+# server/idempotency.py
+# Idempotency-Key support for expensive POST routes.
+#
+# The first request with a given (user, route, key) claims a row in
+# idempotency_keys and runs. A retry that arrives while it is running
+# waits for it (on an in-process Event when the original is in the same
+# worker, by polling the row otherwise) and gets the same response; a
+# retry after it finished gets the stored response back without running
+# the route again. Only 2xx responses are stored - after a failure the key
+# is released so the client's retry runs for real. A worker that dies
+# mid-request lets its lease expire and the next retry takes over.
+# Stored keys expire after IDEMPOTENCY_TTL_SECONDS (see jobs.py).
+
+import hashlib
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, make_response, Response
+from sqlalchemy import update, delete, or_, and_
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey
+from metrics import inc
+
+log = logging.getLogger('puresoul.idempotency')
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '60'))
+LEASE_SECONDS = 120  # longer than any Groq call; a holder past this is presumed dead
+POLL_SECONDS = 0.1
+KEY_RE = re.compile(r'^[\x21-\x7e]{1,255}$')
+
+_inflight = {}  # (user_id, scope, key) -> Event, for requests running in this process
+_lock = threading.Lock()
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def _claim(user_id, scope, key, fingerprint, owner):
+    """Insert the key, or take it over if it expired or its holder died. True if we own it."""
+    now = datetime.utcnow()
+    values = dict(fingerprint=fingerprint, owner=owner, lease_until=now + timedelta(seconds=LEASE_SECONDS),
+                  status_code=None, content_type=None, body=None,
+                  expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS))
+    try:
+        with db.session.begin_nested():
+            db.session.execute(IdempotencyKey.__table__.insert()
+                               .values(user_id=user_id, scope=scope, key=key, **values))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        pass
+    result = db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.scope == scope, IdempotencyKey.key == key,
+               or_(IdempotencyKey.expires_at < now,
+                   and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.lease_until < now)))
+        .values(**values)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _load(user_id, scope, key):
+    db.session.rollback()  # end the transaction so we see other workers' commits
+    return db.session.get(IdempotencyKey, (user_id, scope, key), populate_existing=True)
+
+
+def _replay(row):
+    inc('puresoul_idempotency_requests_total', {'scope': row.scope, 'result': 'replayed'})
+    response = Response(row.body, status=row.status_code, content_type=row.content_type)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _finish(user_id, scope, key, owner, response):
+    match = (IdempotencyKey.user_id == user_id, IdempotencyKey.scope == scope,
+             IdempotencyKey.key == key, IdempotencyKey.owner == owner)
+    if 200 <= response.status_code < 300:
+        db.session.execute(
+            update(IdempotencyKey).where(*match)
+            .values(owner=None, lease_until=None, status_code=response.status_code,
+                    content_type=response.content_type, body=response.get_data(as_text=True))
+        )
+    else:
+        db.session.execute(delete(IdempotencyKey).where(*match))
+    db.session.commit()
+
+
+def idempotent(scope):
+    """Route decorator honouring an Idempotency-Key header. Place directly below @token_required."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(current_user, *args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if key is None:
+                return f(current_user, *args, **kwargs)
+            if not KEY_RE.match(key):
+                return jsonify({'message': 'Idempotency-Key must be 1-255 printable ASCII characters.'}), 400
+
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            ident = (current_user.id, scope, key)
+            owner = _owner()
+            deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+
+            while True:
+                if _claim(*ident, fingerprint, owner):
+                    break
+                row = _load(*ident)
+                if row is None:  # released after a failure; try to claim it again
+                    continue
+                if row.fingerprint != fingerprint:
+                    return jsonify({'message': 'Idempotency-Key was already used for a different request.'}), 422
+                if row.status_code is not None:
+                    return _replay(row)
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    inc('puresoul_idempotency_requests_total', {'scope': scope, 'result': 'conflict'})
+                    response = jsonify({'message': 'A request with this Idempotency-Key is still in progress.'})
+                    response.headers['Retry-After'] = '1'
+                    return response, 409
+                event = _inflight.get(ident)
+                if event is not None:
+                    event.wait(remaining)
+                else:
+                    time.sleep(min(POLL_SECONDS, remaining))
+
+            inc('puresoul_idempotency_requests_total', {'scope': scope, 'result': 'executed'})
+            event = threading.Event()
+            with _lock:
+                _inflight[ident] = event
+            response = None
+            try:
+                response = make_response(f(current_user, *args, **kwargs))
+                return response
+            finally:
+                try:
+                    _finish(*ident, owner, response if response is not None else Response(status=500))
+                except Exception:
+                    db.session.rollback()
+                    log.exception("Idempotency store error")
+                with _lock:
+                    _inflight.pop(ident, None)
+                event.set()
+        return decorated
+    return decorator
+
+
+def expire_keys(now=None):
+    """Delete stored keys past their TTL. Returns the number removed."""
+    result = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at < (now or datetime.utcnow()))
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,201 @@
+# server/import_users.py
+# Bulk-create user accounts for a partner organization.
+# Usage:
+#   python import_users.py users.csv                    # columns: name,email,username,password
+#   python import_users.py users.ndjson --errors rejected.csv
+#   python import_users.py users.csv --dry-run          # validate and report only, no hashing or writes
+#
+# Rows get the same checks as /api/register (validation.py, lower-cased
+# email and username, no existing account with either). Existing accounts
+# are found with one IN query per column per batch instead of a lookup per
+# row, bcrypt hashing runs on a process pool, and each batch is a single
+# multi-row INSERT and commit. Rejected rows are written to --errors as
+# CSV (line, email, username, error) and the run continues.
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from validation import validate_email, validate_username, validate_password
+
+BCRYPT_ROUNDS = 10  # same cost as register()
+IN_CHUNK = 1000
+
+
+def read_rows(path, fmt):
+    """Yield (line_number, dict) from a CSV file with a header row or an NDJSON file."""
+    with open(path, newline='', encoding='utf-8') as fh:
+        if fmt == 'csv':
+            reader = csv.DictReader(fh)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_no, line in enumerate(fh, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_no, {'_error': f'Invalid JSON: {e}'}
+                    continue
+                yield line_no, row if isinstance(row, dict) else {'_error': 'Expected a JSON object'}
+
+
+def check_row(row):
+    """register()'s validation. Returns (normalized dict, None) or (None, error message)."""
+    if '_error' in row:
+        return None, row['_error']
+    values = {k: row.get(k) for k in ('name', 'email', 'username', 'password')}
+    if not all(isinstance(v, str) for v in values.values()):
+        return None, 'name, email, username and password are required strings'
+    name, email, username = values['name'].strip(), values['email'].strip(), values['username'].strip()
+    password = values['password']
+
+    username_errors = validate_username(username)
+    if username_errors:
+        return None, ', '.join(username_errors)
+    if not validate_email(email):
+        return None, 'Invalid email format.'
+    password_errors = validate_password(password)
+    if password_errors:
+        return None, ', '.join(password_errors)
+    return {'name': name, 'email': email.lower(), 'username': username.lower(), 'password': password}, None
+
+
+def existing_values(column, values):
+    """Subset of values already present in users.<column>, via chunked IN queries."""
+    from models import db
+    found = set()
+    values = list(values)
+    for i in range(0, len(values), IN_CHUNK):
+        found.update(db.session.execute(
+            select(column).where(column.in_(values[i:i + IN_CHUNK]))
+        ).scalars())
+    return found
+
+
+def hash_password(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+
+class Importer:
+    def __init__(self, pool, dry_run, errors):
+        self.pool, self.dry_run, self.errors = pool, dry_run, errors
+        self.seen_emails, self.seen_usernames = set(), set()
+        self.created = self.rejected = 0
+        self.timings = {'validate': 0.0, 'lookup': 0.0, 'hash': 0.0, 'insert': 0.0}
+
+    def reject(self, line_no, row, error):
+        self.rejected += 1
+        self.errors.writerow([line_no, row.get('email', ''), row.get('username', ''), error])
+
+    def run_batch(self, batch):
+        from models import db, User
+        start = time.perf_counter()
+        valid = []
+        for line_no, row in batch:
+            user, error = check_row(row)
+            if error:
+                self.reject(line_no, row, error)
+            elif user['email'] in self.seen_emails:
+                self.reject(line_no, row, 'Duplicate email earlier in the file.')
+            elif user['username'] in self.seen_usernames:
+                self.reject(line_no, row, 'Duplicate username earlier in the file.')
+            else:
+                self.seen_emails.add(user['email'])
+                self.seen_usernames.add(user['username'])
+                valid.append((line_no, user))
+        self.timings['validate'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        taken_emails = existing_values(User.email, (u['email'] for _, u in valid))
+        taken_usernames = existing_values(User.username, (u['username'] for _, u in valid))
+        fresh = []
+        for line_no, user in valid:
+            if user['email'] in taken_emails or user['username'] in taken_usernames:
+                self.reject(line_no, user, 'User with this email or username already exists.')
+            else:
+                fresh.append((line_no, user))
+        self.timings['lookup'] += time.perf_counter() - start
+        if self.dry_run:
+            self.created += len(fresh)
+            return
+        if not fresh:
+            return
+
+        start = time.perf_counter()
+        hashes = self.pool.map(hash_password, (u['password'] for _, u in fresh), chunksize=32)
+        for (_, user), hashed in zip(fresh, hashes):
+            user['password'] = hashed
+        self.timings['hash'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        table = User.__table__
+        try:
+            db.session.execute(table.insert(), [user for _, user in fresh])
+            db.session.commit()
+            self.created += len(fresh)
+        except IntegrityError:  # someone registered one of these meanwhile; find which
+            db.session.rollback()
+            for line_no, user in fresh:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(table.insert(), user)
+                    self.created += 1
+                except IntegrityError:
+                    self.reject(line_no, user, 'User with this email or username already exists.')
+            db.session.commit()
+        self.timings['insert'] += time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-create user accounts from CSV or NDJSON.")
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=('csv', 'ndjson'), help='default: from the file extension')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='bcrypt processes')
+    parser.add_argument('--errors', help='write rejected rows here as CSV (default: stderr)')
+    parser.add_argument('--dry-run', action='store_true', help='validate and check duplicates only')
+    args = parser.parse_args()
+
+    fmt = args.format or ('ndjson' if args.path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    errors_fh = open(args.errors, 'w', newline='', encoding='utf-8') if args.errors else sys.stderr
+    errors = csv.writer(errors_fh)
+    errors.writerow(['line', 'email', 'username', 'error'])
+
+    # spawn: hashing workers import only this module, not the app and its connections
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        from app import app
+        with app.app_context():
+            importer = Importer(pool, args.dry_run, errors)
+            start = time.perf_counter()
+            batch, total = [], 0
+            for line_no, row in read_rows(args.path, fmt):
+                batch.append((line_no, row))
+                if len(batch) >= args.batch_size:
+                    importer.run_batch(batch)
+                    total += len(batch)
+                    batch = []
+                    print(f"   ... {total} rows read, {importer.created} created, {importer.rejected} rejected")
+            if batch:
+                importer.run_batch(batch)
+                total += len(batch)
+
+    elapsed = time.perf_counter() - start
+    if args.errors:
+        errors_fh.close()
+    verb = 'would be created' if args.dry_run else 'created'
+    print(f"✅ {total} rows in {elapsed:.1f}s: {importer.created} {verb}, {importer.rejected} rejected "
+          f"({total / elapsed if elapsed else 0:.0f} rows/s, {args.workers} hashing workers)")
+    print("   " + ", ".join(f"{k} {v:.1f}s" for k, v in importer.timings.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# server/jobs.py
+# Scheduled jobs (see scheduler.py). Importing this module registers them.
+
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func, exists, bindparam, and_
+from models import db, TherapySession, TherapyMessage
+from scheduler import job
+from cache import invalidate_user
+from idempotency import expire_keys
+from auth_tokens import expire_families
+from deletion import RETENTION_DAYS, purge_expired
+
+SESSION_IDLE_MINUTES = int(os.getenv('SESSION_IDLE_MINUTES', '30'))
+REAP_CHUNK = 500
+
+
+@job('reap-idle-sessions', every=300, lease=120)
+def reap_idle_sessions(lease, idle_minutes=None):
+    """Close active sessions with no message for SESSION_IDLE_MINUTES.
+
+    ended_at is set to the session's last activity (its newest message, or
+    started_at if it has none) so durations reflect the real conversation.
+    Works in id-ordered chunks, one short transaction each.
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=idle_minutes or SESSION_IDLE_MINUTES)
+    sessions = TherapySession.__table__
+    messages = TherapyMessage.__table__
+    last_activity = func.coalesce(func.max(messages.c.created_at), sessions.c.started_at)
+    recent_message = exists().where(
+        messages.c.session_id == sessions.c.id, messages.c.created_at >= cutoff
+    )
+    close = (
+        update(sessions)
+        .where(sessions.c.id == bindparam('b_id'), sessions.c.is_active.is_(True), ~recent_message)
+        .values(is_active=False, ended_at=bindparam('b_ended_at'))
+    )
+
+    closed, after = 0, 0
+    while True:
+        chunk = db.session.execute(
+            select(sessions.c.id, sessions.c.user_id, last_activity)
+            .select_from(sessions.outerjoin(messages, messages.c.session_id == sessions.c.id))
+            .where(and_(sessions.c.is_active.is_(True), sessions.c.id > after))
+            .group_by(sessions.c.id, sessions.c.user_id, sessions.c.started_at)
+            .order_by(sessions.c.id)
+            .limit(REAP_CHUNK)
+        ).all()
+        if not chunk:
+            break
+        after = chunk[-1][0]
+
+        idle = [(session_id, user_id, last or cutoff) for session_id, user_id, last in chunk
+                if last is None or last < cutoff]
+        if idle:
+            # the NOT EXISTS guard skips sessions that got a message since the select
+            closed += db.session.execute(close, [{'b_id': i, 'b_ended_at': t} for i, _, t in idle]).rowcount
+            db.session.commit()
+            for user_id in {u for _, u, _ in idle}:
+                invalidate_user(user_id)
+        lease.renew()
+
+    return f"closed {closed} idle sessions"
+
+
+@job('expire-idempotency-keys', every=3600, lease=300)
+def expire_idempotency_keys(lease):
+    """Drop stored Idempotency-Key responses past IDEMPOTENCY_TTL_SECONDS."""
+    return f"expired {expire_keys()} idempotency keys"
+
+
+@job('expire-refresh-tokens', every=86400, lease=300)
+def expire_refresh_tokens(lease):
+    """Drop refresh-token families that were not used for REFRESH_TOKEN_DAYS."""
+    return f"expired {expire_families()} refresh token families"
+
+
+if RETENTION_DAYS > 0:
+    @job('purge-expired-sessions', every=86400, lease=600)
+    def purge_expired_sessions(lease):
+        """Delete ended sessions older than RETENTION_DAYS, renewing the lease between chunks."""
+        stats = purge_expired(on_chunk=lease.renew)
+        return f"deleted {stats['therapy_sessions']} sessions, {stats['therapy_messages']} messages"
@@ -0,0 +1,103 @@
+# server/memory.py
+# Cross-session memory for Dost: pulls the most relevant snippets from a
+# user's earlier sessions into the prompt, under a fixed token budget.
+#
+# Retrieval is TF-IDF over the per-user search index (search_postings), so it
+# runs entirely locally. The index is fed off the request path by the
+# background indexer in search.py.
+
+import heapq
+import math
+import os
+from datetime import datetime
+from collections import defaultdict
+from models import db, SearchPosting, SearchStats, TherapyMessage, TherapySession
+from search import tokenize, K1
+
+MEMORY_TOKEN_BUDGET = int(os.getenv('MEMORY_TOKEN_BUDGET', 400))
+MEMORY_TOP_K = 6
+MAX_QUERY_TERMS = 8
+MAX_POSTINGS_PER_TERM = 2000  # most recent postings per term; bounds latency on huge histories
+SNIPPET_CHARS = 300
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) for budgeting."""
+    return len(text) // 4 + 1
+
+
+def retrieve_memories(user_id, text, exclude_session_id=None,
+                      k=MEMORY_TOP_K, token_budget=MEMORY_TOKEN_BUDGET):
+    """Return up to k past messages most similar to `text`, within token_budget."""
+    terms = list(dict.fromkeys(tokenize(text)))
+    if not terms or token_budget <= 0:
+        return []
+
+    df = dict(db.session.query(SearchPosting.term, db.func.count()).filter(
+        SearchPosting.user_id == user_id, SearchPosting.term.in_(terms)
+    ).group_by(SearchPosting.term).all())
+    if not df:
+        return []
+    n_docs = db.session.query(SearchStats.doc_count).filter_by(user_id=user_id).scalar() or max(df.values())
+
+    # Keep the most informative terms; words in over half the history carry no signal.
+    idf = {t: max(0.0, math.log((n_docs - d + 0.5) / (d + 0.5))) for t, d in df.items()}
+    idf = dict(heapq.nlargest(MAX_QUERY_TERMS, ((t, w) for t, w in idf.items() if w > 0), key=lambda x: x[1]))
+
+    scores = defaultdict(float)
+    for term, weight in idf.items():
+        rows = db.session.query(SearchPosting.message_id, SearchPosting.tf).filter(
+            SearchPosting.user_id == user_id, SearchPosting.term == term
+        ).order_by(SearchPosting.message_id.desc()).limit(MAX_POSTINGS_PER_TERM).all()
+        for message_id, tf in rows:
+            scores[message_id] += weight * tf * (K1 + 1) / (tf + K1)
+    if exclude_session_id:
+        # Drop the current conversation before ranking, so it cannot crowd out earlier sessions.
+        for (message_id,) in db.session.query(TherapyMessage.id).filter(
+            TherapyMessage.session_id == exclude_session_id
+        ):
+            scores.pop(message_id, None)
+    if not scores:
+        return []
+
+    top = heapq.nlargest(k * 3, scores.items(), key=lambda x: (x[1], x[0]))
+    query = db.session.query(
+        TherapyMessage.id, TherapyMessage.sender, TherapyMessage.message_text,
+        TherapyMessage.created_at, TherapySession.session_title,
+    ).join(TherapySession, TherapySession.id == TherapyMessage.session_id).filter(
+        TherapyMessage.id.in_([m for m, _ in top]),
+        TherapySession.user_id == user_id,
+    )
+    if exclude_session_id:
+        query = query.filter(TherapyMessage.session_id != exclude_session_id)
+    by_id = {r[0]: r for r in query.all()}
+
+    memories, used = [], 0
+    for message_id, _ in top:
+        r = by_id.get(message_id)
+        if r is None:
+            continue
+        snippet = r[2] if len(r[2]) <= SNIPPET_CHARS else r[2][:SNIPPET_CHARS] + '…'
+        cost = estimate_tokens(snippet) + 12  # + date/category prefix
+        if used + cost > token_budget:
+            continue
+        used += cost
+        memories.append({
+            'sender': r[1],
+            'text': snippet,
+            'created_at': r[3],
+            'category': (r[4] or 'Mental Health Session').replace(' Session', '').strip(),
+        })
+        if len(memories) >= k:
+            break
+    return memories
+
+
+def format_memories(memories):
+    """Render retrieved memories as a system message for the LLM."""
+    lines = ["Relevant moments from this user's previous sessions (use naturally, don't list them):"]
+    for m in sorted(memories, key=lambda m: m['created_at'] or datetime.min):
+        when = m['created_at'].strftime('%b %d') if m['created_at'] else 'earlier'
+        who = 'User' if m['sender'] == 'user' else 'You (Dost)'
+        lines.append(f"- {when}, {m['category']}: {who} said: {m['text']}")
+    return '\n'.join(lines)
@@ -0,0 +1,319 @@
+# server/metrics.py
+# Prometheus-style instrumentation: per-route latency and status codes, SQL
+# statement counts/time per request (SQLAlchemy engine events) and upstream
+# (Groq / ElevenLabs) call timings, served on /metrics.
+#
+# Each worker aggregates in memory and periodically writes a snapshot to
+# METRICS_DIR/<pid>-<random>.json (the suffix keeps a reused pid from
+# overwriting a dead worker's file); /metrics sums every snapshot, so the
+# numbers cover all gunicorn workers on the host. Snapshots of exited
+# workers are folded into retired.json, so counters never go backwards and
+# the directory does not grow with every restart. /metrics requires
+# METRICS_TOKEN and is closed while it is unset.
+
+import fcntl
+import glob
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request, has_request_context, current_app, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger('puresoul.metrics')
+
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join('/tmp', 'puresoul-metrics'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+FLUSH_INTERVAL = 5.0
+STALE_AFTER = 300.0  # seconds without a write before an exited worker's snapshot is retired
+RETIRED = 'retired.json'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+HELP = {
+    'puresoul_http_requests_total': ('counter', 'HTTP requests by route, method and status.'),
+    'puresoul_http_request_duration_seconds': ('histogram', 'Request latency by route.'),
+    'puresoul_db_queries_total': ('counter', 'SQL statements executed, by route.'),
+    'puresoul_db_query_duration_seconds_total': ('counter', 'Time spent in SQL statements, by route.'),
+    'puresoul_db_queries_per_request': ('histogram', 'SQL statements per request, by route.'),
+    'puresoul_upstream_duration_seconds': ('histogram', 'Upstream API call latency.'),
+    'puresoul_upstream_errors_total': ('counter', 'Failed upstream API calls.'),
+    'puresoul_transcript_views_total': ('counter', 'Ended-session transcript views by cache result and encoding.'),
+    'puresoul_cache_requests_total': ('counter', 'Cache lookups by tier (l1 = per-process LRU, l2 = shared file) and result.'),
+    'puresoul_log_records_dropped_total': ('counter', 'Log records dropped because the log queue was full.'),
+    'puresoul_query_budget_exceeded_total': ('counter', 'Requests that issued more SQL statements than their route allows.'),
+    'puresoul_telemetry_readings_total': ('counter', 'Camera emotion readings accepted by /api/telemetry/emotions.'),
+    'puresoul_model_routes_total': ('counter', 'Chat turns routed to each model, by routing reason.'),
+    'puresoul_model_fallbacks_total': ('counter', 'Fast-model replies replaced by the big model, by cause.'),
+    'puresoul_ws_connections_total': ('counter', 'Authenticated WebSocket chat connections (ws_chat.py).'),
+    'puresoul_ws_turns_total': ('counter', 'WebSocket chat turns by result.'),
+    'puresoul_idempotency_requests_total': ('counter', 'Requests with an Idempotency-Key: executed, replayed or conflict (still running).'),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_state = {'pid': None}
+
+
+def inc(name, labels, value=1.0):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def observe(name, labels, value, buckets=LATENCY_BUCKETS):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(h['buckets']):
+            if value <= bound:
+                h['counts'][i] += 1
+                break
+        h['sum'] += value
+        h['count'] += 1
+
+
+def query_budget(max_queries):
+    """Route decorator: declare the most SQL statements one request may issue.
+
+    The budget must not depend on how much data the user has. Exceeding it
+    is counted in production and fails check_query_budgets.py.
+    """
+    def decorator(f):
+        f.query_budget = max_queries
+        return f
+    return decorator
+
+
+# ── Per-request SQL accounting ──
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        context._query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start', None)
+    if start is None or not has_request_context():
+        return
+    elapsed = time.perf_counter() - start
+    g.db_query_count = g.get('db_query_count', 0) + 1
+    g.db_query_time = g.get('db_query_time', 0.0) + elapsed
+    if g.get('capture_sql') is not None:
+        g.capture_sql.append((statement, elapsed))
+
+
+@contextmanager
+def timed_upstream(service, operation):
+    """Time one upstream API call (and record it on the request for profiling)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc('puresoul_upstream_errors_total', {'service': service, 'operation': operation})
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('puresoul_upstream_duration_seconds', {'service': service, 'operation': operation}, elapsed)
+        if has_request_context():
+            g.setdefault('upstream_calls', []).append((service, operation, elapsed))
+
+
+# ── Snapshot files shared between workers ──
+
+def _as_snapshot(counters, histograms):
+    return {
+        'counters': [[n, list(l), v] for (n, l), v in counters.items()],
+        'histograms': [[n, list(l), dict(h, counts=list(h['counts']))] for (n, l), h in histograms.items()],
+    }
+
+
+def _snapshot():
+    with _lock:
+        return _as_snapshot(_counters, _histograms)
+
+
+def _write(path, snapshot):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as fh:
+        json.dump(snapshot, fh)
+    os.replace(tmp, path)
+
+
+def _read(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(snap, counters, histograms):
+    """Add one snapshot into the (name, labels)-keyed totals."""
+    for name, labels, value in snap['counters']:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0.0) + value
+    for name, labels, h in snap['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        merged = histograms.setdefault(key, {'buckets': h['buckets'], 'counts': [0] * len(h['counts']), 'sum': 0.0, 'count': 0})
+        merged['counts'] = [a + b for a, b in zip(merged['counts'], h['counts'])]
+        merged['sum'] += h['sum']
+        merged['count'] += h['count']
+
+
+def flush():
+    if _state.get('file_pid') != os.getpid():
+        _state['file_pid'], _state['file'] = os.getpid(), f"{os.getpid()}-{secrets.token_hex(4)}.json"
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _write(os.path.join(METRICS_DIR, _state['file']), _snapshot())
+
+
+def _exited(path, now):
+    if os.path.basename(path) == RETIRED or now - os.path.getmtime(path) < STALE_AFTER:
+        return False
+    try:
+        os.kill(int(os.path.basename(path).split('-')[0].split('.')[0]), 0)
+    except ProcessLookupError:
+        return True
+    except (OSError, ValueError):
+        pass
+    return False
+
+
+def _retire_stale():
+    """Fold snapshots of exited processes into retired.json and delete them."""
+    now = time.time()
+    stale = [p for p in glob.glob(os.path.join(METRICS_DIR, '*.json')) if _exited(p, now)]
+    if not stale:
+        return
+    with open(os.path.join(METRICS_DIR, 'retired.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # one worker at a time rewrites retired.json
+        counters, histograms = {}, {}
+        retired = _read(os.path.join(METRICS_DIR, RETIRED))
+        if retired is not None:
+            _merge(retired, counters, histograms)
+        for path in stale:
+            snap = _read(path) if os.path.exists(path) else None  # another worker may have retired it
+            if snap is not None:
+                _merge(snap, counters, histograms)
+        _write(os.path.join(METRICS_DIR, RETIRED), _as_snapshot(counters, histograms))
+        for path in stale:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError as e:
+            log.warning("Metrics flush error: %s", e)
+
+
+def _ensure_flusher():
+    if _state['pid'] != os.getpid():
+        with _lock:
+            if _state['pid'] != os.getpid():
+                if _state['pid'] is not None:  # forked child: start from zero
+                    _counters.clear()
+                    _histograms.clear()
+                _state['pid'] = os.getpid()
+                threading.Thread(target=_flush_loop, daemon=True).start()
+
+
+def _escape(value):
+    """Label value escaping of the Prometheus text format: backslash, quote, newline."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels, extra=None):
+    items = list(labels) + (extra or [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def render():
+    """Merge every worker's snapshot and render the Prometheus text format."""
+    flush()
+    try:
+        _retire_stale()
+    except OSError as e:
+        log.warning("Metrics retire error: %s", e)
+    counters, histograms = {}, {}
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        snap = _read(path)
+        if snap is not None:
+            _merge(snap, counters, histograms)
+
+    lines = []
+    for name, (kind, help_text) in HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'counter':
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{_labels_text(labels)} {value:g}")
+        else:
+            for (n, labels), h in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(h['buckets'], h['counts']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels_text(labels, [('le', f'{bound:g}')])} {cumulative}")
+                lines.append(f"{name}_bucket{_labels_text(labels, [('le', '+Inf')])} {h['count']}")
+                lines.append(f"{name}_sum{_labels_text(labels)} {h['sum']:g}")
+                lines.append(f"{name}_count{_labels_text(labels)} {h['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    """Install request hooks and the /metrics endpoint on the app."""
+
+    @app.before_request
+    def _start_timer():
+        _ensure_flusher()
+        g.request_start = time.perf_counter()
+        g.db_query_count = 0
+        g.db_query_time = 0.0
+
+    @app.after_request
+    def _record(response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        if route == '/metrics':
+            return response
+        elapsed = time.perf_counter() - start
+        inc('puresoul_http_requests_total', {'route': route, 'method': request.method, 'status': str(response.status_code)})
+        observe('puresoul_http_request_duration_seconds', {'route': route}, elapsed)
+        inc('puresoul_db_queries_total', {'route': route}, g.db_query_count)
+        inc('puresoul_db_query_duration_seconds_total', {'route': route}, g.db_query_time)
+        observe('puresoul_db_queries_per_request', {'route': route}, g.db_query_count, QUERY_COUNT_BUCKETS)
+
+        budget = getattr(current_app.view_functions.get(request.endpoint), 'query_budget', None)
+        if budget is not None and g.db_query_count > budget:
+            inc('puresoul_query_budget_exceeded_total', {'route': route})
+            log.warning("Query budget exceeded on %s: %d > %d", route, g.db_query_count, budget)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        if not METRICS_TOKEN or request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+            return Response('forbidden\n', status=403, mimetype='text/plain')
+        return Response(render(), mimetype='text/plain; version=0.0.4')
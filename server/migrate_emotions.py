@@ -0,0 +1,78 @@
+# server/migrate_emotions.py
+# Run once to move therapy_messages.emotion_detected (free-form string) to
+# small-integer emotion codes and build the daily mood rollups.
+# Usage: python migrate_emotions.py
+#
+# Every distinct existing string gets its own code, so the mapping is lossless.
+# The old emotion_detected column is left in place (no longer written) and can
+# be dropped once the backfill has been checked.
+
+from sqlalchemy import inspect, select, func
+from app import app
+from models import db, Emotion, MoodRollup, TherapySession, TherapyMessage
+from emotions import seed_emotions, get_emotion_code
+
+BATCH_SIZE = 5000
+
+
+def run_migration():
+    with app.app_context():
+        print("🔄 Starting emotion code migration...")
+
+        # ── 1. Lookup + rollup tables ──
+        Emotion.__table__.create(db.engine, checkfirst=True)
+        MoodRollup.__table__.create(db.engine, checkfirst=True)
+        seed_emotions()
+        print("✅ 'emotions' and 'mood_rollups' tables ready.")
+
+        # ── 2. emotion_code column on therapy_messages ──
+        columns = [c['name'] for c in inspect(db.engine).get_columns('therapy_messages')]
+        if 'emotion_code' not in columns:
+            db.session.execute(db.text("ALTER TABLE therapy_messages ADD COLUMN emotion_code SMALLINT"))
+            db.session.commit()
+            print("✅ Added 'emotion_code' column to 'therapy_messages'.")
+        else:
+            print("ℹ️  'emotion_code' column already exists — skipping.")
+
+        # ── 3. Backfill codes from the legacy strings, in id-range chunks ──
+        if 'emotion_detected' in columns:
+            labels = db.session.execute(db.text(
+                "SELECT DISTINCT emotion_detected FROM therapy_messages WHERE emotion_detected IS NOT NULL"
+            )).scalars().all()
+            for label in labels:
+                get_emotion_code(label)
+            db.session.commit()
+            print(f"✅ Registered {len(labels)} distinct emotion strings.")
+
+            max_id = db.session.query(func.max(TherapyMessage.id)).scalar() or 0
+            for low in range(0, max_id + 1, BATCH_SIZE):
+                db.session.execute(db.text("""
+                    UPDATE therapy_messages
+                    SET emotion_code = (SELECT id FROM emotions WHERE emotions.label = therapy_messages.emotion_detected)
+                    WHERE id > :low AND id <= :high
+                      AND emotion_detected IS NOT NULL AND emotion_code IS NULL
+                """), {'low': low, 'high': low + BATCH_SIZE})
+                db.session.commit()
+            print("✅ Backfilled 'emotion_code'.")
+
+        # ── 4. Rebuild the rollups from scratch ──
+        db.session.query(MoodRollup).delete()
+        day = func.date(TherapyMessage.created_at)
+        rollup = (
+            select(TherapySession.user_id, day, TherapyMessage.emotion_code, func.count())
+            .join(TherapySession, TherapySession.id == TherapyMessage.session_id)
+            .where(TherapyMessage.emotion_code.isnot(None))
+            .group_by(TherapySession.user_id, day, TherapyMessage.emotion_code)
+        )
+        db.session.execute(MoodRollup.__table__.insert().from_select(
+            ['user_id', 'day', 'emotion_code', 'count'], rollup
+        ))
+        db.session.commit()
+        rows = db.session.query(func.count()).select_from(MoodRollup).scalar()
+        print(f"✅ Built {rows} mood rollup rows.")
+
+        print("\n🎉 Migration complete! Restart your Flask server.")
+
+
+if __name__ == '__main__':
+    run_migration()
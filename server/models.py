@@ -1,6 +1,7 @@
 # server/models.py
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from compression import CompressedText
 
 db = SQLAlchemy()
 
@@ -55,12 +56,19 @@ class TherapyMessage(db.Model):
     __tablename__ = 'therapy_messages'
 
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.Integer, db.ForeignKey('therapy_sessions.id'), nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('therapy_sessions.id'), nullable=False, index=True)
     sender = db.Column(db.String(10), nullable=False)  # 'user' or 'ai'
-    message_text = db.Column(db.Text, nullable=False)
-    emotion_detected = db.Column(db.String(50), nullable=True)
+    message_text = db.Column(CompressedText, nullable=False)  # zlib-compressed when MESSAGE_COMPRESSION=zlib
+    emotion_code = db.Column(db.SmallInteger, db.ForeignKey('emotions.id'), nullable=True)
+    model = db.Column(db.String(50), nullable=True)        # AI messages: model that answered
+    latency_ms = db.Column(db.Integer, nullable=True)      # AI messages: upstream time incl. fallback
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    @property
+    def emotion_detected(self):
+        from emotions import emotion_label
+        return emotion_label(self.emotion_code)
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -72,6 +80,117 @@ class TherapyMessage(db.Model):
         }
 
 
+class Emotion(db.Model):
+    __tablename__ = 'emotions'
+
+    id = db.Column(db.SmallInteger, primary_key=True)
+    label = db.Column(db.String(50), unique=True, nullable=False)  # exact string as detected
+
+
+class MoodRollup(db.Model):
+    """Per-user daily emotion counts, maintained as messages are saved."""
+    __tablename__ = 'mood_rollups'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    emotion_code = db.Column(db.SmallInteger, db.ForeignKey('emotions.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class EmotionBucket(db.Model):
+    """Camera emotion readings downsampled per session into fixed time buckets."""
+    __tablename__ = 'emotion_buckets'
+
+    session_id = db.Column(db.Integer, db.ForeignKey('therapy_sessions.id'), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    emotion_code = db.Column(db.SmallInteger, db.ForeignKey('emotions.id'), primary_key=True)
+    readings = db.Column(db.Integer, nullable=False, default=0)
+    confidence_sum = db.Column(db.Integer, nullable=False, default=0)  # percent points
+
+
+class SearchPosting(db.Model):
+    """Inverted index for per-user message search: one row per (user, term, message)."""
+    __tablename__ = 'search_postings'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    term = db.Column(db.String(40), primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('therapy_messages.id'), primary_key=True, index=True)
+    tf = db.Column(db.SmallInteger, nullable=False, default=1)
+
+
+class SearchStats(db.Model):
+    """Number of indexed messages per user (the N in idf)."""
+    __tablename__ = 'search_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    doc_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CohortSummary(db.Model):
+    """Nightly cohort-wide metrics written by cohort_analytics.py (long format)."""
+    __tablename__ = 'cohort_summaries'
+
+    run_date = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(50), primary_key=True)      # e.g. 'wellness_score', 'emotion_mix'
+    dimension = db.Column(db.String(100), primary_key=True)  # 'all', 'histogram' or 'category:<name>'
+    key = db.Column(db.String(50), primary_key=True)         # e.g. 'p50', '40-49', 'happy'
+    value = db.Column(db.Float, nullable=False)
+
+
+class SessionTranscript(db.Model):
+    """Pre-rendered, pre-compressed JSON transcript of an ended session."""
+    __tablename__ = 'session_transcripts'
+
+    session_id = db.Column(db.Integer, db.ForeignKey('therapy_sessions.id'), primary_key=True)
+    etag = db.Column(db.String(64), nullable=False)        # sha256 of the uncompressed body
+    size = db.Column(db.Integer, nullable=False)           # uncompressed bytes
+    body_gzip = db.Column(db.LargeBinary, nullable=False)
+    body_br = db.Column(db.LargeBinary, nullable=True)     # only when brotli is installed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class JobLease(db.Model):
+    """One row per scheduled job: who holds it, until when, and how the last run went."""
+    __tablename__ = 'job_leases'
+
+    name = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(100), nullable=True)          # host:pid:thread of the current holder
+    lease_until = db.Column(db.DateTime, nullable=True)
+    last_started_at = db.Column(db.DateTime, nullable=True)
+    last_finished_at = db.Column(db.DateTime, nullable=True)
+    last_status = db.Column(db.String(20), nullable=True)     # 'ok', 'error' or 'lost'
+    last_result = db.Column(db.String(255), nullable=True)
+
+
+class IdempotencyKey(db.Model):
+    """A client-supplied Idempotency-Key: in flight (owner/lease_until) or its stored response."""
+    __tablename__ = 'idempotency_keys'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    scope = db.Column(db.String(50), primary_key=True)        # route, e.g. 'get-response'
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)    # sha256 of the request body
+    owner = db.Column(db.String(100), nullable=True)          # host:pid:thread while running
+    lease_until = db.Column(db.DateTime, nullable=True)
+    status_code = db.Column(db.SmallInteger, nullable=True)   # set once the response is stored
+    content_type = db.Column(db.String(100), nullable=True)
+    body = db.Column(db.Text, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class RefreshFamily(db.Model):
+    """One row per login: the current generation of its rotating refresh token."""
+    __tablename__ = 'refresh_families'
+
+    id = db.Column(db.String(32), primary_key=True)           # random, part of the token
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False)       # slides forward on every refresh
+    revoked_at = db.Column(db.DateTime, nullable=True)        # logout or reuse detected
+
+
 class ContactUs(db.Model):
     __tablename__ = 'contactus'
 
@@ -0,0 +1,151 @@
+# server/profiling.py
+# Opt-in per-request profiling for "it's slow for me" reports that only
+# reproduce on one user's data.
+#
+# A request is profiled when it carries a valid signed X-Profile header
+# (mint one with `flask --app app profile-token`) or is picked by
+# PROFILE_SAMPLE_RATE. The request runs under cProfile; the stats are
+# written to PROFILE_DIR together with every SQL statement it issued and
+# its upstream (Groq / ElevenLabs) call timings. The directory is capped at
+# PROFILE_DIR_MAX_MB, oldest profiles first out.
+#
+# With no PROFILE_SECRET and a zero sample rate no hooks are installed at
+# all, so there is no per-request cost.
+
+import cProfile
+import glob
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from datetime import datetime
+import click
+from flask import g, request
+
+log = logging.getLogger('puresoul.profiling')
+
+PROFILE_SECRET = os.getenv('PROFILE_SECRET')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join('/tmp', 'puresoul-profiles'))
+PROFILE_DIR_MAX_MB = float(os.getenv('PROFILE_DIR_MAX_MB', '100'))
+HEADER = 'X-Profile'
+TOP_FUNCTIONS = 40
+
+
+def sign(expires):
+    return hmac.new(PROFILE_SECRET.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+
+
+def make_token(minutes):
+    """Header value valid for `minutes`: '<unix expiry>.<hmac>'."""
+    expires = int(time.time()) + minutes * 60
+    return f"{expires}.{sign(expires)}"
+
+
+def _valid_token(value):
+    if not PROFILE_SECRET or not value or '.' not in value:
+        return False
+    expires, signature = value.split('.', 1)
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, sign(int(expires)))
+
+
+def _rotate():
+    files = sorted(glob.glob(os.path.join(PROFILE_DIR, '*')), key=os.path.getmtime)
+    total = sum(os.path.getsize(f) for f in files)
+    limit = PROFILE_DIR_MAX_MB * 1024 * 1024
+    while files and total > limit:
+        oldest = files.pop(0)
+        total -= os.path.getsize(oldest)
+        os.remove(oldest)
+
+
+def _write(profiler, response, elapsed):
+    profile_id = g.profile_id
+    route = request.url_rule.rule if request.url_rule else request.path
+    slug = re.sub(r'[^a-z0-9]+', '-', route.lower()).strip('-')
+    stem = os.path.join(PROFILE_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S}-{slug}-{profile_id}")
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(f"{stem}.prof")
+
+    top = io.StringIO()
+    pstats.Stats(profiler, stream=top).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    sql = g.get('capture_sql') or []
+    with open(f"{stem}.json", 'w') as fh:
+        json.dump({
+            'id': profile_id,
+            'trigger': g.profile_trigger,
+            'method': request.method,
+            'route': route,
+            'user_id': g.get('user_id'),
+            'status': response.status_code if response is not None else None,
+            'duration_ms': round(elapsed * 1000, 2),
+            'sql_count': len(sql),
+            'sql_ms': round(sum(t for _, t in sql) * 1000, 2),
+            'sql': [{'ms': round(t * 1000, 3), 'statement': stmt} for stmt, t in sql],
+            'upstream': [
+                {'service': s, 'operation': op, 'ms': round(t * 1000, 2)}
+                for s, op, t in g.get('upstream_calls', [])
+            ],
+            'top_functions': top.getvalue(),
+        }, fh, indent=2)
+    _rotate()
+    return stem
+
+
+def init_profiling(app):
+    """Install the profiling hooks, only if profiling can ever trigger."""
+
+    @app.cli.command('profile-token')
+    @click.option('--minutes', default=15, show_default=True)
+    def profile_token(minutes):
+        """Print an X-Profile header value signed with PROFILE_SECRET."""
+        if not PROFILE_SECRET:
+            print("❌ PROFILE_SECRET is not set.")
+            return
+        print(f"{HEADER}: {make_token(minutes)}")
+
+    if not PROFILE_SECRET and PROFILE_SAMPLE_RATE <= 0:
+        return
+
+    @app.before_request
+    def _start_profile():
+        if _valid_token(request.headers.get(HEADER)):
+            g.profile_trigger = 'header'
+            g.cache_bypass = True  # profile the real work, not a cache hit
+        elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            g.profile_trigger = 'sample'
+        else:
+            return
+        g.profile_id = uuid.uuid4().hex[:12]
+        g.capture_sql = []
+        g.profile_start = time.perf_counter()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    @app.after_request
+    def _stop_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        try:
+            _write(profiler, response, time.perf_counter() - g.profile_start)
+            response.headers['X-Profile-Id'] = g.profile_id
+        except Exception:
+            log.exception("Profile write error")
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(exc):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:  # unhandled exception: after_request never ran
+            profiler.disable()
@@ -0,0 +1,138 @@
+# server/ratelimit.py
+# Token-bucket rate limiting shared across gunicorn workers.
+#
+# Bucket state lives in a small local SQLite database in WAL mode, so every
+# worker process on the host sees the same buckets without a network hop.
+# Each check is one short IMMEDIATE transaction on a WITHOUT ROWID table,
+# covering all buckets of the policy.
+
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import request, jsonify
+from models import User
+
+log = logging.getLogger('puresoul.ratelimit')
+
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATELIMIT_DB = os.getenv('RATELIMIT_DB', os.path.join('/tmp', 'puresoul-ratelimit.db'))
+RATELIMIT_TRUST_PROXY = os.getenv('RATELIMIT_TRUST_PROXY', 'false').lower() in ('1', 'true', 'yes')
+
+# policy -> [(scope, tokens per second, burst capacity)]
+POLICIES = {
+    'login':          [('ip', 10 / 60, 10)],             # bcrypt check per attempt
+    'register':       [('ip', 5 / 60, 5)],               # bcrypt hash per attempt
+    'refresh':        [('ip', 60 / 60, 60)],             # no bcrypt; tokens are HMAC-signed
+    'get-response':   [('user', 20 / 60, 10), ('ip', 60 / 60, 30)],
+    'text-to-speech': [('ip', 20 / 60, 10)],             # unauthenticated, ElevenLabs quota
+    'telemetry':      [('user', 60 / 60, 30)],           # batches, not readings
+}
+
+STALE_AFTER = 24 * 3600
+_local = threading.local()
+
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        conn = sqlite3.connect(RATELIMIT_DB, timeout=1.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")  # limiter state is disposable
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) WITHOUT ROWID"
+        )
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def take(key, rate, capacity, cost=1.0, now=None):
+    """Try to take `cost` tokens from a bucket. Returns (allowed, retry_after_seconds)."""
+    return take_all([(key, rate, capacity)], cost, now)
+
+
+def take_all(buckets, cost=1.0, now=None):
+    """Take `cost` tokens from every (key, rate, capacity) bucket, or from none.
+
+    Returns (allowed, retry_after_seconds). A request rejected by one bucket
+    leaves the others untouched, so it is not charged against them.
+    """
+    now = time.time() if now is None else now
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        levels, retry_after = [], 0.0
+        for key, rate, capacity in buckets:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            if tokens < cost:
+                retry_after = max(retry_after, (cost - tokens) / rate)
+            levels.append((key, tokens))
+        allowed = retry_after == 0.0
+        if allowed:
+            conn.executemany(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                [(key, tokens - cost, now) for key, tokens in levels],
+            )
+        if random.random() < 0.001:
+            conn.execute("DELETE FROM buckets WHERE updated < ?", (now - STALE_AFTER,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return allowed, retry_after
+
+
+def client_ip():
+    if RATELIMIT_TRUST_PROXY and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or 'unknown'
+
+
+def check(policy, user_id=None, ip=None):
+    """Apply every bucket of a policy. Returns seconds to wait, or 0 if allowed.
+
+    Tokens are taken only when every bucket allows the request. `ip`
+    defaults to the current request's client address.
+    """
+    buckets = [
+        (f"{policy}:{scope}:{user_id if scope == 'user' else (ip or client_ip())}", rate, capacity)
+        for scope, rate, capacity in POLICIES[policy]
+        if scope != 'user' or user_id is not None
+    ]
+    return take_all(buckets)[1]
+
+
+def rate_limit(policy):
+    """Route decorator. Place below @token_required to also get per-user buckets."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not RATELIMIT_ENABLED:
+                return f(*args, **kwargs)
+
+            user = args[0] if args and isinstance(args[0], User) else None
+            try:
+                retry_after = check(policy, user.id if user else None)
+            except Exception as e:
+                log.warning("Rate limiter error (failing open): %s", e)
+                retry_after = 0
+
+            if retry_after:
+                seconds = max(1, math.ceil(retry_after))
+                response = jsonify({
+                    'message': 'Too many requests. Please slow down.',
+                    'retry_after': seconds,
+                })
+                response.headers['Retry-After'] = str(seconds)
+                return response, 429
+
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
@@ -0,0 +1,115 @@
+# server/reencode_messages.py
+# Bulk (re-)encode therapy_messages.message_text with the current compression settings.
+# Usage:
+#   python reencode_messages.py --train 50000        # train a dictionary from a sample, print its id
+#   python reencode_messages.py --stats              # measure storage saved and decode cost, no writes
+#   python reencode_messages.py                      # rewrite rows (set MESSAGE_COMPRESSION / MESSAGE_DICT_ID first)
+#   python reencode_messages.py --decompress         # rewrite every row back to plain text
+
+import argparse
+import time
+from sqlalchemy import text
+from app import app
+from models import db
+from compression import (
+    encode_text, decode_text, train_dictionary, save_dictionary,
+    compression_enabled, active_dict_id,
+)
+
+SELECT_CHUNK = text(
+    "SELECT id, message_text FROM therapy_messages WHERE id > :last_id ORDER BY id LIMIT :limit"
+)
+UPDATE_ROW = text("UPDATE therapy_messages SET message_text = :value WHERE id = :id")
+
+
+def iter_chunks(batch_size):
+    """Yield lists of (id, stored_value) using keyset pagination on the primary key."""
+    last_id = 0
+    while True:
+        rows = db.session.execute(SELECT_CHUNK, {'last_id': last_id, 'limit': batch_size}).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def train(sample_size, batch_size):
+    samples = []
+    for rows in iter_chunks(batch_size):
+        samples.extend(decode_text(v) for _, v in rows)
+        if len(samples) >= sample_size:
+            break
+    zdict = train_dictionary(samples[:sample_size])
+    zid = save_dictionary(zdict)
+    print(f"✅ Trained {len(zdict)} byte dictionary from {len(samples[:sample_size])} messages.")
+    print(f"   Set MESSAGE_DICT_ID={zid} to use it.")
+
+
+def stats(batch_size):
+    rows_seen = stored_bytes = plain_bytes = encoded_bytes = 0
+    decode_time = 0.0
+    for rows in iter_chunks(batch_size):
+        for _, value in rows:
+            start = time.perf_counter()
+            plain = decode_text(value)
+            decode_time += time.perf_counter() - start
+            encoded = encode_text(plain, compress=True)
+            rows_seen += 1
+            stored_bytes += len(value.encode('utf-8'))
+            plain_bytes += len(plain.encode('utf-8'))
+            encoded_bytes += len(encoded.encode('utf-8'))
+
+    if not rows_seen:
+        print("No messages found.")
+        return
+
+    # Decode cost for the compressed form, i.e. what the read paths would pay after re-encoding.
+    compressed_decode = 0.0
+    for rows in iter_chunks(batch_size):
+        for _, value in rows:
+            encoded = encode_text(decode_text(value), compress=True)
+            start = time.perf_counter()
+            decode_text(encoded)
+            compressed_decode += time.perf_counter() - start
+
+    print(f"📊 {rows_seen} messages, dictionary {active_dict_id()}")
+    print(f"   plain text:    {plain_bytes:>12} bytes")
+    print(f"   stored now:    {stored_bytes:>12} bytes")
+    print(f"   compressed:    {encoded_bytes:>12} bytes ({100 - encoded_bytes * 100 // plain_bytes}% saved)")
+    print(f"   decode (now):  {decode_time * 1e6 / rows_seen:.2f} µs/message")
+    print(f"   decode (zlib): {compressed_decode * 1e6 / rows_seen:.2f} µs/message")
+
+
+def reencode(batch_size, compress):
+    changed = total = 0
+    start = time.perf_counter()
+    for rows in iter_chunks(batch_size):
+        updates = []
+        for msg_id, value in rows:
+            new_value = encode_text(decode_text(value), compress=compress)
+            if new_value != value:
+                updates.append({'id': msg_id, 'value': new_value})
+        if updates:
+            db.session.execute(UPDATE_ROW, updates)
+        db.session.commit()
+        total += len(rows)
+        changed += len(updates)
+        print(f"   ... {total} rows scanned, {changed} rewritten")
+    print(f"✅ Re-encoded {changed}/{total} messages in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Re-encode stored message text.")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--train', type=int, metavar='N', help='train a dictionary from N messages')
+    parser.add_argument('--stats', action='store_true', help='report sizes and decode cost only')
+    parser.add_argument('--decompress', action='store_true', help='store every row as plain text')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.train:
+            train(args.train, args.batch_size)
+        elif args.stats:
+            stats(args.batch_size)
+        else:
+            reencode(args.batch_size, compress=False if args.decompress else compression_enabled())
@@ -0,0 +1,210 @@
+# server/routing.py
+# Per-turn model choice for /api/get-response.
+#
+# Short, low-stakes turns ("ok thanks", "theek hai", "good night") go to a
+# small fast model; everything else - and anything that looks like a crisis,
+# the opening turn of a session, a reply to a question Dost just asked (a
+# bare "haan" or "no" there can carry the whole conversation), anything but
+# an acknowledgement from a user the camera sees as sad, afraid, angry or
+# disgusted, or a turn the router is unsure about - goes to the big model. The decision uses only
+# cheap local features (message length, category, emotion, position in the
+# session) plus the latency each model has recently shown in this process
+# against its SLO:
+#   - fast model over its SLO: it is not buying us anything, use the big one
+#   - big model over its SLO: route borderline turns to the fast model too
+# A failed, timed-out or empty fast-model reply falls back to the big model.
+# complete() is the blocking call used by /api/get-response; stream_complete()
+# is the asyncio streaming version used by the WebSocket channel (ws_chat.py).
+# The model that answered and the latency are stored on the AI message
+# (therapy_messages.model / latency_ms) so the thresholds can be tuned.
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque, namedtuple
+from clients import get_groq_client, get_async_groq_client
+from emotions import canonical_label
+from metrics import inc, timed_upstream
+
+log = logging.getLogger('puresoul.routing')
+
+ROUTING_ENABLED = os.getenv('MODEL_ROUTING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+BIG_MODEL = os.getenv('GROQ_MODEL', 'llama-3.3-70b-versatile')
+FAST_MODEL = os.getenv('GROQ_FAST_MODEL', 'llama-3.1-8b-instant')
+MIN_CONFIDENCE = float(os.getenv('ROUTING_MIN_CONFIDENCE', '0.75'))
+SLO_MS = {
+    FAST_MODEL: int(os.getenv('GROQ_FAST_SLO_MS', '800')),
+    BIG_MODEL: int(os.getenv('GROQ_SLO_MS', '4000')),
+}
+BUSY_CONFIDENCE = 0.5    # threshold while the big model is missing its SLO
+LATENCY_WINDOW = 50      # recent calls per model used for the p90...
+LATENCY_MAX_AGE = 300    # ...ignoring calls older than this (s), so a model that was shed gets retried
+FAST_TIMEOUT = SLO_MS[FAST_MODEL] * 3 / 1000
+
+Route = namedtuple('Route', 'model confidence reason')
+
+CRISIS_RE = re.compile(
+    r"suicid|kill (my ?self|me)|end (my|it all)|hurt (my ?self|me)|self[- ]harm|want to die|"
+    r"marna chahta|marna chahti|jeena nahi|no reason to live",
+    re.IGNORECASE,
+)
+ACK_RE = re.compile(
+    r"^(?:(?:ok(?:ay)?|k|thanks?(?: you)?|thank u|thx|ty|hmm+|sure|cool|nice|got it|"
+    r"theek hai|thik hai|acha|accha|achha|bye|good ?night|gn|shukriya|dhanyavad|dost)"
+    r"\b[\s,.!🙂😊👍🙏❤️]*)+$",
+    re.IGNORECASE,
+)
+QUESTION_END_RE = re.compile(r"\?[^\w?]*$")  # ends with '?', allowing trailing emoji/space
+HEAVY_CATEGORIES = {'Mental Health', 'Relationship'}
+HEAVY_EMOTIONS = {'sad', 'fear', 'angry', 'disgust'}  # canonical labels, see emotions.canonical_label
+
+_latencies = {model: deque(maxlen=LATENCY_WINDOW) for model in SLO_MS}
+_lock = threading.Lock()
+
+
+def _p90(model):
+    cutoff = time.monotonic() - LATENCY_MAX_AGE
+    with _lock:
+        window = sorted(ms for at, ms in _latencies[model] if at >= cutoff)
+    return window[int(len(window) * 0.9)] if len(window) >= 10 else None
+
+
+def _over_slo(model):
+    p90 = _p90(model)
+    return p90 is not None and p90 > SLO_MS[model]
+
+
+def _fast_confidence(message, category):
+    """How sure we are that the small model is good enough for this turn (0-1)."""
+    text = message.strip()
+    if ACK_RE.match(text):
+        return 0.95
+    words = len(text.split())
+    if words <= 4:
+        score = 0.85
+    elif words <= 12:
+        score = 0.7
+    elif words <= 30:
+        score = 0.45
+    else:
+        score = 0.15
+    if '?' in text:
+        score -= 0.2
+    if category in HEAVY_CATEGORIES:
+        score -= 0.1
+    return max(score, 0.0)
+
+
+def choose_model(message, category, turn, emotion=None, previous_reply=None):
+    """Pick the model for one turn.
+
+    `turn` is the number of earlier messages in the conversation and
+    `previous_reply` the assistant message right before this one, if any.
+    """
+    if not ROUTING_ENABLED or FAST_MODEL == BIG_MODEL:
+        route = Route(BIG_MODEL, 1.0, 'disabled')
+    elif CRISIS_RE.search(message):
+        route = Route(BIG_MODEL, 0.0, 'safety')
+    elif turn == 0:
+        route = Route(BIG_MODEL, 0.0, 'opening')
+    elif previous_reply and QUESTION_END_RE.search(previous_reply):
+        route = Route(BIG_MODEL, 0.0, 'answer')
+    elif (isinstance(emotion, str) and canonical_label(emotion) in HEAVY_EMOTIONS
+          and not ACK_RE.match(message.strip())):
+        route = Route(BIG_MODEL, 0.0, 'emotion')
+    else:
+        confidence = _fast_confidence(message, category)
+        threshold = BUSY_CONFIDENCE if _over_slo(BIG_MODEL) else MIN_CONFIDENCE
+        if confidence < threshold:
+            route = Route(BIG_MODEL, confidence, 'low-confidence')
+        elif _over_slo(FAST_MODEL):
+            route = Route(BIG_MODEL, confidence, 'fast-slo')
+        else:
+            route = Route(FAST_MODEL, confidence, 'fast')
+    inc('puresoul_model_routes_total', {'model': route.model, 'reason': route.reason})
+    return route
+
+
+def _record(model, start):
+    with _lock:
+        _latencies[model].append((time.monotonic(), (time.perf_counter() - start) * 1000))
+
+
+def _call(messages, model, **kwargs):
+    start = time.perf_counter()
+    try:
+        with timed_upstream('groq', 'chat_completion'):
+            completion = get_groq_client().chat.completions.create(messages=messages, model=model, **kwargs)
+    finally:  # timeouts count against the SLO too
+        _record(model, start)
+    return completion.choices[0].message.content if completion.choices else None
+
+
+def complete(messages, route):
+    """Run the chat completion for a route. Returns (text, model that answered, total latency in ms)."""
+    start = time.perf_counter()
+    if route.model != BIG_MODEL:
+        try:
+            text = _call(messages, route.model, timeout=FAST_TIMEOUT)
+            if text and text.strip():
+                return text, route.model, int((time.perf_counter() - start) * 1000)
+            inc('puresoul_model_fallbacks_total', {'model': route.model, 'cause': 'empty'})
+        except Exception as e:
+            inc('puresoul_model_fallbacks_total', {'model': route.model, 'cause': 'error'})
+            log.warning("Fast model %s failed, falling back to %s: %s", route.model, BIG_MODEL, e)
+    text = _call(messages, BIG_MODEL)
+    return text, BIG_MODEL, int((time.perf_counter() - start) * 1000)
+
+
+async def _stream(messages, model, on_delta, **kwargs):
+    """Stream one completion, awaiting on_delta(text) per chunk. Returns the full text."""
+    start = time.perf_counter()
+    parts = []
+    try:
+        with timed_upstream('groq', 'chat_completion_stream'):
+            stream = await get_async_groq_client().chat.completions.create(
+                messages=messages, model=model, stream=True, **kwargs)
+            async for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    parts.append(text)
+                    await on_delta(text)
+    finally:
+        _record(model, start)
+    return ''.join(parts)
+
+
+async def stream_complete(messages, route, on_delta):
+    """Streaming complete(): on_delta(text) is awaited for every chunk of the reply.
+
+    The fast model falls back to the big one only while nothing has been
+    streamed yet; a failure after the first chunk is raised.
+    """
+    start = time.perf_counter()
+    if route.model != BIG_MODEL:
+        held = []  # leading whitespace-only chunks, kept back while a fallback is still possible
+        started = False
+
+        async def forward(text):
+            nonlocal started
+            if not started and not text.strip():
+                held.append(text)
+                return
+            if not started:
+                started, text = True, ''.join(held) + text
+            await on_delta(text)
+
+        try:
+            text = await _stream(messages, route.model, forward, timeout=FAST_TIMEOUT)
+            if text.strip():
+                return text, route.model, int((time.perf_counter() - start) * 1000)
+            inc('puresoul_model_fallbacks_total', {'model': route.model, 'cause': 'empty'})
+        except Exception as e:
+            if started:
+                raise
+            inc('puresoul_model_fallbacks_total', {'model': route.model, 'cause': 'error'})
+            log.warning("Fast model %s failed, falling back to %s: %s", route.model, BIG_MODEL, e)
+    text = await _stream(messages, BIG_MODEL, on_delta)
+    return text, BIG_MODEL, int((time.perf_counter() - start) * 1000)
@@ -0,0 +1,170 @@
+# server/scheduler.py
+# Periodic background jobs with database leases.
+#
+# Jobs register with @job(name, every=..., lease=...). Any number of
+# processes may run the scheduler loop (gunicorn workers with
+# SCHEDULER_ENABLED=true, or a sidecar `flask --app app run-jobs`); a job
+# only runs where a conditional UPDATE on job_leases succeeds, so each run
+# happens on exactly one of them. Long jobs work in chunks and call
+# lease.renew() between chunks; a holder that dies simply lets its lease
+# expire.
+
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import update, or_
+from sqlalchemy.exc import IntegrityError
+from models import db, JobLease
+
+log = logging.getLogger('puresoul.scheduler')
+
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '30'))
+
+JOBS = {}
+_state = {'pid': None}
+_lock = threading.Lock()
+
+
+class LeaseLost(Exception):
+    """Raised by renew() when another process has taken the job over."""
+
+
+def job(name, every, lease=300):
+    """Register a periodic job. `every` and `lease` are in seconds."""
+    def decorator(f):
+        JOBS[name] = {'func': f, 'every': every, 'lease': lease}
+        return f
+    return decorator
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class Lease:
+    def __init__(self, name, owner, seconds):
+        self.name, self.owner, self.seconds = name, owner, seconds
+
+    def renew(self):
+        """Extend the lease; call between chunks of work."""
+        result = db.session.execute(
+            update(JobLease)
+            .where(JobLease.name == self.name, JobLease.owner == self.owner)
+            .values(lease_until=datetime.utcnow() + timedelta(seconds=self.seconds))
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            raise LeaseLost(self.name)
+
+
+def _ensure_row(name):
+    if db.session.get(JobLease, name) is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(JobLease(name=name))
+        except IntegrityError:
+            pass
+        db.session.commit()
+
+
+def acquire(name, every, seconds, force=False):
+    """Take the job's lease if it is free and the job is due. Returns a Lease or None."""
+    _ensure_row(name)
+    now = datetime.utcnow()
+    owner = _owner()
+    stmt = (
+        update(JobLease)
+        .where(JobLease.name == name, or_(JobLease.lease_until.is_(None), JobLease.lease_until < now))
+        .values(owner=owner, lease_until=now + timedelta(seconds=seconds), last_started_at=now)
+    )
+    if not force:
+        stmt = stmt.where(or_(JobLease.last_started_at.is_(None),
+                              JobLease.last_started_at <= now - timedelta(seconds=every)))
+    result = db.session.execute(stmt)
+    db.session.commit()
+    return Lease(name, owner, seconds) if result.rowcount == 1 else None
+
+
+def release(lease, status, result=None):
+    db.session.execute(
+        update(JobLease)
+        .where(JobLease.name == lease.name, JobLease.owner == lease.owner)
+        .values(owner=None, lease_until=None, last_finished_at=datetime.utcnow(),
+                last_status=status, last_result=None if result is None else str(result)[:255])
+    )
+    db.session.commit()
+
+
+def run_job(name, force=False):
+    """Run one job if this process wins its lease. Returns the job's result or None."""
+    spec = JOBS[name]
+    lease = acquire(name, spec['every'], spec['lease'], force=force)
+    if lease is None:
+        return None
+    try:
+        result = spec['func'](lease)
+    except LeaseLost:
+        db.session.rollback()
+        log.warning("Job %s: lease lost, stopping", name)
+        return None
+    except Exception as e:
+        db.session.rollback()
+        log.exception("Job %s error", name)
+        release(lease, 'error', e)
+        return None
+    release(lease, 'ok', result)
+    return result
+
+
+def run_pending():
+    for name in JOBS:
+        try:
+            run_job(name)
+        except Exception:  # lease table unreachable etc.; try again next poll
+            db.session.rollback()
+            log.exception("Scheduler error (%s)", name)
+
+
+def _loop(app):
+    while True:
+        with app.app_context():
+            run_pending()
+            db.session.remove()
+        time.sleep(POLL_SECONDS)
+
+
+def _ensure_thread(app):
+    if _state['pid'] != os.getpid():
+        with _lock:
+            if _state['pid'] != os.getpid():
+                _state['pid'] = os.getpid()
+                threading.Thread(target=_loop, args=(app,), daemon=True).start()
+
+
+def init_scheduler(app):
+    """Register the run-jobs CLI and, with SCHEDULER_ENABLED, an in-process loop per worker."""
+
+    @app.cli.command('run-jobs')
+    @click.argument('names', nargs=-1)
+    @click.option('--once', is_flag=True, help='Run the given (or all) jobs now and exit.')
+    def run_jobs(names, once):
+        """Run scheduled jobs (sidecar), or force jobs once with --once."""
+        if once:
+            for name in names or JOBS:
+                print(f"{name}: {run_job(name, force=True)}")
+            return
+        print(f"⏰ Scheduler running: {', '.join(JOBS)} (poll every {POLL_SECONDS:g}s)")
+        while True:
+            run_pending()
+            db.session.remove()
+            time.sleep(POLL_SECONDS)
+
+    if SCHEDULER_ENABLED:
+        @app.before_request
+        def _start_scheduler():
+            _ensure_thread(app)
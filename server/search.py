@@ -0,0 +1,284 @@
+# server/search.py
+# Per-user full-text search over therapy messages.
+#
+# Backed by an in-house inverted index (search_postings) rather than FTS5 /
+# FULLTEXT / tsvector: it behaves the same on SQLite, MySQL and PostgreSQL and
+# keeps working when message_text is stored compressed (see compression.py).
+# Every lookup is a range read on the (user_id, term) primary-key prefix, so a
+# query never touches therapy_messages except to fetch the page it returns.
+#
+# The full ranking of a query is kept in the host cache (cache.py) for
+# RANKING_TTL seconds under the user's namespace, so later pages read it
+# instead of rescanning the posting lists; any write that calls
+# invalidate_user drops it.
+
+import base64
+import hashlib
+import logging
+import math
+import queue
+import re
+import sqlite3
+import threading
+from collections import Counter
+from sqlalchemy.exc import IntegrityError
+import cache
+from fastjson import dumps, loads
+from models import db, SearchPosting, SearchStats, TherapyMessage, TherapySession
+
+log = logging.getLogger('puresoul.search')
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERM_LENGTH = 40
+MAX_QUERY_TERMS = 8
+SNIPPET_CHARS = 160
+K1 = 1.2
+POINT_LOOKUP_LIMIT = 500
+INDEX_BATCH_SIZE = 200
+RANKING_TTL = 300
+RANKING_CACHE_SIZE = 1000  # (score, id) pairs kept per query; deeper pages are re-ranked
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its me my of on or "
+    "so that the this to was we with you your".split()
+)
+
+_index_queue = queue.Queue(maxsize=10000)
+_index_lock = threading.Lock()
+_index_thread = None
+
+
+def tokenize(text):
+    """Lower-cased word tokens, minus stopwords and single characters."""
+    return [
+        t[:MAX_TERM_LENGTH] for t in TOKEN_RE.findall((text or '').lower())
+        if len(t) > 1 and t not in STOPWORDS
+    ]
+
+
+def _bump_doc_count(user_id, n=1):
+    stats = SearchStats.query.filter_by(user_id=user_id)
+    if stats.update({'doc_count': SearchStats.doc_count + n}, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(SearchStats(user_id=user_id, doc_count=n))
+    except IntegrityError:
+        stats.update({'doc_count': SearchStats.doc_count + n}, synchronize_session=False)
+
+
+def index_messages(items):
+    """Add postings for (user_id, message_id, text) items, in the caller's transaction.
+
+    Messages deleted since they were queued (see deletion.py) are skipped, so
+    they leave no orphan postings and do not count towards doc_count.
+    """
+    live = {m for (m,) in db.session.query(TherapyMessage.id).filter(
+        TherapyMessage.id.in_([message_id for _, message_id, _ in items])
+    )}
+    postings, per_user = [], Counter()
+    for user_id, message_id, text in items:
+        if message_id not in live:
+            continue
+        per_user[user_id] += 1
+        postings.extend(
+            {'user_id': user_id, 'term': term, 'message_id': message_id, 'tf': min(tf, 32767)}
+            for term, tf in Counter(tokenize(text)).items()
+        )
+    if postings:
+        db.session.execute(SearchPosting.__table__.insert(), postings)
+    for user_id, n in per_user.items():
+        _bump_doc_count(user_id, n)
+
+
+def _index_worker(app):
+    while True:
+        batch = [_index_queue.get()]
+        while len(batch) < INDEX_BATCH_SIZE:
+            try:
+                batch.append(_index_queue.get_nowait())
+            except queue.Empty:
+                break
+        with app.app_context():
+            try:
+                index_messages(batch)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                if len(batch) == 1:
+                    log.exception("Search index error")
+                else:
+                    log.warning("Search index batch failed, retrying %d items one at a time", len(batch))
+                    _index_one_by_one(batch)
+        for _ in batch:
+            _index_queue.task_done()
+
+
+def _index_one_by_one(batch):
+    """Index items in their own transactions, so one bad item loses only itself."""
+    for item in batch:
+        try:
+            index_messages([item])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            log.exception("Search index error for message %s", item[1])
+
+
+def enqueue_index(app, user_id, message_id, text):
+    """Index a committed message on the background indexer thread.
+
+    Falls back to indexing inline (and committing) if the queue is full, so
+    postings are never dropped.
+    """
+    global _index_thread
+    if _index_thread is None:
+        with _index_lock:
+            if _index_thread is None:
+                _index_thread = threading.Thread(target=_index_worker, args=(app,), daemon=True)
+                _index_thread.start()
+    try:
+        _index_queue.put_nowait((user_id, message_id, text))
+    except queue.Full:
+        index_messages([(user_id, message_id, text)])
+        db.session.commit()
+
+
+def wait_for_indexer():
+    """Block until every queued message has been indexed (scripts, benchmarks)."""
+    _index_queue.join()
+
+
+def encode_cursor(score, message_id):
+    return base64.urlsafe_b64encode(f"{score!r}:{message_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    score, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+    return float(score), int(message_id)
+
+
+def _snippet(text, terms):
+    """A window of text around the first match, with match offsets for highlighting."""
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(t) for t in terms) + r')\b', re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(0, first.start() - SNIPPET_CHARS // 3) if first else 0
+    window = text[start:start + SNIPPET_CHARS]
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if start + SNIPPET_CHARS < len(text) else ''
+    highlights = [[m.start() + len(prefix), m.end() + len(prefix)] for m in pattern.finditer(window)]
+    return prefix + window + suffix, highlights
+
+
+def _rank(user_id, terms):
+    """[(score, message_id)] of the user's messages containing every term, best first."""
+    # Document frequencies first (index-only count), so postings are read rarest term first.
+    df = dict(db.session.query(SearchPosting.term, db.func.count()).filter(
+        SearchPosting.user_id == user_id, SearchPosting.term.in_(terms)
+    ).group_by(SearchPosting.term).all())
+    if len(df) < len(terms):
+        return []
+
+    postings, candidates = {}, None
+    for term in sorted(terms, key=df.get):
+        query_rows = db.session.query(SearchPosting.message_id, SearchPosting.tf).filter(
+            SearchPosting.user_id == user_id, SearchPosting.term == term
+        )
+        if candidates is not None and len(candidates) <= POINT_LOOKUP_LIMIT:
+            # Few candidates left: primary-key point lookups instead of the term's full range.
+            query_rows = query_rows.filter(SearchPosting.message_id.in_(candidates))
+        postings[term] = dict(query_rows.all())
+        candidates = set(postings[term]) if candidates is None else candidates & set(postings[term])
+        if not candidates:
+            return []
+
+    n_docs = db.session.query(SearchStats.doc_count).filter_by(user_id=user_id).scalar() or len(candidates)
+    idf = {
+        term: math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+        for term in terms
+    }
+    return sorted(
+        ((round(sum(idf[t] * p[m] * (K1 + 1) / (p[m] + K1) for t, p in postings.items()), 6), m)
+         for m in candidates),
+        reverse=True,
+    )
+
+
+def _ranking_key(user_id, terms):
+    digest = hashlib.sha1(' '.join(sorted(terms)).encode()).hexdigest()
+    return f"user:{user_id}:search:{digest}"
+
+
+def _cached_ranking(key, after, limit):
+    """The cached ranking below the cursor, or None if it is missing or too short."""
+    try:
+        body = cache.get(key)
+    except sqlite3.Error as e:  # cache trouble never fails a search
+        log.warning("Cache error: %s", e)
+        return None
+    if body is None:
+        return None
+    stored = loads(body)
+    ranked = [r for r in map(tuple, stored['ranked']) if r < after]
+    if len(ranked) <= limit and not stored['complete']:
+        return None  # the page runs past the cached prefix
+    return ranked
+
+
+def search_messages(user_id, query, limit=20, cursor=None):
+    """Rank the user's messages containing every query term (BM25, no length norm).
+
+    Results are ordered by (score, message id) descending; `cursor` is the
+    opaque keyset token returned with the previous page. The first page
+    always ranks afresh; later pages use the ranking it cached.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return [], None
+
+    key = _ranking_key(user_id, terms)
+    after = decode_cursor(cursor) if cursor else None
+    ranked = _cached_ranking(key, after, limit) if after else None
+    if ranked is None:
+        ranked = _rank(user_id, terms)
+        try:
+            cache.put(key, dumps({
+                'ranked': ranked[:RANKING_CACHE_SIZE],
+                'complete': len(ranked) <= RANKING_CACHE_SIZE,
+            }), RANKING_TTL)
+        except sqlite3.Error as e:
+            log.warning("Cache error: %s", e)
+        if after:
+            ranked = [r for r in ranked if r < after]
+
+    page = ranked[:limit]
+    next_cursor = encode_cursor(*page[-1]) if len(ranked) > limit else None
+    if not page:
+        return [], None
+
+    rows = db.session.query(
+        TherapyMessage.id, TherapyMessage.session_id, TherapyMessage.sender,
+        TherapyMessage.message_text, TherapyMessage.created_at, TherapySession.session_title,
+    ).join(TherapySession, TherapySession.id == TherapyMessage.session_id).filter(
+        TherapyMessage.id.in_([m for _, m in page]),
+        TherapySession.user_id == user_id,
+    ).all()
+    by_id = {r[0]: r for r in rows}
+
+    results = []
+    for score, message_id in page:
+        r = by_id.get(message_id)
+        if r is None:
+            continue
+        snippet, highlights = _snippet(r[3], terms)
+        results.append({
+            'message_id': r[0],
+            'session_id': r[1],
+            'session_title': r[5],
+            'sender': r[2],
+            'created_at': r[4].isoformat() if r[4] else None,
+            'score': score,
+            'snippet': snippet,
+            'highlights': highlights,
+        })
+    return results, next_cursor
@@ -0,0 +1,178 @@
+# server/telemetry.py
+# Batched camera-emotion telemetry, downsampled into per-session buckets.
+#
+# The frontend detector produces several readings per second. Instead of
+# one write per reading it posts batches as parallel arrays:
+#
+#   {"session_id": 12,
+#    "t0": 1760000000000,          # epoch ms of the first reading
+#    "t":  [0, 200, 210, ...],     # ms since the previous reading (t[0] from t0)
+#    "e":  [2, 2, 1, ...],         # emotion codes, or indexes into "labels"
+#    "c":  [87, 90, 41, ...],      # confidence, percent 0-100
+#    "labels": ["neutral", "happy", ...]}   # optional
+#
+# Readings are counted per (bucket, emotion) in memory and merged into
+# emotion_buckets with a fixed number of statements per batch.
+
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_, bindparam, update
+from sqlalchemy.exc import IntegrityError
+from models import db, EmotionBucket
+from emotions import canonical_label, known_emotion_code, emotion_label
+
+TELEMETRY_BUCKET_SECONDS = int(os.getenv('TELEMETRY_BUCKET_SECONDS', '10'))
+MAX_READINGS = 5000
+MAX_AGE = timedelta(days=1)
+MAX_SKEW = timedelta(minutes=5)
+EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch_ms(dt):
+    return int((dt - EPOCH).total_seconds() * 1000)
+
+
+def parse_batch(data, now=None):
+    """Validate a batch. Returns [(epoch_ms, emotion_code, confidence)]; raises ValueError."""
+    now = now or datetime.utcnow()
+    try:
+        t0, deltas, emotions, confidences = int(data['t0']), data['t'], data['e'], data['c']
+    except (KeyError, TypeError, ValueError, OverflowError):  # OverflowError: t0 = Infinity
+        raise ValueError("Expected t0, t, e and c.")
+    if not (isinstance(deltas, list) and isinstance(emotions, list) and isinstance(confidences, list)):
+        raise ValueError("t, e and c must be arrays.")
+    if not (len(deltas) == len(emotions) == len(confidences)):
+        raise ValueError("t, e and c must have the same length.")
+    if len(deltas) > MAX_READINGS:
+        raise ValueError(f"At most {MAX_READINGS} readings per batch.")
+
+    labels = data.get('labels')
+    if labels is not None:
+        if not isinstance(labels, list) or not all(isinstance(x, str) and x for x in labels):
+            raise ValueError("labels must be an array of strings.")
+        codes = []
+        for x in labels:  # telemetry never registers labels; only known ones and their aliases
+            code = known_emotion_code(canonical_label(x))
+            if code is None:
+                raise ValueError(f"Unknown emotion label {x[:50]!r}.")
+            codes.append(code)
+    else:
+        codes = None
+
+    readings = []
+    ms = t0
+    for delta, emotion, confidence in zip(deltas, emotions, confidences):
+        if not isinstance(delta, int) or isinstance(delta, bool) or delta < 0:
+            raise ValueError("t must hold non-negative integer deltas.")
+        if not isinstance(emotion, int) or isinstance(emotion, bool):
+            raise ValueError("e must hold integers.")
+        if codes is not None:
+            if not 0 <= emotion < len(codes):
+                raise ValueError("e index out of range for labels.")
+            code = codes[emotion]
+        else:
+            if emotion_label(emotion) is None:
+                raise ValueError(f"Unknown emotion code {emotion}.")
+            code = emotion
+        if not isinstance(confidence, (int, float)) or not 0 <= confidence <= 100:
+            raise ValueError("c must hold percentages between 0 and 100.")
+        ms += delta
+        readings.append((ms, code, int(round(confidence))))
+
+    # Compared as integers: any t0 or delta is valid JSON, but not a valid datetime.
+    if readings and (t0 < _epoch_ms(now - MAX_AGE) or readings[-1][0] > _epoch_ms(now + MAX_SKEW)):
+        raise ValueError("Readings are too old or in the future.")
+    return readings
+
+
+def downsample(readings, bucket_seconds=TELEMETRY_BUCKET_SECONDS):
+    """{(bucket_start, code): [readings, confidence_sum]} for epoch-ms readings."""
+    width = bucket_seconds * 1000
+    buckets = defaultdict(lambda: [0, 0])
+    for ms, code, confidence in readings:
+        acc = buckets[(ms - ms % width, code)]
+        acc[0] += 1
+        acc[1] += confidence
+    return {
+        (datetime.utcfromtimestamp(start / 1000), code): acc
+        for (start, code), acc in buckets.items()
+    }
+
+
+def store_buckets(session_id, buckets):
+    """Merge downsampled counts into emotion_buckets in the caller's transaction.
+
+    One SELECT for the keys that already exist, one executemany UPDATE for
+    those and one bulk INSERT for the rest; a concurrent insert of the same
+    key falls back to per-key increments.
+    """
+    if not buckets:
+        return
+    table = EmotionBucket.__table__
+    keys = list(buckets)
+    existing = set(db.session.execute(
+        db.select(table.c.bucket_start, table.c.emotion_code).where(
+            table.c.session_id == session_id,
+            tuple_(table.c.bucket_start, table.c.emotion_code).in_(keys),
+        )
+    ).all())
+
+    increment = (
+        update(table)
+        .where(table.c.session_id == session_id,
+               table.c.bucket_start == bindparam('b_start'),
+               table.c.emotion_code == bindparam('b_code'))
+        .values(readings=table.c.readings + bindparam('b_readings'),
+                confidence_sum=table.c.confidence_sum + bindparam('b_confidence'))
+    )
+
+    def params(ks):
+        return [
+            {'b_start': s, 'b_code': c, 'b_readings': buckets[(s, c)][0], 'b_confidence': buckets[(s, c)][1]}
+            for s, c in ks
+        ]
+
+    if existing:
+        db.session.execute(increment, params(existing))
+    new = [k for k in keys if k not in existing]
+    if new:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert(), [
+                    {'session_id': session_id, 'bucket_start': s, 'emotion_code': c,
+                     'readings': buckets[(s, c)][0], 'confidence_sum': buckets[(s, c)][1]}
+                    for s, c in new
+                ])
+        except IntegrityError:  # another worker created some of these buckets first
+            for key in new:
+                if not db.session.execute(increment, params([key])).rowcount:
+                    with db.session.begin_nested():
+                        db.session.execute(table.insert(), {
+                            'session_id': session_id, 'bucket_start': key[0], 'emotion_code': key[1],
+                            'readings': buckets[key][0], 'confidence_sum': buckets[key][1],
+                        })
+
+
+def mood_timeline(session_id):
+    """Per-bucket emotion counts for a session, oldest first."""
+    rows = db.session.execute(
+        db.select(EmotionBucket.bucket_start, EmotionBucket.emotion_code,
+                  EmotionBucket.readings, EmotionBucket.confidence_sum)
+        .where(EmotionBucket.session_id == session_id)
+        .order_by(EmotionBucket.bucket_start)
+    ).all()
+
+    timeline = []
+    for start, code, readings, confidence_sum in rows:
+        if not timeline or timeline[-1]['t'] != start:
+            timeline.append({'t': start, 'counts': {}, 'readings': 0, '_conf': 0})
+        point = timeline[-1]
+        point['counts'][emotion_label(code).lower()] = readings
+        point['readings'] += readings
+        point['_conf'] += confidence_sum
+
+    for point in timeline:
+        point['dominant'] = max(point['counts'], key=point['counts'].get)
+        point['avg_confidence'] = round(point.pop('_conf') / point['readings'], 1)
+    return timeline
@@ -0,0 +1,175 @@
+# server/transcripts.py
+# Transcript rendering plus an immutable, pre-compressed store for ended
+# sessions.
+#
+# Once a session is ended its transcript never changes, so it is rendered
+# once (on end_session, or on first view for sessions closed in bulk),
+# compressed with gzip and brotli, and served straight from
+# session_transcripts with a strong ETag. Cache-Control is no-cache rather
+# than immutable: deleting the session or a late message must not be hidden
+# by a browser copy, and revalidation is answered from the stored ETag
+# without reading the body. Active sessions keep the live path.
+
+import hashlib
+import zlib
+from flask import Response, request
+from sqlalchemy.exc import IntegrityError
+from models import db, TherapyMessage, SessionTranscript
+from emotions import emotion_label
+from fastjson import dumps
+from metrics import inc
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Compressed inside end_session, so levels are picked for time: on a 40 KB
+# transcript gzip 9 / brotli 9 take ~2-3 ms (brotli 11: ~50 ms, 6% smaller);
+# on ~20 MB gzip 9 takes ~1.8 s and brotli 9 ~0.9 s, vs ~0.2 s / ~0.3 s for
+# the large-body levels below.
+GZIP_LEVEL = 9
+GZIP_LARGE_LEVEL = 4
+BROTLI_QUALITY = 9
+BROTLI_LARGE_QUALITY = 5
+LARGE_BYTES = 256 * 1024
+CACHE_CONTROL = 'private, no-cache'
+
+
+def session_dict(row):
+    """Session row (or TherapySession object) as a JSON-ready dict."""
+    return {
+        'id': row.id,
+        'user_id': row.user_id,
+        'session_title': row.session_title,
+        'started_at': row.started_at,
+        'ended_at': row.ended_at,
+        'is_active': row.is_active,
+    }
+
+
+def transcript_messages(session_id):
+    """Every message of a session, oldest first, as JSON-ready dicts."""
+    stmt = db.select(
+        TherapyMessage.id, TherapyMessage.sender, TherapyMessage.message_text,
+        TherapyMessage.emotion_code, TherapyMessage.created_at,
+    ).where(TherapyMessage.session_id == session_id).order_by(TherapyMessage.created_at.asc())
+    return [
+        {
+            'id': message_id,
+            'session_id': session_id,
+            'sender': sender,
+            'message_text': text,
+            'emotion_detected': emotion_label(code),
+            'created_at': created_at,
+        }
+        for message_id, sender, text, code, created_at in db.session.execute(stmt)
+    ]
+
+
+def transcript_payload(row):
+    return {'session': session_dict(row), 'messages': transcript_messages(row.id)}
+
+
+def _gzip(body):
+    level = GZIP_LEVEL if len(body) <= LARGE_BYTES else GZIP_LARGE_LEVEL
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def _brotli(body):
+    quality = BROTLI_QUALITY if len(body) <= LARGE_BYTES else BROTLI_LARGE_QUALITY
+    return brotli.compress(body, quality=quality)
+
+
+def store_transcript(row):
+    """Render and store the transcript of an ended session. Returns the stored row."""
+    body = dumps(transcript_payload(row))
+    entry = SessionTranscript(
+        session_id=row.id,
+        etag=hashlib.sha256(body).hexdigest(),
+        size=len(body),
+        body_gzip=_gzip(body),
+        body_br=_brotli(body) if brotli else None,
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(entry)
+    except IntegrityError:  # another worker rendered it first; content is identical
+        pass
+    db.session.commit()
+    return entry
+
+
+def invalidate_transcript(session_id):
+    """Drop a stored transcript (its ended session was re-opened by a new message)."""
+    SessionTranscript.query.filter_by(session_id=session_id).delete()
+
+
+def _negotiate():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality('br') > 0:
+        return 'br'
+    if accepted.quality('gzip') > 0:
+        return 'gzip'
+    return 'identity'
+
+
+def _finish(response, tag):
+    response.set_etag(tag)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.vary.update(('Accept-Encoding', 'Authorization'))
+    return response
+
+
+def _tag(etag, encoding):
+    # Strong validators must differ per representation.
+    return etag if encoding == 'identity' else f"{etag}-{encoding}"
+
+
+def serve_transcript(row):
+    """Response for an ended session's transcript, rendering it on first view."""
+    encoding = _negotiate()
+    if request.if_none_match:
+        stored = db.session.execute(
+            db.select(SessionTranscript.etag, SessionTranscript.body_br.is_(None))
+            .where(SessionTranscript.session_id == row.id)
+        ).first()
+        if stored is not None:
+            etag, no_br = stored
+            tag = _tag(etag, 'gzip' if encoding == 'br' and no_br else encoding)
+            if request.if_none_match.contains(tag):
+                inc('puresoul_transcript_views_total', {'result': 'not_modified', 'encoding': encoding})
+                return _finish(Response(status=304), tag)
+
+    column = SessionTranscript.body_br if encoding == 'br' else SessionTranscript.body_gzip
+    cached = db.session.execute(
+        db.select(SessionTranscript.etag, column).where(SessionTranscript.session_id == row.id)
+    ).first()
+    if cached is not None and cached[1] is None:  # stored before brotli was installed
+        encoding = 'gzip'
+        cached = db.session.execute(
+            db.select(SessionTranscript.etag, SessionTranscript.body_gzip)
+            .where(SessionTranscript.session_id == row.id)
+        ).first()
+
+    if cached is None:
+        entry = store_transcript(row)
+        etag, body = entry.etag, entry.body_br if encoding == 'br' else entry.body_gzip
+        result = 'miss'
+    else:
+        etag, body = cached
+        result = 'hit'
+
+    tag = _tag(etag, encoding)
+    inc('puresoul_transcript_views_total', {'result': result, 'encoding': encoding})
+
+    if request.if_none_match.contains(tag):
+        response = Response(status=304)
+    else:
+        if encoding == 'identity':
+            body = zlib.decompress(body, 31)
+        response = Response(body, mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    return _finish(response, tag)
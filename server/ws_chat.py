@@ -0,0 +1,338 @@
+# server/ws_chat.py
+# Persistent WebSocket chat channel: one connection per therapy session.
+# Usage: python ws_chat.py        # listens on WS_PORT, next to the gunicorn API
+#
+# Over HTTP every turn is a POST to /api/get-response that decodes the JWT,
+# loads the user and checks credits, plus a POST /api/credits/use and
+# GET /api/credits from the client. Here the token is checked once, on the
+# first frame, and the user, tier, session and conversation stay on the
+# connection. Replies are streamed down as they are generated (Groq's
+# asyncio client, so a waiting turn holds no thread), each turn takes its
+# credit server-side and the new balance is pushed. One loop-wide task
+# re-reads the balance of every connected user with a single IN query per
+# chunk, so credits bought over HTTP reach open sockets without the
+# clients polling.
+#
+# Protocol, JSON text frames:
+#   -> {"type": "auth", "token": "<access token>", "session_id": 12, "category": "Career & Jobs",
+#       "conversation_id": "..."}   # free tier, optional: resume the short-term memory (conversations.py)
+#   <- {"type": "ready", "session_id": 12, "is_pro": false, "credits": 9, "total_credits_purchased": 0,
+#       "conversation_id": "..."}
+#   -> {"type": "message", "id": "c1", "text": "...", "emotion": "sad"}
+#   <- {"type": "credits", "credits": 8, "total_credits_purchased": 0}
+#   <- {"type": "delta", "id": "c1", "text": "..."}              # repeated
+#   <- {"type": "done", "id": "c1", "text": "<full reply>", "model": "...", "conversation_id": "..."}
+#   <- {"type": "error", "id": "c1", "code": "insufficient_credits" | "rate_limited" | "bad_request"
+#       | "upstream" | "server", "message": "..."}                 # the connection stays open
+# A failed auth closes the connection with code 4401 (token) or 4404 (session).
+# An open connection is closed with 4401 when its access token expires or the
+# account is deleted; the client reconnects with a fresh token.
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import jwt
+from sqlalchemy import select, update
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+from app import app, SYSTEM_PROMPTS, _save_message, _load_session_history
+from auth_tokens import JWT_SECRET
+from cache import invalidate_user
+from conversations import FREE_HISTORY_LIMIT, recall, remember
+from jobs import SESSION_IDLE_MINUTES
+from memory import retrieve_memories, format_memories
+from metrics import inc, flush
+from models import db, User, TherapySession
+from ratelimit import RATELIMIT_ENABLED, RATELIMIT_TRUST_PROXY, check
+from routing import choose_model, stream_complete
+
+log = logging.getLogger('puresoul.ws_chat')
+
+WS_HOST = os.getenv('WS_HOST', '0.0.0.0')
+WS_PORT = int(os.getenv('WS_PORT', '8765'))
+WS_DB_THREADS = int(os.getenv('WS_DB_THREADS', '16'))
+WS_AUTH_TIMEOUT = float(os.getenv('WS_AUTH_TIMEOUT', '10'))
+WS_CREDITS_REFRESH_SECONDS = float(os.getenv('WS_CREDITS_REFRESH_SECONDS', '15'))
+MAX_FRAME = 64 * 1024
+HISTORY_LIMIT = 30  # same depth as the Pro path of /api/get-response
+IN_CHUNK = 1000
+
+_executor = ThreadPoolExecutor(WS_DB_THREADS, thread_name_prefix='ws-db')
+_connections = {}  # user_id -> set of Connection
+
+
+class AuthFailed(Exception):
+    def __init__(self, code, reason):
+        super().__init__(reason)
+        self.code, self.reason = code, reason
+
+
+async def _db(fn, *args):
+    """Run blocking database work on the pool, inside an app context."""
+    def run():
+        with app.app_context():
+            return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(_executor, run)
+
+
+# ── Blocking helpers (run through _db) ──
+
+def _authenticate(token, session_id):
+    try:
+        data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+    except Exception:
+        raise AuthFailed(4401, 'Token is invalid!')
+    user = db.session.execute(
+        select(User.id, User.is_pro, User.credits, User.total_credits_purchased).where(User.id == data.get('id'))
+    ).one_or_none()
+    if user is None:
+        raise AuthFailed(4401, 'User not found!')
+    history = []
+    if session_id is not None:
+        owned = db.session.execute(
+            select(TherapySession.id).where(TherapySession.id == session_id, TherapySession.user_id == user.id)
+        ).scalar()
+        if owned is None:
+            raise AuthFailed(4404, 'Session not found.')
+        if user.is_pro:
+            history = [('user' if m.sender == 'user' else 'assistant', m.message_text)
+                       for m in _load_session_history(session_id, limit=HISTORY_LIMIT)]
+    return user, history, data.get('exp')
+
+
+def _begin_turn(user_id, ip, is_pro, text, session_id):
+    """Rate limit, take one credit and (Pro) fetch memories. Returns (error code, balance row, memories)."""
+    if RATELIMIT_ENABLED:
+        try:
+            if check('get-response', user_id, ip=ip):
+                return 'rate_limited', None, None
+        except Exception as e:
+            log.warning("Rate limiter error (failing open): %s", e)
+    taken = db.session.execute(
+        update(User).where(User.id == user_id, User.credits > 0).values(credits=User.credits - 1)
+    ).rowcount
+    balance = tuple(db.session.execute(
+        select(User.credits, User.total_credits_purchased).where(User.id == user_id)
+    ).one())
+    db.session.commit()
+    if not taken:
+        return 'insufficient_credits', balance, None
+    invalidate_user(user_id)
+    memories = None
+    if is_pro and session_id:
+        try:
+            memories = retrieve_memories(user_id, text, exclude_session_id=session_id)
+        except Exception:
+            db.session.rollback()
+            log.exception("Memory retrieval error")
+    return None, balance, memories
+
+
+def _refund_credit(user_id):
+    db.session.execute(update(User).where(User.id == user_id).values(credits=User.credits + 1))
+    db.session.commit()
+    invalidate_user(user_id)
+
+
+def _save_turn(session_id, user_id, user_text, emotion, reply, model, latency_ms, reopen):
+    _save_message(session_id, 'user', user_text, emotion=emotion, user_id=user_id, reopen=reopen)
+    _save_message(session_id, 'ai', reply, user_id=user_id, model=model, latency_ms=latency_ms)
+
+
+def _balances(user_ids):
+    rows = {}
+    for i in range(0, len(user_ids), IN_CHUNK):
+        rows.update((r.id, (r.credits, r.total_credits_purchased)) for r in db.session.execute(
+            select(User.id, User.credits, User.total_credits_purchased).where(User.id.in_(user_ids[i:i + IN_CHUNK]))
+        ))
+    return rows
+
+
+# ── Connection ──
+
+class Connection:
+    def __init__(self, ws, user, session_id, category, history, conversation_id):
+        self.ws = ws
+        self.user_id, self.is_pro = user.id, user.is_pro
+        self.session_id, self.conversation_id = session_id, conversation_id
+        self.system_prompt = SYSTEM_PROMPTS.get(category, SYSTEM_PROMPTS["Mental Health"])
+        self.category = category if category in SYSTEM_PROMPTS else "Mental Health"
+        self.history = deque(history, maxlen=HISTORY_LIMIT if self.is_pro else FREE_HISTORY_LIMIT)
+        self.balance = (user.credits, user.total_credits_purchased)
+        self.saved_at = None  # monotonic time of the last turn saved to the session
+        headers = ws.request.headers
+        forwarded = headers.get('X-Forwarded-For') if RATELIMIT_TRUST_PROXY else None
+        self.ip = forwarded.split(',')[0].strip() if forwarded else ws.remote_address[0]
+
+    async def send(self, **frame):
+        await self.ws.send(json.dumps(frame, ensure_ascii=False))
+
+    async def push_balance(self, balance):
+        self.balance = balance
+        await self.send(type='credits', credits=balance[0], total_credits_purchased=balance[1])
+
+    async def turn(self, frame):
+        msg_id, text, emotion = frame.get('id'), frame.get('text'), frame.get('emotion')
+        if not isinstance(text, str) or not text.strip():
+            await self.send(type='error', id=msg_id, code='bad_request', message='text is required.')
+            return
+        error, balance, memories = await _db(_begin_turn, self.user_id, self.ip, self.is_pro, text, self.session_id)
+        if balance is not None and balance != self.balance:
+            await self.push_balance(balance)
+        if error == 'rate_limited':
+            await self.send(type='error', id=msg_id, code=error, message='Too many requests. Please slow down.')
+            return
+        if error == 'insufficient_credits':
+            await self.send(type='error', id=msg_id, code=error, message='Your credits are used up 💛')
+            return
+
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if memories:
+            messages.append({"role": "system", "content": format_memories(memories)})
+        messages.extend({"role": role, "content": content} for role, content in self.history)
+        messages.append({"role": "user", "content": text})
+
+        previous_reply = self.history[-1][1] if self.history and self.history[-1][0] == 'assistant' else None
+        route = choose_model(text, self.category, len(self.history), emotion=emotion, previous_reply=previous_reply)
+        try:
+            reply, model, latency_ms = await stream_complete(
+                messages, route, lambda delta: self.send(type='delta', id=msg_id, text=delta))
+        except ConnectionClosed:
+            inc('puresoul_ws_turns_total', {'result': 'client_closed'})
+            await _db(_refund_credit, self.user_id)  # the reply never reached the client
+            raise
+        except Exception:
+            log.exception("Error streaming from Groq API")
+            inc('puresoul_ws_turns_total', {'result': 'upstream_error'})
+            await _db(_refund_credit, self.user_id)
+            self.balance = (self.balance[0] + 1, self.balance[1])
+            await self.send(type='error', id=msg_id, code='upstream', message='Failed to get a response from the AI.')
+            await self.push_balance(self.balance)
+            return
+        reply = reply or "I'm here to listen. Could you tell me more?"
+        self.history.append(('user', text))
+        self.history.append(('assistant', reply))
+        if not self.is_pro:
+            self.conversation_id = await _db(remember, self.conversation_id, self.user_id,
+                                             [('user' if r == 'user' else 'ai', t) for r, t in self.history])
+        await self.send(type='done', id=msg_id, text=reply, model=model, conversation_id=self.conversation_id)
+        inc('puresoul_ws_turns_total', {'result': 'ok'})
+
+        if self.session_id:
+            # First turn, or idle long enough for the reaper to have ended the session meanwhile.
+            reopen = self.saved_at is None or time.monotonic() - self.saved_at > SESSION_IDLE_MINUTES * 60
+            await _db(_save_turn, self.session_id, self.user_id, text, emotion, reply, model, latency_ms, reopen)
+            self.saved_at = time.monotonic()
+
+
+async def _handshake(ws):
+    try:
+        frame = json.loads(await asyncio.wait_for(ws.recv(), WS_AUTH_TIMEOUT))
+    except (asyncio.TimeoutError, ValueError):
+        raise AuthFailed(4401, 'Token is missing!')
+    if not isinstance(frame, dict) or frame.get('type') != 'auth' or not isinstance(frame.get('token'), str):
+        raise AuthFailed(4401, 'Token is missing!')
+    session_id = frame.get('session_id')
+    if session_id is not None and not isinstance(session_id, int):
+        raise AuthFailed(4404, 'Session not found.')
+    user, history, expires = await _db(_authenticate, frame['token'], session_id)
+    conversation_id = None
+    if not user.is_pro:
+        remembered = await _db(recall, frame.get('conversation_id'), user.id)
+        if remembered is not None:
+            conversation_id = frame['conversation_id']
+            history = [('user' if sender == 'user' else 'assistant', text) for sender, text in remembered]
+    return Connection(ws, user, session_id, frame.get('category'), history, conversation_id), expires
+
+
+async def _close_at(ws, expires):
+    """Close the connection when its access token expires (exp, epoch seconds)."""
+    await asyncio.sleep(max(0, expires - time.time()))
+    await ws.close(4401, 'Token expired.')
+
+
+async def handle(ws):
+    try:
+        conn, expires = await _handshake(ws)
+    except AuthFailed as e:
+        await ws.close(e.code, e.reason)
+        return
+    except ConnectionClosed:
+        return
+    except Exception:
+        log.exception("WebSocket auth error")
+        await ws.close(1011, 'Server error during login.')
+        return
+
+    _connections.setdefault(conn.user_id, set()).add(conn)
+    inc('puresoul_ws_connections_total', {})
+    expiry = asyncio.create_task(_close_at(ws, expires)) if expires else None
+    try:
+        await conn.send(type='ready', session_id=conn.session_id, is_pro=conn.is_pro,
+                        credits=conn.balance[0], total_credits_purchased=conn.balance[1],
+                        conversation_id=conn.conversation_id)
+        async for raw in ws:
+            try:
+                frame = json.loads(raw)
+            except ValueError:
+                frame = None
+            if not isinstance(frame, dict) or frame.get('type') != 'message':
+                await conn.send(type='error', code='bad_request', message='Expected a message frame.')
+                continue
+            try:
+                await conn.turn(frame)
+            except ConnectionClosed:
+                raise
+            except Exception:
+                log.exception("WebSocket turn error")
+                inc('puresoul_ws_turns_total', {'result': 'server_error'})
+                await conn.send(type='error', id=frame.get('id'), code='server', message='Server error.')
+    except ConnectionClosed:
+        pass
+    finally:
+        if expiry is not None:
+            expiry.cancel()
+        peers = _connections.get(conn.user_id)
+        peers.discard(conn)
+        if not peers:
+            del _connections[conn.user_id]
+
+
+async def refresh_credits():
+    """Push balances changed outside this connection (purchases, other devices) to open sockets,
+    and close the sockets of deleted accounts."""
+    while True:
+        await asyncio.sleep(WS_CREDITS_REFRESH_SECONDS)
+        try:
+            user_ids = list(_connections)
+            balances = await _db(_balances, user_ids)
+            sends = [conn.push_balance(balances[user_id])
+                     for user_id, peers in list(_connections.items()) if user_id in balances
+                     for conn in list(peers) if conn.balance != balances[user_id]]
+            sends += [conn.ws.close(4401, 'User not found!')  # account deleted since login
+                      for user_id in user_ids if user_id not in balances
+                      for conn in list(_connections.get(user_id, ()))]
+            await asyncio.gather(*sends, return_exceptions=True)
+            flush()  # this process's counters into the /metrics snapshots
+        except Exception:
+            log.exception("Credit refresh error")
+
+
+async def main():
+    refresher = asyncio.create_task(refresh_credits())
+    # compression off: replies are short and a deflate context per connection costs far more memory
+    async with serve(handle, WS_HOST, WS_PORT, max_size=MAX_FRAME, max_queue=8, compression=None) as server:
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, server.close)
+        log.info("PureSoul WebSocket chat listening on %s:%s", WS_HOST, WS_PORT)
+        await server.wait_closed()
+    refresher.cancel()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())